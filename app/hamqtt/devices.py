@@ -2,6 +2,8 @@
 
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
+
 from . import entities
 
 ONLINE = b'online'
@@ -22,6 +24,28 @@ def _get_power(dicts, name):
     return _get_item_value(dicts, 'location', name, 'realPowerW')
 
 
+def _index_signals(components) -> dict:
+    """Index the signals of a list of vitals components by name, the last one found winning"""
+    return {signal['name']: signal
+            for component in components
+            for signal in component['signals']}
+
+
+def _fill_state(plan, payload, keep_none) -> dict:
+    """Fills a state payload dictionary from a plan compiled by Device.compile_state()"""
+    for key, entity, nested in plan:
+        if nested is None:
+            # Read directly, as this runs for every entity on every poll
+            value = entity.value
+            if keep_none or value is not None:
+                payload[key] = value
+        else:
+            values = _fill_state(nested, {}, False)
+            if values:
+                payload[key] = values
+    return payload
+
+
 class Device:
     """Base class for Devices"""
     def __init__(self, name: str, device_id: str, parent: str = None) -> None:
@@ -29,6 +53,12 @@ class Device:
         self.device_id = device_id
         self.via = parent
         self._updated = False
+        self._published_updated = None
+        # Age of the data last used to update the device, when it was stale
+        self._stale_age = None
+        self._published_stale_age = None
+        self._plan = None
+        self._entities = None
 
 
     def get_discovery(self, prefix: str, will_topic: str) -> dict:
@@ -58,39 +88,89 @@ class Device:
         return msg
 
 
-    def recurse(self, item):
-        """Recursively build a nested dictionary matching the structure of the device"""
-        if issubclass(type(item), entities.Entity):
-            return item.get()
-        if issubclass(type(item), dict):
-            values = {}
-            for i in item.keys():
-                value = self.recurse(item[i])
-                if value is not None:
-                    values[i] = value
-            if len(values):
-                return values
-        return None
+    def get_fingerprint(self) -> tuple:
+        """
+        Gets the device metadata used in discovery messages, so changes can be
+        detected without building the messages.  Entities are fixed once the
+        device is constructed, so only need to be covered by subclasses that
+        add or remove devices.
+        Returns:
+            tuple: The metadata, comparable with an earlier fingerprint
+        """
+        return (self.device_id, self.name, self.via)
+
+
+    def compile_state(self, item=None) -> tuple:
+        """
+        Compiles the plan get_state() uses to build the state payload, so the
+        attributes of the device aren't searched on every poll.  It is compiled
+        on first use, so attributes holding entities must not be added or
+        replaced after the device is constructed.
+        Parameters:
+            item (dict): A nested dictionary to compile, default None for the
+                         device itself
+        Returns:
+            tuple: (key, entity, nested plan) entries in payload order, with
+                   nested dictionaries that hold no entities left out
+        """
+        plan = []
+        for name, value in (vars(self) if item is None else item).items():
+            if issubclass(type(value), entities.ValueEntity):
+                plan.append((name, value, None))
+            elif issubclass(type(value), dict):
+                nested = self.compile_state(value)
+                if nested:
+                    plan.append((name, None, nested))
+        return tuple(plan)
 
 
     def get_state(self, prefix: str) -> dict:
         """Generates an MQTT state message to send to HA"""
+        if self._plan is None:
+            self._plan = self.compile_state()
         msg = {}
         msg['topic'] = f"{prefix}/device/{self.device_id}/state"
-        msg['payload'] = {}
-        msg['payload']['mqtt_availability'] = "offline"
-        if self._updated:
-            msg['payload']['mqtt_availability'] = "online"
-        for name, value in vars(self).items():
-            if issubclass(type(value), entities.ValueEntity):
-                msg['payload'][name] = value.get()
-            elif issubclass(type(value), dict):
-                value = self.recurse(value)
-                if value is not None:
-                    msg['payload'][name] = value
+        payload = {'mqtt_availability': "online" if self._updated else "offline"}
+        if self._stale_age is not None:
+            payload['stale_age'] = self._stale_age
+        msg['payload'] = _fill_state(self._plan, payload, True)
         return msg
 
 
+    def get_value_entities(self) -> tuple:
+        """Gets all value entities of the device, including those in nested dictionaries"""
+        if self._entities is None:
+            if self._plan is None:
+                self._plan = self.compile_state()
+            found = []
+            stack = [self._plan]
+            while stack:
+                for _, entity, nested in stack.pop():
+                    if nested is None:
+                        found.append(entity)
+                    else:
+                        stack.append(nested)
+            self._entities = tuple(found)
+        return self._entities
+
+
+    def has_changed(self) -> bool:
+        """Checks if the state has changed since it was last published"""
+        if self._updated != self._published_updated:
+            return True
+        if self._stale_age != self._published_stale_age:
+            return True
+        return any(value.changed() for value in self.get_value_entities())
+
+
+    def set_published(self) -> None:
+        """Records the current state as published"""
+        self._published_updated = self._updated
+        self._published_stale_age = self._stale_age
+        for value in self.get_value_entities():
+            value.set_published()
+
+
     def get_updated(self) -> bool:
         """Getter method for updated marker"""
         return self._updated
@@ -106,8 +186,18 @@ class Device:
         self._updated = updated
 
 
+    def set_stale_age(self, age: float) -> None:
+        """Setter method for the age of stale data the device was updated from, or None"""
+        self._stale_age = None if age is None else round(age)
+
+
 class PowerWall3(Device):
     """A class that maps a Powerwall 3 system component to an HA device"""
+
+    # The pch signals read by update() for each PV string
+    STRING_SIGNALS = {i: (f'PCH_PvState_{i}', f'PCH_PvVoltage{i}', f'PCH_PvCurrent{i}')
+                      for i in 'ABCDEF'}
+
     def __init__(self, parent, vin, tedapi) -> None:
         self.tedapi = tedapi
 
@@ -152,38 +242,37 @@ class PowerWall3(Device):
                 enabled = False)
 
 
-    def update(self) -> None:
-        """Updates the name and values for all components using data from the PW"""
-        self.set_updated(False)
-        config = self.tedapi.get_config()
-        logger.debug("config = %r", config)
-
+    def update_config(self, config: dict) -> None:
+        """Updates the name using the system config from get_config()"""
         self.set_name(f"{config['site_info']['site_name']} {self.vin.split('--')[1]}")
 
+
+    def update(self) -> None:
+        """Updates the values for all components using the vitals from the PW"""
+        self.set_updated(False)
         data = self.tedapi.get_pw_vitals(self.vin)
         logger.debug("vitals = %r", data)
+        self.set_stale_age(self.tedapi.get_stale_age(f"get_pw_vitals({self.vin})"))
 
-        for signal in data['components']['bms'][0]['signals']:
-            match signal['name']:
-                case "BMS_nominalEnergyRemaining":
-                    self.battery_remaining.set(int(signal['value'] * 1000))
-                case "BMS_nominalFullPackEnergy":
-                    self.battery_capacity.set(int(signal['value'] * 1000))
+        bms = _index_signals([data['components']['bms'][0]])
+        if (signal := bms.get('BMS_nominalEnergyRemaining')) is not None:
+            self.battery_remaining.set(int(signal['value'] * 1000))
+        if (signal := bms.get('BMS_nominalFullPackEnergy')) is not None:
+            self.battery_capacity.set(int(signal['value'] * 1000))
 
+        pch = _index_signals(data['components']['pch'])
         for i, item in self.strings.items():
+            state, voltage, current = self.STRING_SIGNALS[i]
             pv_voltage = 0
             pv_current = 0
-            for component in data['components']['pch']:
-                signals = component['signals']
-                for signal in signals:
-                    if signal['name'] == f'PCH_PvState_{i}':
-                        item['mode'].set(signal['textValue'])
-                    elif signal['name'] == f'PCH_PvVoltage{i}':
-                        pv_voltage = round(max(signal['value'], 0), 2)
-                        item['voltage'].set(pv_voltage)
-                    elif signal['name'] == f'PCH_PvCurrent{i}':
-                        pv_current = round(max(signal['value'], 0), 2)
-                        item['current'].set(pv_current)
+            if (signal := pch.get(state)) is not None:
+                item['mode'].set(signal['textValue'])
+            if (signal := pch.get(voltage)) is not None:
+                pv_voltage = round(max(signal['value'], 0), 2)
+                item['voltage'].set(pv_voltage)
+            if (signal := pch.get(current)) is not None:
+                pv_current = round(max(signal['value'], 0), 2)
+                item['current'].set(pv_current)
             # Calculate power
             pv_power = pv_voltage * pv_current
             item['power'].set(round(pv_power, 2))
@@ -203,29 +292,49 @@ class PowerWall3(Device):
         return msg
 
 
+    def get_fingerprint(self) -> tuple:
+        """Gets the device metadata used in discovery messages, see Device.get_fingerprint()"""
+        return super().get_fingerprint() + (self.vin,)
+
+
 
 class TeslaSystem(Device):
     """A class that maps a Powerwall 3 based Tesla Energy system to an HA device"""
     # pylint: disable=R0902
-    def __init__(self, tedapi, report_vitals=True) -> None:
+
+    # The data sources update() can refresh, each fetched with its own call
+    SOURCES = ('status', 'vitals', 'config', 'firmware')
+
+    # The get_status() fields read by update()
+    STATUS_FIELDS = (
+        'control.alerts.active',
+        'control.meterAggregates',
+        'control.systemStatus',
+        'esCan.bus.ISLANDER.ISLAND_GridConnection'
+    )
+
+    def __init__(self, tedapi, report_vitals=True, max_inflight=1) -> None:
         firmware = tedapi.get_firmware_version(details=True)
         logger.debug("firmware = %r", firmware)
 
         config = tedapi.get_config()
         logger.debug("config = %r", config)
 
-        status = tedapi.get_status()
-        logger.debug("status = %r", status)
-
         device_id = f"TeslaEnergySystem_{config['vin']}"
         super().__init__(name=config['site_info']['site_name'], device_id=device_id)
 
         self.tedapi = tedapi
         self.report_vitals = report_vitals
+        # Fetches the vitals of up to max_inflight Powerwalls at once
+        self._executor = None
+        if max_inflight > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_inflight, thread_name_prefix='vitals')
         self.serial = firmware['gateway']['serialNumber']
         self.part_number = firmware['gateway']['partNumber']
         self.firmware_version = firmware['version']['text']
         self.vin = config['vin']
+        self._nominal_energy = int(config['site_info']['nominal_system_energy_ac'])
 
         # Home Assistant sensors
         self.backfeed_limited = entities.ValueEntity(device_id,
@@ -305,26 +414,81 @@ class TeslaSystem(Device):
         return int(round(self.battery_remaining.get() * 3600 / self.load_power.get(), 0))
 
 
-    def update(self) -> None:
-        """Updates the name and values for all components using data from the PWs"""
+    def update(self, sources=SOURCES) -> None:
+        """
+        Updates the name and values for the components using data from the PWs
+        Parameters:
+            sources (iterable): The data sources to refresh, from SOURCES,
+                                default all of them.  Components mapped from
+                                other sources keep their values.
+        """
+        if 'status' in sources:
+            self.set_updated(False)
+            # Fetched first, as it carries the grid power and grid state
+            status = self.tedapi.get_status()
+
+        if 'firmware' in sources:
+            firmware = self.tedapi.get_firmware_version(details=True)
+            self.serial = firmware['gateway']['serialNumber']
+            self.part_number = firmware['gateway']['partNumber']
+            self.firmware_version = firmware['version']['text']
+
+        if 'config' in sources:
+            self._update_config(self.tedapi.get_config())
+
+        if 'status' in sources:
+            self._update_status(status)
+            self.set_stale_age(self.tedapi.get_stale_age('get_status'))
+            self.set_updated(True)
+
+        if self.report_vitals and 'vitals' in sources:
+            if self._executor is None or len(self.powerwalls) < 2:
+                for item in self.powerwalls.values():
+                    self._update_powerwall(item)
+            else:
+                # Waits for every Powerwall, each catching its own errors
+                list(self._executor.map(self._update_powerwall, self.powerwalls.values()))
+
+
+    def close(self) -> None:
+        """Stops the threads fetching vitals, letting any running fetches finish"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+    def set_offline(self) -> None:
+        """Marks the system and its Powerwalls as not updated, so HA shows them unavailable"""
         self.set_updated(False)
+        for item in self.powerwalls.values():
+            item.set_updated(False)
 
-        firmware = self.tedapi.get_firmware_version(details=True)
-        config = self.tedapi.get_config()
-        status = self.tedapi.get_status()
 
-        self.serial = firmware['gateway']['serialNumber']
-        self.part_number = firmware['gateway']['partNumber']
-        self.firmware_version = firmware['version']['text']
+    def _update_powerwall(self, item) -> None:
+        """Updates a Powerwall from its vitals, logging rather than raising errors"""
+        try:
+            item.update()
+        # Catch everything, as we don't want to bailout from here
+        except Exception as e: # pylint: disable=W0718
+            logger.warning(
+                "Failed to update Powerwall %s, level metrics: %s",
+                item.vin,
+                e)
 
-        # Map config
+
+    def _update_config(self, config: dict) -> None:
+        """Maps the system config from get_config() to the components"""
         site = config['site_info']
         self.set_name(site['site_name'])
         self.commission_date.set(site['battery_commission_date'])
         self.inverter_capacity.set(site['nominal_system_power_ac'] * 1000)
         self.battery_reserve_user.set(int(site['backup_reserve_percent'] * 100 / 105))
+        self._nominal_energy = int(site['nominal_system_energy_ac'])
+        for item in self.powerwalls.values():
+            item.update_config(config)
 
-        # Map status
+
+    def _update_status(self, status: dict) -> None:
+        """Maps the system status from get_status() to the components"""
         self.grid_status.set("OFF")
 
         conn = status['esCan']['bus']['ISLANDER']['ISLAND_GridConnection']
@@ -356,20 +520,8 @@ class TeslaSystem(Device):
 
         # Based on Issue #22, it looks like this could detect if some of the batteries
         # are offline
-        nominal = int(config['site_info']['nominal_system_energy_ac'])
-        self.battery_missing.set(abs(int((full_pack - reserve)/1000) - nominal) > 1)
-
-        self.set_updated(True)
-        if self.report_vitals:
-            for item in self.powerwalls.values():
-                try:
-                    item.update()
-                # Catch everything, as we don't want to bailout from here
-                except Exception as e: # pylint: disable=W0718
-                    logger.warning(
-                        "Failed to update Powerwall %s, level metrics: %s",
-                        item.vin,
-                        e)
+        self.battery_missing.set(
+            abs(int((full_pack - reserve)/1000) - self._nominal_energy) > 1)
 
 
     def get_discovery(self, prefix: str, will_topic: str) -> dict:
@@ -383,6 +535,16 @@ class TeslaSystem(Device):
         return msg
 
 
+    def get_fingerprint(self) -> tuple:
+        """
+        Gets the metadata used in the discovery messages of the system and its
+        Powerwalls, see Device.get_fingerprint()
+        """
+        return (super().get_fingerprint()
+            + (self.part_number, self.firmware_version, self.serial)
+            + tuple(item.get_fingerprint() for item in self.powerwalls.values()))
+
+
     def get_discoveries(self, prefix: str, will_topic: str) -> list:
         """Generates MQTT discovery messages for all nested devices to send to HA"""
         msgs = []
@@ -392,11 +554,25 @@ class TeslaSystem(Device):
         return msgs
 
 
-    def get_states(self, prefix: str) -> list:
-        """Generates MQTT state messages for all nested devices to send to HA"""
-        msgs = []
-        msgs.append(self.get_state(prefix=prefix))
+    def get_states(self, prefix: str, changed_only: bool = False) -> list:
+        """
+        Generates MQTT state messages for all nested devices to send to HA,
+        recording them as published
+        Parameters:
+            prefix (str): The MQTT base topic
+            changed_only (bool): Skip devices whose state hasn't changed by
+                                 more than the entity deadbands since it was
+                                 last published, default False
+        Returns:
+            list: The state messages
+        """
+        devices = [self]
         if self.report_vitals:
-            for item in self.powerwalls.values():
-                msgs.append(item.get_state(prefix=prefix))
+            devices.extend(self.powerwalls.values())
+        msgs = []
+        for item in devices:
+            if changed_only and not item.has_changed():
+                continue
+            msgs.append(item.get_state(prefix=prefix))
+            item.set_published()
         return msgs
@@ -8,8 +8,34 @@
 # pylint: disable=R0913
 # pylint: disable=R0917
 
+from typing import NamedTuple
+
+
+class Descriptor(NamedTuple):
+    """The static metadata of an entity, shared by all entities with the same metadata"""
+    name: str
+    platform: str
+    template: str
+    device_class: str
+    unit: str
+    state_class: str
+    enabled: bool
+
+
+# Interned descriptors, so the entities of every Powerwall share one copy
+_descriptors = {}
+
+
+def _descriptor(*fields) -> Descriptor:
+    """Gets the interned descriptor with the given fields"""
+    descriptor = Descriptor(*fields)
+    return _descriptors.setdefault(descriptor, descriptor)
+
+
 class Entity:
     """Base class for Entities"""
+    __slots__ = ('prefix', 'descriptor')
+
     def __init__(self,
             id_prefix,
             name,
@@ -20,14 +46,17 @@ class Entity:
             state_class = None,
             enabled = True):
         self.prefix = id_prefix
-        self.name = name
-        self.platform = platform
-        self.template = template
-        self.device_class = device_class
-        self.unit = unit
-        self.state_class = state_class
-        self.value = None
-        self.enabled = enabled
+        self.descriptor = _descriptor(
+            name, platform, template, device_class, unit, state_class, enabled)
+
+    # The metadata is read only, and kept in the shared descriptor
+    name = property(lambda self: self.descriptor.name)
+    platform = property(lambda self: self.descriptor.platform)
+    template = property(lambda self: self.descriptor.template)
+    device_class = property(lambda self: self.descriptor.device_class)
+    unit = property(lambda self: self.descriptor.unit)
+    state_class = property(lambda self: self.descriptor.state_class)
+    enabled = property(lambda self: self.descriptor.enabled)
 
     def get_discovery(self):
         """Function to get the dictionary structure of an MQTT discovery component"""
@@ -52,6 +81,12 @@ class Entity:
 
 class ValueEntity(Entity):
     """An entity that can hold a value instead of just get data from a template"""
+    __slots__ = ('value', 'published')
+
+    # Numeric changes up to this size from the published value are not
+    # treated as changes, see changed()
+    deadband = 0
+
     def __init__(self,
             id_prefix,
             name,
@@ -61,6 +96,8 @@ class ValueEntity(Entity):
             unit = None,
             state_class = None,
             enabled = True):
+        if template is None:
+            template = name.lower().replace(' ', '_')
         super().__init__(
             id_prefix=id_prefix,
             name=name,
@@ -70,8 +107,8 @@ class ValueEntity(Entity):
             unit=unit,
             state_class=state_class,
             enabled=enabled)
-        if template is None:
-            self.template = name.lower().replace(' ', '_')
+        self.value = None
+        self.published = None
 
     def get_discovery(self):
         """Function to get the dictionary structure of an MQTT discovery component"""
@@ -93,10 +130,28 @@ class ValueEntity(Entity):
         else:
             self.value = value
 
+    def changed(self):
+        """
+        Function to check if the value has changed by more than the deadband
+        since it was published
+        """
+        if self.value == self.published:
+            return False
+        if (self.deadband
+                and isinstance(self.value, (int, float))
+                and isinstance(self.published, (int, float))):
+            return abs(self.value - self.published) > self.deadband
+        return True
+
+    def set_published(self):
+        """Function to record the value as published"""
+        self.published = self.value
 
 
 class Battery(ValueEntity):
     """Class that maps to a Battery entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -110,6 +165,8 @@ class Battery(ValueEntity):
 
 class Connectivity(ValueEntity):
     """Class that maps to a Connectivity entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -122,6 +179,8 @@ class Connectivity(ValueEntity):
 
 class Current(ValueEntity):
     """Class that maps to a Current entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -135,6 +194,8 @@ class Current(ValueEntity):
 
 class Duration(ValueEntity):
     """Class that maps to a Duration entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -148,6 +209,8 @@ class Duration(ValueEntity):
 
 class EnergyStorage(ValueEntity):
     """Class that maps to an Energy Storage entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -161,6 +224,8 @@ class EnergyStorage(ValueEntity):
 
 class PowerTemplate(Entity):
     """Class that maps to a Power entity using a template in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -175,6 +240,8 @@ class PowerTemplate(Entity):
 
 class PowerValue(ValueEntity):
     """Class that maps to a Power entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -189,6 +256,8 @@ class PowerValue(ValueEntity):
 
 class Problem(ValueEntity):
     """Class that maps to a Problem entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -201,6 +270,8 @@ class Problem(ValueEntity):
 
 class Running(ValueEntity):
     """Class that maps to a Running entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -213,6 +284,8 @@ class Running(ValueEntity):
 
 class Timestamp(ValueEntity):
     """Class that maps to a Timestamp entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -225,6 +298,8 @@ class Timestamp(ValueEntity):
 
 class Voltage(ValueEntity):
     """Class that maps to a Voltage entity in HA"""
+    __slots__ = ()
+
     def __init__(self, id_prefix, name, template = None, enabled = True):
         super().__init__(
             id_prefix=id_prefix,
@@ -3,10 +3,12 @@
 Powerwall 3 to MQTT for Home Assistant
 """
 
+import asyncio
 import json
 import logging
 import logging.config
 import os
+import queue
 import random
 import re
 import signal
@@ -15,16 +17,24 @@ import sys
 import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from selectors import DefaultSelector, EVENT_READ
-from threading import Condition, RLock
+from threading import Condition, Lock, RLock
 
 from paho.mqtt import client as mqtt_client
 import requests.exceptions
 import yaml
 
 import hamqtt.devices
+import hamqtt.entities
 import pytedapi
 import pytedapi.exceptions
+from pytedapi.governor import RateGovernor
+from utils import codec
+from utils import state
+from utils.breaker import CircuitBreaker, HALF_OPEN
+from utils.aiomqtt import AsyncioMQTT
+from utils.ticker import Ticker
 
 from hamqtt.devices import OFFLINE
 
@@ -37,6 +47,53 @@ hamqtt.devices.origin['name'] = 'powerwall3mqtt'
 #hamqtt.devices.origin['sw'] = '0.0.0'
 #hamqtt.devices.origin['url'] = ''
 
+# Seconds to give HA to process discovery before sending states
+DISCOVERY_DELAY = 0.5
+
+# Where the request rates learned by the rate governor of each gateway are
+# kept across restarts, and the most often they are saved in seconds
+RATE_STATE = '/data/tedapi_rates.json'
+RATE_SAVE_INTERVAL = 300
+
+# Where the DIN, firmware and config of each gateway are kept, so discovery
+# can be sent on start before the gateway has answered
+METADATA_STATE = '/data/tedapi_metadata.json'
+
+# Where the last discovery and state messages sent for each gateway are kept,
+# so HA can be sent them on start before the gateway has answered, the most
+# often they are saved in seconds, and the oldest they are sent in seconds
+STATE_SNAPSHOT = '/data/mqtt_snapshot.json'
+SNAPSHOT_SAVE_INTERVAL = 300
+SNAPSHOT_MAX_AGE = 3600
+
+# Most seconds between probes of a gateway that has stopped answering
+BREAKER_MAX_BACKOFF = 300
+
+# Errors a restart is needed for.  Other TEDAPI and connection errors open
+# the circuit breaker of the site and it is probed until it answers again.
+FATAL_ERRORS = (
+    pytedapi.exceptions.TEDAPIAccessDeniedException,
+    pytedapi.exceptions.TEDAPIDinChangedException,
+    pytedapi.exceptions.TEDAPIPowerwallVersionException
+)
+
+# Config keys holding the refresh interval of each TeslaSystem data source
+INTERVALS = {
+    'tedapi_poll_interval': 'status',
+    'tedapi_vitals_interval': 'vitals',
+    'tedapi_config_interval': 'config',
+    'tedapi_firmware_interval': 'firmware'
+}
+
+# Config keys holding the deadband of each entity class
+DEADBANDS = {
+    'mqtt_deadband_power': hamqtt.entities.PowerValue,
+    'mqtt_deadband_energy': hamqtt.entities.EnergyStorage,
+    'mqtt_deadband_voltage': hamqtt.entities.Voltage,
+    'mqtt_deadband_current': hamqtt.entities.Current,
+    'mqtt_deadband_duration': hamqtt.entities.Duration
+}
+
 
 with open("logger.yaml", 'r', encoding="utf-8") as stream:
     try:
@@ -53,6 +110,38 @@ class FatalError(Exception):
     """FataError exception used to break from the main run loop"""
 
 
+class Site:
+    """
+    The TEDAPI connection, devices and polling state of one gateway.  Each
+    site is polled on its own schedule, and an error polling one doesn't
+    affect the others.
+
+    Parameters:
+        host (str): Address of the gateway
+        password (str): Gateway password
+        interval (int): Seconds between polls
+        jitter (float): Maximum random delay of each poll
+    """
+    def __init__(self, host, password, interval, jitter):
+        self.host = host
+        self.password = password
+        self.poll_interval = interval
+        self.ticker = Ticker(interval, jitter)
+        self.enabled = True
+        # Started from cached metadata that is yet to be checked, see
+        # Powerwall3MQTT.validate_site()
+        self.stale = False
+        # Opened when polls fail, probing again from the next poll
+        self.breaker = CircuitBreaker(interval, BREAKER_MAX_BACKOFF)
+        self.tedapi = None
+        # The TeslaSystem, None until connected, see Powerwall3MQTT.connect_tedapi()
+        self.tesla = None
+        self.refresh_countdown = 0
+        # When each data source is next due to be refreshed, see Powerwall3MQTT.refresh()
+        self.next_refresh = {}
+        self.discovery = None
+
+
 class Powerwall3MQTT:
     """Main Powerwall 3 to MQTT application class"""
     def __init__(self):
@@ -61,14 +150,56 @@ class Powerwall3MQTT:
         self._run_lock = RLock()
         self._loop_wait = Condition(self._run_lock)
         self._update_loop = socket.socketpair()
+        # Sites due to be polled by the main loop, see timing_loop()
+        self._due = queue.SimpleQueue()
+        # Main loop work due at a time, by name, see main_loop()
+        self._deadlines = {}
+        self._ha_status_pending = None
+        self._ha_status_stats = {'received': 0, 'applied': 0, 'discoveries': 0, 'suppressed': 0}
+        # Set to wake the asyncio runtime when deadlines may have changed
+        self._wake = None
+        self._aiomqtt = None
+        # Learned request rates by gateway, see save_rates()
+        self._rates = state.load(RATE_STATE, {})
+        self._rates_saved = time.monotonic()
         self._config = self.loadconfig()
+        # Last metadata of each gateway, see save_metadata(), which sites
+        # refreshed in worker threads can call at once
+        self._metadata = {}
+        self._metadata_lock = Lock()
+        if self._config['tedapi_metadata_cache']:
+            self._metadata = state.load(METADATA_STATE, {})
+        # Last messages sent for each gateway, None when not kept, see save_snapshot()
+        self._published = None
+        self._snapshot = {}
+        if self._config['mqtt_state_snapshot']:
+            self._published = {}
+            self._snapshot = state.load(STATE_SNAPSHOT, {})
+        self._snapshot_saved = time.monotonic()
+        # A single gateway can be set with tedapi_host and tedapi_password
+        gateways = self._config['tedapi_gateways'] or [{
+            'host': self._config['tedapi_host'],
+            'password': self._config['tedapi_password']
+        }]
+        self._sites = [Site(
+            gateway['host'],
+            gateway['password'],
+            self._config['tedapi_poll_interval'],
+            self._config['tedapi_poll_jitter']) for gateway in gateways]
 
         # Set the logging level
         logging.getHandlerByName('console').setLevel(self._config['log_level'].upper())
 
+        # Set the deadbands used to skip publishing unchanged states
+        for k, entity in DEADBANDS.items():
+            entity.deadband = self._config[k]
+
         logger.debug("Runtime config:")
         for key in sorted(self._config.keys()):
-            if key.find('password') == -1:
+            if key == 'tedapi_gateways':
+                logger.debug("config['%s'] = '%s'", key,
+                    ', '.join(gateway['host'] for gateway in self._config[key]))
+            elif key.find('password') == -1:
                 logger.debug("config['%s'] = '%s'", key, self._config[key] if self._config[key] is not None else '')
             else:
                 redacted = re.sub('.', 'X', self._config[key] if self._config[key] is not None else '')
@@ -79,11 +210,30 @@ class Powerwall3MQTT:
         """Method to load and build a config dictionary"""
         config = {
             'log_level': 'WARNING',
+            'runtime': 'threads',
             'tedapi_host': pytedapi.GW_IP,
             'tedapi_password': None,
+            'tedapi_gateways': [],
             'tedapi_poll_interval': 30,
+            'tedapi_poll_jitter': 0.0,
+            'tedapi_vitals_interval': 60,
+            'tedapi_config_interval': 300,
+            'tedapi_firmware_interval': 3600,
             'tedapi_report_vitals': False,
+            'tedapi_max_inflight': 1,
+            'tedapi_rate_governor': True,
+            'tedapi_metadata_cache': True,
+            'tedapi_stale_if_error': False,
+            'tedapi_status_query': 'lean',
             'mqtt_base_topic': 'homeassistant',
+            'mqtt_full_refresh_cycles': 10,
+            'mqtt_ha_status_debounce': 1.0,
+            'mqtt_state_snapshot': True,
+            'mqtt_deadband_power': 10.0,
+            'mqtt_deadband_energy': 10.0,
+            'mqtt_deadband_voltage': 1.0,
+            'mqtt_deadband_current': 0.1,
+            'mqtt_deadband_duration': 1800.0,
             'mqtt_host': None,
             'mqtt_port': 1883,
             'mqtt_username': None,
@@ -106,9 +256,13 @@ class Powerwall3MQTT:
         for k, item in config.items():
             value = os.environ.get(f"POWERWALL3MQTT_CONFIG_{k.upper()}", item)
             if isinstance(item, bool):
-                config[k] = False if value=="False" else True
+                config[k] = value if isinstance(value, bool) else value != "False"
             elif isinstance(item,  int):
                 config[k] = int(value)
+            elif isinstance(item, float):
+                config[k] = float(value)
+            elif isinstance(item, list):
+                config[k] = json.loads(value) if isinstance(value, str) else value
             else:
                 config[k] = value
 
@@ -118,8 +272,16 @@ class Powerwall3MQTT:
 
     def validate(self, config: dict) -> None:
         """Method to validate the required keys are in the config dictionary"""
-        if config['tedapi_password'] is None:
+        if not config['tedapi_gateways'] and config['tedapi_password'] is None:
             raise FatalError("tedapi_password not set")
+        hosts = set()
+        for gateway in config['tedapi_gateways']:
+            if (not isinstance(gateway, dict)
+                    or None in (gateway.get('host'), gateway.get('password'))):
+                raise FatalError("Each of tedapi_gateways needs a host and password")
+            if gateway['host'] in hosts:
+                raise FatalError(f"Gateway '{gateway['host']}' is listed more than once")
+            hosts.add(gateway['host'])
         if None in (config['mqtt_host'], config['mqtt_port']):
             raise FatalError("MQTT connection info not set")
         if config['mqtt_username'] is not None:
@@ -127,22 +289,55 @@ class Powerwall3MQTT:
                  raise FatalError("MQTT authentication info not set")
         if config['tedapi_poll_interval'] < 5:
             raise FatalError("Polling Interval must be >= 5")
+        if not 0 <= config['tedapi_poll_jitter'] < config['tedapi_poll_interval']:
+            raise FatalError("Polling jitter must be >= 0 and less than the polling interval")
+        for k in INTERVALS:
+            # Sources are only refreshed on a poll, so can't be refreshed more often
+            if config[k] < config['tedapi_poll_interval']:
+                logger.warning("%s of %ss is below tedapi_poll_interval, using %ss",
+                               k, config[k], config['tedapi_poll_interval'])
+                config[k] = config['tedapi_poll_interval']
+        if config['tedapi_max_inflight'] < 1:
+            raise FatalError("Max in-flight requests must be >= 1")
+        if config['runtime'] not in ('threads', 'asyncio'):
+            raise FatalError("Runtime must be 'threads' or 'asyncio'")
+        if config['tedapi_status_query'] not in ('lean', 'full'):
+            raise FatalError("Status fields kept must be 'lean' or 'full'")
+        if config['mqtt_full_refresh_cycles'] < 1:
+            raise FatalError("Full refresh cycles must be >= 1")
+        if config['mqtt_ha_status_debounce'] < 0:
+            raise FatalError("HA status debounce must be >= 0")
+        for k in DEADBANDS:
+            if config[k] < 0:
+                raise FatalError(f"{k} must be >= 0")
         if (config['mqtt_cert'] is not None) ^ (config['mqtt_key'] is not None):
             raise FatalError("MQTT Certifcate and Key are both required")
 
 
 
-    def connect_mqtt(self):
-        """Method used to setup the connection to MQTT"""
-        ha_status = socket.socketpair()
+    def connect_mqtt(self, loop=None):
+        """
+        Method used to setup the connection to MQTT
+        Parameters:
+            loop (AbstractEventLoop): The event loop to run the client on, or
+                                      None to run it with loop_start() and
+                                      pass HA status messages through a socket
+        Returns:
+            tuple: The client, and the socket HA status messages are written
+                   to, or None with an event loop
+        """
+        ha_status = socket.socketpair() if loop is None else None
 
         def on_ha_status(client, userdata, message):
             """Callback method to receive online/offline notifications from a topic"""
             # pylint: disable=W0613 # method signature
-            if message.payload == b'online':
-                ha_status[1].send(b'\1')
+            status = b'\1' if message.payload == b'online' else b'\0'
+            if ha_status is not None:
+                ha_status[1].send(status)
             else:
-                ha_status[1].send(b'\0')
+                # Already on the event loop
+                self.queue_ha_status(status)
+                self._wake.set()
 
         def on_connect(client, userdata, flags, rc, properties):
             """Callback method to handle handle MQTT connection events"""
@@ -164,6 +359,8 @@ class Powerwall3MQTT:
             callback_api_version=mqtt_client.CallbackAPIVersion.VERSION2)
         client.on_connect = on_connect
         client.user_data_set(self)
+        if loop is not None:
+            self._aiomqtt = AsyncioMQTT(loop, client)
         client.will_set(WILL_TOPIC, OFFLINE)
         logger.debug("MQTT will set on '%s' to '%s'", WILL_TOPIC, OFFLINE)
         if self._config['mqtt_ssl']:
@@ -177,7 +374,67 @@ class Powerwall3MQTT:
                 self._config['mqtt_username'],
                 self._config['mqtt_password'])
         client.connect(self._config['mqtt_host'], self._config['mqtt_port'])
-        return client, ha_status[0]
+        return client, ha_status[0] if ha_status is not None else None
+
+
+    def connect_tedapi(self, site, metadata=None):
+        """
+        Method used to setup the connection to a Powerwall and populate the Tesla info
+        Parameters:
+            site (Site): The site to connect to, which is given the connection
+                         and TeslaSystem
+            metadata (dict): Metadata saved by save_metadata() to describe the
+                             site from without connecting, leaving the site
+                             to be checked by validate_site(), default None
+        Returns:
+            TeslaSystem: The Tesla system of the site
+        Raises:
+            FatalError: If the Powerwall can't be connected to, or isn't a Powerwall 3
+        """
+        try:
+            governor = None
+            if self._config['tedapi_rate_governor']:
+                governor = RateGovernor(rates=self._rates.get(site.host))
+            tedapi = pytedapi.TeslaEnergyDeviceAPI(
+                site.password,
+                host=site.host,
+                max_inflight=self._config['tedapi_max_inflight'],
+                governor=governor,
+                din=metadata['din'] if metadata else None)
+            site.tedapi = tedapi
+            # Cached data expires shortly before its source is next refreshed
+            slack = site.poll_interval / 2
+            powerwall = pytedapi.Powerwall3API(
+                tedapi,
+                cacheexpire=4,
+                configexpire=29,
+                expire={
+                    'get_pw_vitals': self._config['tedapi_vitals_interval'] - slack,
+                    'get_config': self._config['tedapi_config_interval'] - slack,
+                    'get_firmware_version': self._config['tedapi_firmware_interval'] - slack
+                },
+                stale_if_error=self._config['tedapi_stale_if_error'],
+                status_fields=(hamqtt.devices.TeslaSystem.STATUS_FIELDS
+                    if self._config['tedapi_status_query'] == 'lean' else None))
+            if metadata:
+                powerwall.set_metadata(metadata)
+        except requests.exceptions.ConnectionError as e:
+            raise FatalError(f"Unable to connect to Powerwall '{site.host}'") from e
+        if not tedapi.is_powerwall3():
+            raise FatalError(f"Powerwall '{site.host}' appears to be older than Powerwall 3")
+
+        # Populate Tesla info, replacing any system from an earlier connection
+        tesla = hamqtt.devices.TeslaSystem(
+            powerwall,
+            self._config['tedapi_report_vitals'],
+            self._config['tedapi_max_inflight'])
+        if site.tesla is not None:
+            site.tesla.close()
+        site.tesla = tesla
+        site.stale = bool(metadata)
+        logger.info("Powerwall '%s' firmware version = %s%s", site.host, tesla.firmware_version,
+            " (cached)" if metadata else "")
+        return tesla
 
 
     def get_pause(self):
@@ -208,24 +465,106 @@ class Powerwall3MQTT:
                 self._loop_wait.notify()
 
 
-    def discover(self, mqtt, tesla):
-        """Method to get Tesla system discovery messages and publish them to MQTT"""
-        discovery = tesla.get_discoveries(
-                        prefix=self._config['mqtt_base_topic'],
-                        will_topic=WILL_TOPIC)
+    def discover(self, mqtt, site, force=True):
+        """
+        Method to get Tesla system discovery messages and publish them to MQTT.
+        The messages are built and encoded once, and only built again when the
+        device metadata changes.  As HA needs time to process them, sending
+        states is deferred to the main loop rather than waiting here.
+        Parameters:
+            mqtt (Client): The MQTT client to publish with
+            site (Site): The site to send discovery messages for
+            force (bool): Send the messages even if the metadata hasn't changed,
+                          as needed when HA comes online, default True
+        Returns:
+            bool: True if discovery messages were sent
+        """
+        fingerprint = site.tesla.get_fingerprint()
+        if site.discovery is None or site.discovery[0] != fingerprint:
+            if site.discovery is not None:
+                logger.info("Device metadata of '%s' changed, updating discovery", site.host)
+            messages = [(message['topic'], codec.dumps(message['payload']))
+                for message in site.tesla.get_discoveries(
+                    prefix=self._config['mqtt_base_topic'],
+                    will_topic=WILL_TOPIC)]
+            site.discovery = (fingerprint, messages)
+            if self._published is not None:
+                self._published.setdefault(site.host, {})['discovery'] = dict(messages)
+        elif not force:
+            return False
+
         # Send Discovery
-        for message in discovery:
-            result = mqtt.publish(message['topic'], json.dumps(message['payload']))
+        for topic, payload in site.discovery[1]:
+            result = mqtt.publish(topic, payload)
             if result[0] == 0:
-                logger.info("Discovery sent to '%s'", message['topic'])
-                logger.debug("message = %s", json.dumps(message['payload']))
+                logger.info("Discovery sent to '%s'", topic)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("message = %s", payload.decode('utf-8'))
             else:
-                logger.warning("Failed to send '%s' to '%s'", message['topic'], message['payload'])
-        logger.info("Sleeping 0.5s to allow HA to process discovery")
-        time.sleep(0.5)
+                logger.warning("Failed to send '%s' to '%s'", topic, payload.decode('utf-8'))
+
+        # HA may have lost all states, so send them all once it has processed discovery
+        logger.info("Sending states in %ss to allow HA to process discovery", DISCOVERY_DELAY)
+        site.refresh_countdown = 0
+        self._deadlines[('states', site)] = time.monotonic() + DISCOVERY_DELAY
+        return True
+
+
+    def receive_ha_status(self, ha_status):
+        """
+        Method to read HA status messages queued by the MQTT callback.  Bursts
+        of messages, from HA restarting or several HA instances sharing the
+        broker, are coalesced so only the last status is acted on once the
+        mqtt_ha_status_debounce window from the first has passed.
+        Parameters:
+            ha_status (socket): The socket the MQTT callback writes a byte
+                                to for each message, 1 for online and 0
+                                for offline
+        """
+        self.queue_ha_status(ha_status.recv(4096))
+
 
+    def queue_ha_status(self, data):
+        """
+        Method to queue HA status messages until the debounce window passes,
+        see receive_ha_status()
+        Parameters:
+            data (bytes): A byte for each message, 1 for online and 0 for offline
+        """
+        self._ha_status_stats['received'] += len(data)
+        if self._ha_status_pending is None:
+            self._ha_status_pending = []
+            self._deadlines['ha_status'] = (
+                time.monotonic() + self._config['mqtt_ha_status_debounce'])
+        self._ha_status_pending.extend(byte == 1 for byte in data)
 
-    def main_loop(self, shutdown, ha_status, mqtt, tesla):
+
+    def apply_ha_status(self, mqtt):
+        """Method to act on the last HA status received in the debounce window"""
+        pending = self._ha_status_pending
+        self._ha_status_pending = None
+        online = pending[-1]
+        stats = self._ha_status_stats
+        stats['applied'] += 1
+        # Each online message would have run discovery without the debounce
+        suppressed = pending.count(True) - (1 if online else 0)
+        stats['suppressed'] += suppressed
+        logger.info("Received ha_status %s (%d message(s), %d discovery run(s) suppressed)",
+            "online" if online else "offline", len(pending), suppressed)
+        logger.debug("HA status stats = %r", stats)
+        if online:
+            # Any online means HA may have restarted, so discovery is needed
+            # even if it was already online
+            stats['discoveries'] += 1
+            for site in self._sites:
+                if site.enabled and site.tesla is not None:
+                    self.discover(mqtt, site)
+            self.set_pause(False)
+        else:
+            self.set_pause(True)
+
+
+    def main_loop(self, shutdown, ha_status, mqtt):
         """The main program loop"""
         sel = DefaultSelector()
         sel.register(shutdown, EVENT_READ)
@@ -233,46 +572,141 @@ class Powerwall3MQTT:
         sel.register(self._update_loop[0], EVENT_READ)
 
         while True:
-            for key, _ in sel.select():
+            timeout = None
+            if self._deadlines:
+                timeout = max(min(self._deadlines.values()) - time.monotonic(), 0)
+            ready = [key.fileobj for key, _ in sel.select(timeout)]
+            # Add the names of any deadlines that are due
+            now = time.monotonic()
+            ready.extend(k for k, deadline in self._deadlines.items() if deadline <= now)
+            for fileobj in ready:
+                site = None
                 try:
-                    if key.fileobj == shutdown:
+                    if fileobj in self._deadlines:
+                        self.run_deadline(fileobj, mqtt)
+                    elif fileobj == shutdown:
                         shutdown.recv(1)
                         logger.info("Received shutdown signal")
                         self.set_running(False)
                         return
-                    if key.fileobj == ha_status:
-                        cmd = ha_status.recv(1)
-                        if cmd == b'\01':
-                            logger.info("Received ha_status online")
-                            self.discover(mqtt, tesla)
-                            self.set_pause(False)
-                        else:
-                            logger.info("Received ha_status offline")
-                            self.set_pause(True)
-                    elif key.fileobj == self._update_loop[0]:
+                    elif fileobj == ha_status:
+                        self.receive_ha_status(ha_status)
+                    elif fileobj == self._update_loop[0]:
+                        # A byte is sent for each site queued
                         self._update_loop[0].recv(1)
-                        logger.debug("Processing update from timing_loop")
-                        self.update(mqtt, tesla, True)
-                except pytedapi.exceptions.TEDAPIRateLimitingException as e:
-                    self._config['tedapi_poll_interval'] += 1
-                    logger.warning(e)
-                    logger.warning(
-                        "Increasing poll interval by 1s to %d",
-                        self._config['tedapi_poll_interval'])
-                except pytedapi.exceptions.TEDAPIException as e:
-                    # Likely fatal, bail out
-                    self.set_running(False)
-                    raise e
-                except TimeoutError as e:
-                    # Likely lock timeout, skip interval
-                    logger.warning(e, exc_info=True)
+                        site = self._due.get()
+                        logger.debug("Processing update of '%s' from timing_loop", site.host)
+                        start = time.monotonic()
+                        try:
+                            self.update(mqtt, site, True)
+                        finally:
+                            site.ticker.end(time.monotonic() - start)
+                            logger.debug("Poll stats of '%s' = %r", site.host,
+                                site.ticker.get_stats())
+                            self.save_rates()
+                            self.save_snapshot()
                 except Exception as e: # pylint: disable=W0718
-                    # Catchall so the loop keeps going
-                    logger.exception(e)
+                    self.handle_error(e, site)
+
+
+    def run_deadline(self, name, mqtt):
+        """Method to run the work of a deadline that is due, see main_loop()"""
+        del self._deadlines[name]
+        if name == 'ha_status':
+            self.apply_ha_status(mqtt)
+        elif name[0] == 'states':
+            site = name[1]
+            logger.debug("Sending states of '%s' deferred by discovery", site.host)
+            self.update(mqtt, site)
+
+
+    def handle_error(self, e, site=None):
+        """
+        Method to handle an exception raised in the main loop, so the loop can
+        keep going.  With several gateways, errors polling one site are kept
+        to that site so the others are still polled.
+        Parameters:
+            e (Exception): The exception
+            site (Site): The site being polled when raised, default None
+        Raises:
+            TEDAPIException: For errors that are likely fatal, with a single
+                             gateway or once every site has failed
+            FatalError: For a gateway that can't be connected to, with a
+                        single gateway
+        """
+        isolated = site is not None and len(self._sites) > 1
+        if isinstance(e, (pytedapi.exceptions.TEDAPIRateLimitingException,
+                          pytedapi.exceptions.TEDAPIRateLimitedException)):
+            # Requests are slowed down by the rate governor, or paused for a
+            # cooldown without it, so the poll interval is left as it is
+            logger.warning(e)
+        elif isinstance(e, pytedapi.exceptions.TEDAPIException):
+            if isolated:
+                # Likely fatal for the site, so stop polling it
+                site.enabled = False
+                if site.tesla is not None:
+                    site.tesla.close()
+                logger.error("Stopped polling '%s': %s", site.host, e)
+            if not isolated or not any(s.enabled for s in self._sites):
+                # Likely fatal, bail out
+                self.set_running(False)
+                raise e
+        elif isinstance(e, FatalError):
+            if not isolated:
+                raise e
+            # Connecting is retried on the site's next poll
+            logger.error("%s, retrying on the next poll", e)
+        elif isinstance(e, TimeoutError):
+            # Likely lock timeout, skip interval
+            logger.warning(e, exc_info=True)
+        else:
+            # Catchall so the loop keeps going
+            logger.exception(e)
+
+
+    def check_sites(self):
+        """
+        Method to check a site was started, see start_site()
+        Raises:
+            FatalError: If no site could be connected to
+        """
+        started = [site.host for site in self._sites if site.enabled and site.tesla is not None]
+        if not started:
+            raise FatalError("Unable to connect to any Powerwall")
+        logger.info("Polling %d of %d gateway(s): %s",
+            len(started), len(self._sites), ', '.join(started))
+
+
+    def close_sites(self):
+        """Method to stop the threads of each connected site on shutdown"""
+        for site in self._sites:
+            if site.tesla is not None:
+                site.tesla.close()
+
+
+    def start_site(self, mqtt, site):
+        """
+        Method to connect to a site, refresh it and send its discovery.  With
+        cached metadata, discovery is sent first and only sent again if the
+        refresh finds the metadata has changed.
+        """
+        try:
+            metadata = self._metadata.get(site.host)
+            if metadata is not None:
+                self.connect_tedapi(site, metadata)
+                self.discover(mqtt, site)
+            self.refresh(site)
+            self.discover(mqtt, site, force=metadata is None)
+        except Exception as e: # pylint: disable=W0718
+            self.handle_error(e, site)
 
 
     def run(self):
         """The main program entry point"""
+        if self._config['runtime'] == 'asyncio':
+            asyncio.run(self.run_async())
+            return
+
         shutdown = socket.socketpair()
 
         def catch(signum, frame):
@@ -286,59 +720,428 @@ class Powerwall3MQTT:
 
         # Connect to remote services
         mqtt, ha_status = self.connect_mqtt()
-        try:
-            tedapi = pytedapi.TeslaEnergyDeviceAPI(
-                self._config['tedapi_password'],
-                host=self._config['tedapi_host'])
-            powerwall = pytedapi.Powerwall3API(
-                tedapi,
-                cacheexpire=4,
-                configexpire=29)
-        except requests.exceptions.ConnectionError as e:
-            raise FatalError("Unable to connect to Powerwall") from e
-        if not tedapi.is_powerwall3():
-            raise FatalError("Powerwall appears to be older than Powerwall 3")
-
-        # Populate Tesla info
-        tesla = hamqtt.devices.TeslaSystem(
-            powerwall,
-            self._config['tedapi_report_vitals'])
-        logger.info("Powerwall firmware version = %s", tesla.firmware_version)
 
         mqtt.loop_start()
         try:
+            self.replay_snapshot(mqtt)
+            for site in self._sites:
+                self.start_site(mqtt, site)
+            self.check_sites()
             timer = threading.Thread(target=self.timing_loop)
             timer.start()
             try:
-                self.discover(mqtt, tesla)
-                self.update(mqtt, tesla, True)
-                self.main_loop(shutdown=shutdown[0], ha_status=ha_status, mqtt=mqtt, tesla=tesla)
+                self.main_loop(shutdown=shutdown[0], ha_status=ha_status, mqtt=mqtt)
             finally:
                 self.set_running(False)
                 timer.join()
         finally:
             mqtt.loop_stop()
+            self.save_rates(force=True)
+            self.save_snapshot(force=True)
+            self.close_sites()
+
+
+    async def run_async(self):
+        """
+        The main program entry point for the asyncio runtime.  Signals, HA
+        status messages, polls and MQTT I/O are all handled on one event loop
+        instead of the threads and sockets of run(), with the blocking TEDAPI
+        calls run in worker threads.
+        """
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        self._wake = asyncio.Event()
+        # Polls of a site never overlap, so a worker per site lets every
+        # site be polled at once
+        executor = ThreadPoolExecutor(max_workers=len(self._sites), thread_name_prefix='tedapi')
+
+        try:
+            # Connect to remote services
+            mqtt, _ = self.connect_mqtt(loop)
+            self.replay_snapshot(mqtt)
+            await asyncio.gather(*(self.start_site_async(mqtt, site, executor)
+                for site in self._sites))
+            self.check_sites()
+
+            async with asyncio.TaskGroup() as group:
+                tasks = set()
+                tasks.add(group.create_task(self.deadline_loop(mqtt)))
+                for site in self._sites:
+                    tasks.add(group.create_task(self.poll_loop(group, tasks, mqtt, site, executor)))
+                await stop.wait()
+                logger.info("Received shutdown signal")
+                for task in tasks:
+                    task.cancel()
+        except* (pytedapi.exceptions.TEDAPIException, FatalError) as e:
+            raise e.exceptions[0] from None
+        finally:
+            self.set_running(False)
+            self.save_rates(force=True)
+            self.save_snapshot(force=True)
+            self.close_sites()
+            if self._aiomqtt is not None:
+                self._aiomqtt.stop()
+            executor.shutdown(wait=False, cancel_futures=True)
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+
+
+    async def start_site_async(self, mqtt, site, executor):
+        """The asyncio equivalent of start_site(), connecting in the executor"""
+        try:
+            metadata = self._metadata.get(site.host)
+            if metadata is not None:
+                self.connect_tedapi(site, metadata)
+                self.discover(mqtt, site)
+            await asyncio.get_running_loop().run_in_executor(executor, self.refresh, site)
+            self.discover(mqtt, site, force=metadata is None)
+        except Exception as e: # pylint: disable=W0718
+            self.handle_error(e, site)
+
+
+    async def deadline_loop(self, mqtt):
+        """Task running the work of each deadline when due, see main_loop()"""
+        while True:
+            timeout = None
+            if self._deadlines:
+                timeout = max(min(self._deadlines.values()) - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            now = time.monotonic()
+            for name in [k for k, deadline in self._deadlines.items() if deadline <= now]:
+                try:
+                    self.run_deadline(name, mqtt)
+                except Exception as e: # pylint: disable=W0718
+                    self.handle_error(e)
+
+
+    async def poll_loop(self, group, tasks, mqtt, site, executor):
+        """
+        Task starting a poll of a site on each of its ticks, the asyncio
+        equivalent of timing_loop().  Polls run as their own tasks in group,
+        kept in tasks while running, so ticks that fall while one is running
+        are dropped as overruns.  The task ends if polling the site is stopped.
+        """
+        ticker = site.ticker
+        while site.enabled:
+            await asyncio.sleep(ticker.timeout())
+            if not ticker.due() or self.get_pause() or not site.enabled:
+                continue
+            if not ticker.begin():
+                logger.warning("Update of '%s' still running, skipping poll (%r)",
+                    site.host, ticker.get_stats())
+                continue
+            task = group.create_task(self.poll(mqtt, site, executor))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+    async def poll(self, mqtt, site, executor):
+        """Task fetching the due data sources of a site in the executor, then publishing"""
+        logger.debug("Processing update of '%s' from poll_loop", site.host)
+        start = time.monotonic()
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, self.refresh, site)
+            self.publish_states(mqtt, site, True)
+        except Exception as e: # pylint: disable=W0718
+            self.handle_error(e, site)
+        finally:
+            site.ticker.end(time.monotonic() - start)
+            logger.debug("Poll stats of '%s' = %r", site.host, site.ticker.get_stats())
+            self.save_rates()
+            self.save_snapshot()
+            # Discovery may have deferred the states
+            self._wake.set()
 
 
     def timing_loop(self):
-        """A method to run in a separate thread to trigger updates to MQTT"""
+        """
+        A method to run in a separate thread to trigger updates to MQTT, at a
+        fixed rate aligned to the wall clock.  Each site has its own ticks,
+        and those that fall while the last update of the site is still
+        running are dropped rather than queued.
+        """
         with self._loop_wait:
             while self.get_running():
-                self._loop_wait.wait(self._config['tedapi_poll_interval'])
-                if not self.get_pause():
+                sites = [site for site in self._sites if site.enabled]
+                self._loop_wait.wait(min((site.ticker.timeout() for site in sites), default=None))
+                for site in sites:
+                    # Woken early by a pause or shutdown
+                    if not site.ticker.due():
+                        continue
+                    if self.get_pause():
+                        continue
+                    if not site.ticker.begin():
+                        logger.warning("Update of '%s' still running, skipping poll (%r)",
+                            site.host, site.ticker.get_stats())
+                        continue
+                    self._due.put(site)
                     self._update_loop[1].send(b'\1')
 
 
-    def update(self, mqtt, tesla, update=False):
-        """Method to get Tesla system state messages and publish them to MQTT"""
+    def refresh(self, site):
+        """
+        Method to refresh the Tesla system data sources of a site that are
+        due, connecting to it first if needed.  Status is refreshed every
+        poll, and vitals, config and firmware at their own intervals, so fast
+        changing values can be polled more often without fetching everything
+        each time.
+        Parameters:
+            site (Site): The site to refresh
+        """
+        now = time.monotonic()
+        # Allow for polls running a little early or late
+        slack = site.poll_interval / 2
+        if site.tesla is None:
+            self.connect_tedapi(site)
+        elif not site.breaker.allow(now + slack):
+            logger.debug("Skipping poll of unavailable '%s', next probe in %.0fs",
+                site.host, site.breaker.retry_in(now))
+            return
+        due = {source: k for k, source in INTERVALS.items()
+            if now >= site.next_refresh.get(source, 0) - slack}
+        logger.debug("Refreshing %s of '%s'", ', '.join(due), site.host)
+        try:
+            if site.stale:
+                self.validate_site(site)
+            elif site.breaker.get_state() == HALF_OPEN:
+                logger.info("Probing Powerwall '%s'", site.host)
+                site.tedapi.reconnect()
+            site.tesla.update(due)
+        except (*FATAL_ERRORS,
+                pytedapi.exceptions.TEDAPIRateLimitingException,
+                pytedapi.exceptions.TEDAPIRateLimitedException):
+            raise
+        except TimeoutError as e:
+            # Waiting for a lock or request slot held by another fetch, so the
+            # gateway wasn't asked and the breaker is left as it is (timeouts
+            # talking to the gateway are raised as requests exceptions)
+            logger.warning("Poll of '%s' timed out, retrying on the next poll: %s", site.host, e)
+            return
+        except (pytedapi.exceptions.TEDAPIException, OSError) as e:
+            # Likely a blip, so show the devices as unavailable and try again
+            # rather than restarting
+            opened = site.breaker.failure(now)
+            site.tesla.set_offline()
+            # The Powerwalls stay unavailable until their vitals are refreshed,
+            # so they are refreshed on the first poll that succeeds
+            site.next_refresh.pop('vitals', None)
+            (logger.error if opened else logger.warning)(
+                "Powerwall '%s' unavailable, retrying in %.0fs: %s",
+                site.host, site.breaker.retry_in(), e)
+            logger.debug("Circuit breaker stats of '%s' = %r", site.host,
+                site.breaker.get_stats())
+            return
+        if site.breaker.success():
+            logger.info("Powerwall '%s' is available again", site.host)
+        if 'config' in due or 'firmware' in due:
+            self.save_metadata(site)
+        # Sources that failed are retried on the next poll
+        for source, k in due.items():
+            site.next_refresh[source] = now + self._config[k]
+        if site.tedapi is not None:
+            logger.debug("TEDAPI connection stats = %r", site.tedapi.get_connection_stats())
+            logger.debug("TEDAPI dispatch stats = %r", site.tedapi.get_dispatch_stats())
+            if site.tedapi.governor is not None:
+                logger.debug("TEDAPI rate governor stats = %r", site.tedapi.governor.get_stats())
+        logger.debug("TEDAPI fetch stats = %r", site.tesla.tedapi.get_fetch_stats())
+
+
+    def validate_site(self, site):
+        """
+        Method to check a site started from cached metadata against the
+        gateway, reconnecting to check the DIN and dropping the cached
+        metadata so it is all fetched again.  If a different gateway answers,
+        the cached metadata is out of date and the site is connected again
+        from scratch.
+        Parameters:
+            site (Site): The site to check
+        """
+        logger.info("Checking cached metadata of '%s'", site.host)
+        try:
+            site.tedapi.reconnect()
+            site.tesla.tedapi.clear()
+        except pytedapi.exceptions.TEDAPIDinChangedException as e:
+            logger.warning("Cached metadata of '%s' is out of date: %s", site.host, e)
+            with self._metadata_lock:
+                self._metadata.pop(site.host, None)
+            self.connect_tedapi(site)
+        site.stale = False
+
+
+    def save_metadata(self, site):
+        """
+        Method to save the DIN, firmware and config of a site once they have
+        been fetched, so the next start can send discovery without waiting
+        for the gateway.  They are only written when changed.
+        Parameters:
+            site (Site): The site to save the metadata of
+        """
+        if not self._config['tedapi_metadata_cache']:
+            return
+        metadata = site.tesla.tedapi.get_metadata()
+        if len(metadata) < len(pytedapi.METADATA):
+            return
+        metadata['din'] = site.tedapi.get_din()
+        # The rest of the firmware holds protobuf values that can't be saved,
+        # and is only read once validate_site() has fetched it again
+        firmware = metadata['get_firmware_version']
+        metadata['get_firmware_version'] = {
+            'gateway': firmware['gateway'],
+            'din': firmware['din'],
+            'version': {'text': firmware['version']['text']}
+        }
+        with self._metadata_lock:
+            if metadata != self._metadata.get(site.host):
+                self._metadata[site.host] = metadata
+                if state.save(METADATA_STATE, self._metadata):
+                    logger.debug("Saved metadata of '%s' to '%s'", site.host, METADATA_STATE)
+
+
+    def save_rates(self, force=False):
+        """
+        Method to save the request rates learned by the rate governor of each
+        site, so a restart carries on from them rather than relearning them.
+        They are only written when changed, and at most every
+        RATE_SAVE_INTERVAL seconds unless forced, to spare the storage.
+        Parameters:
+            force (bool): Save even if saved recently, default False
+        """
+        now = time.monotonic()
+        if not force and now < self._rates_saved + RATE_SAVE_INTERVAL:
+            return
+        self._rates_saved = now
+        # Gateways no longer configured are kept, in case they come back
+        rates = dict(self._rates)
+        for site in self._sites:
+            if site.tedapi is not None and site.tedapi.governor is not None:
+                rates[site.host] = site.tedapi.governor.get_rates()
+        if rates != self._rates and state.save(RATE_STATE, rates):
+            logger.debug("Saved request rates to '%s'", RATE_STATE)
+            self._rates = rates
+
+
+    def save_snapshot(self, force=False):
+        """
+        Method to save the last discovery and state messages sent for each
+        site, so the next start can send them to HA before the gateway has
+        answered, see replay_snapshot().  They are saved at most every
+        SNAPSHOT_SAVE_INTERVAL seconds unless forced, to spare the storage.
+        Parameters:
+            force (bool): Save even if saved recently, default False
+        """
+        if not self._published:
+            return
+        now = time.monotonic()
+        if not force and now < self._snapshot_saved + SNAPSHOT_SAVE_INTERVAL:
+            return
+        self._snapshot_saved = now
+        # Sites nothing has been sent for yet keep the messages of the last run
+        sites = dict(self._snapshot.get('sites', {}))
+        for host, published in self._published.items():
+            # Discovery names the will topic of this run, which the next replaces
+            sites[host] = {'time': time.time(), 'will_topic': WILL_TOPIC} | {
+                kind: {topic: payload.decode('utf-8') for topic, payload in messages.items()}
+                for kind, messages in published.items()}
+        snapshot = {'sites': sites}
+        if state.save(STATE_SNAPSHOT, snapshot):
+            logger.debug("Saved MQTT messages of %d site(s) to '%s'", len(sites), STATE_SNAPSHOT)
+            self._snapshot = snapshot
+
+
+    def replay_snapshot(self, mqtt):
+        """
+        Method to send the messages saved by save_snapshot() on start, so HA
+        shows the last states of each site instead of unavailable until its
+        first poll, which then replaces them.  Each state is sent with a
+        snapshot_age of the seconds since it was saved, and none are sent
+        once that is over SNAPSHOT_MAX_AGE.  Discovery is only sent for sites
+        without cached metadata, as start_site() sends it for the rest.
+        Parameters:
+            mqtt (Client): The MQTT client to publish with
+        """
+        for site in self._sites:
+            published = self._snapshot.get('sites', {}).get(site.host)
+            if published is None:
+                continue
+            age = round(time.time() - published['time'])
+            if not 0 <= age <= SNAPSHOT_MAX_AGE:
+                logger.info("Not sending MQTT messages of '%s' saved %ss ago", site.host, age)
+                continue
+            messages = []
+            if site.host not in self._metadata:
+                for topic, payload in published.get('discovery', {}).items():
+                    payload = codec.loads(payload)
+                    for availability in payload.get('availability', []):
+                        if availability['topic'] == published['will_topic']:
+                            availability['topic'] = WILL_TOPIC
+                    messages.append((topic, payload))
+            # The states aren't held back for discovery, as HA still has the
+            # devices unless it restarted too, and then its online message
+            # gets discovery and states sent again
+            for topic, payload in published.get('states', {}).items():
+                payload = codec.loads(payload)
+                payload['snapshot_age'] = age
+                messages.append((topic, payload))
+            for topic, payload in messages:
+                result = mqtt.publish(topic, codec.dumps(payload))
+                if result[0] != 0:
+                    logger.warning("Failed to send '%s' to '%s'", topic, payload)
+            logger.info("Sent %d message(s) of '%s' saved %ss ago", len(messages), site.host, age)
+
+
+    def update(self, mqtt, site, update=False):
+        """Method to get a site's Tesla system state messages and publish them to MQTT"""
         if update:
-            tesla.update()
-        sysstate = tesla.get_states(prefix=self._config['mqtt_base_topic'])
+            self.refresh(site)
+        self.publish_states(mqtt, site, update)
+
+
+    def publish_states(self, mqtt, site, refreshed=False):
+        """
+        Method to publish the Tesla system state messages of a site to MQTT
+        Parameters:
+            mqtt (Client): The MQTT client to publish with
+            site (Site): The site to send state messages for
+            refreshed (bool): The site was just refreshed, so discovery
+                              is sent first if its metadata changed,
+                              default False
+        """
+        if refreshed:
+            # Renamed sites, firmware updates and so on need new discovery
+            # messages, and then states are sent once HA has processed them
+            if self.discover(mqtt, site, force=False):
+                return
+        if ('states', site) in self._deadlines:
+            # All states are sent once HA has processed discovery
+            logger.debug("Skipping states of '%s' until HA has processed discovery", site.host)
+            return
+        # Only send changed states, except for a full refresh every few cycles
+        full = site.refresh_countdown == 0
+        site.refresh_countdown = (
+            (site.refresh_countdown - 1) % self._config['mqtt_full_refresh_cycles'])
+        sysstate = site.tesla.get_states(
+            prefix=self._config['mqtt_base_topic'],
+            changed_only=not full)
+        logger.debug("Sending %s states for %d device(s)",
+            "all" if full else "changed", len(sysstate))
+        published = None
+        if self._published is not None:
+            published = self._published.setdefault(site.host, {}).setdefault('states', {})
         for message in sysstate:
-            result = mqtt.publish(message['topic'], json.dumps(message['payload']))
+            payload = codec.dumps(message['payload'])
+            if published is not None:
+                published[message['topic']] = payload
+            result = mqtt.publish(message['topic'], payload)
             if result[0] == 0:
                 logger.info("Sent message to '%s'", message['topic'])
-                logger.debug("message = %s", json.dumps(message['payload']))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("message = %s", payload.decode('utf-8'))
             else:
                 logger.warning("Failed to send '%s' to '%s'", message['topic'], message['payload'])
 
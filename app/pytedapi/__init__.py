@@ -48,18 +48,21 @@
 """
 
 # Imports
-import inspect
-import json
 import logging
 import time
+from threading import Lock
 
 import requests
-from cachetools import TTLCache
+from cachetools import TLRUCache
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
 from utils.locks import TimeoutRLock
+from utils.singleflight import SingleFlight
+from . import connection
 from . import exceptions
-from . import tedapi_pb2
+from . import messages
+from .dispatcher import PriorityDispatcher
+from .governor import RateGovernor
 
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
@@ -67,6 +70,21 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 # TEDAPI Fixed Gateway IP Address
 GW_IP = "192.168.91.1"
 
+# Default maximum age in seconds of a value served when fetching it fails
+DEFAULT_MAX_STALE = {
+    'get_config': 600,
+    'get_status': 60,
+    'get_device_controller': 60,
+    'get_firmware_version': 3600,
+    'get_components': 300,
+    'get_battery_block': 300,
+    'get_pw_vitals': 300
+}
+
+# Cached functions describing the system rather than its state, which can be
+# kept across restarts with get_metadata() and set_metadata()
+METADATA = ('get_config', 'get_firmware_version')
+
 # Setup Logging
 logger = logging.getLogger(__name__)
 
@@ -97,6 +115,14 @@ class TeslaEnergyDeviceAPI:
        timeout - API Timeout in seconds
        cooldown - Time in seconds to suspend calls if the Powerwall returns a
                   BUSY code
+       max_inflight - Maximum number of requests sent to the Powerwall at
+                      once, each on its own pooled connection, with waiting
+                      requests served by priority (default: 1)
+       governor - RateGovernor budgeting the requests to each endpoint, which
+                  slows them down when rate limited instead of suspending
+                  them for the cooldown (default: None)
+       din - DIN of the Powerwall 3 Gateway from an earlier connection, to
+             start without connecting until reconnect() (default: None)
 
     Functions:
        connect() - Connect to the Powerwall Gateway if not already connected
@@ -104,6 +130,9 @@ class TeslaEnergyDeviceAPI:
        request() - Send a simple GET request to the Powerwall Gateway
        post() - Send a POST to the Powerwall Gateway
        get_din() - Get the DIN from the Powerwall Gateway
+       build_request() - Get a serialized request for the Powerwall Gateway
+       get_connection_stats() - Get TLS handshake and connection reuse counters
+       get_dispatch_stats() - Get the wait and latency counters of each priority
 
     Note:
        This module requires access to the Powerwall Gateway. You can add a route to
@@ -114,18 +143,28 @@ class TeslaEnergyDeviceAPI:
             gw_pwd: str,
             host: str = GW_IP,
             timeout: int = 5,
-            cooldown: int = 300) -> None:
+            cooldown: int = 300,
+            max_inflight: int = 1,
+            governor: RateGovernor = None,
+            din: str = None) -> None:
         if not gw_pwd:
             raise ValueError("Missing gw_pwd")
+        if max_inflight < 1:
+            raise ValueError("max_inflight must be >= 1")
         self._gw_pwd = gw_pwd
         self._gw_ip = host
         self._timeout = timeout
         self._cooldown = cooldown
         self._pwcooldown = 0
+        self.governor = governor
         self._api_lock = TimeoutRLock(timeout)
-        self._cache = {'din': None, 'pw3': False}
+        # Bounds the requests in flight, with _api_lock kept for the DIN
+        self._dispatcher = PriorityDispatcher(max_inflight, timeout)
+        self._cache = {'din': din, 'pw3': din is not None}
+        self._pool = connection.ConnectionPool(timeout=timeout, maxsize=max_inflight)
+        self._templates = messages.RequestTemplates()
 
-        # Connect to Powerwall Gateway
+        # Connect to Powerwall Gateway, unless the DIN is already known
         self.connect()
 
     # TEDAPI Functions
@@ -161,7 +200,9 @@ class TeslaEnergyDeviceAPI:
         logger.debug("Testing Connection to Powerwall Gateway: %s", self._gw_ip)
         url = f'https://{self._gw_ip}'
         try:
-            resp = requests.get(url, verify=False, timeout=self._timeout)
+            with self._api_lock, self._dispatcher.slot('status'):
+                self._pool.reset()
+                resp = self._pool.request('GET', url)
             if resp.status_code != 200:
                 # Connected but appears to be Powerwall 3
                 logger.debug("Detected Powerwall 3 Gateway")
@@ -175,12 +216,16 @@ class TeslaEnergyDeviceAPI:
             raise
 
 
-    def check_http_response(self, r: requests.Response):
+    def check_http_response(self, r: requests.Response, path: str = None):
         """Translates HTTP resposnes codes from TEDAPI into exceptions"""
         match r.status_code:
             case 429 | 503:
-                # Rate limited - Switch to cooldown mode
-                self._pwcooldown = time.perf_counter() + self._cooldown
+                if self.governor is not None:
+                    # Slow down requests to the endpoint rather than pausing
+                    self.governor.limited(path)
+                else:
+                    # Rate limited - Switch to cooldown mode
+                    self._pwcooldown = time.perf_counter() + self._cooldown
                 raise exceptions.TEDAPIRateLimitingException()
             case 403:
                 raise exceptions.TEDAPIAccessDeniedException()
@@ -190,13 +235,14 @@ class TeslaEnergyDeviceAPI:
                 raise exceptions.TEDAPIException(r.status_code)
 
 
-    def request(self, path, force=False):
+    def request(self, path, force=False, priority='config'):
         """
         Make a simple HTTP GET request to the Powerwall Gateway, converting
         some HTTP status codes to exceptions
         Parameters:
             path (str): The URI path
             force (bool): Force a query from the API, default false
+            priority (str): From dispatcher.PRIORITIES, default 'config'
         Returns:
             requests.Response: The HTTP resposne
         Raises:
@@ -207,17 +253,20 @@ class TeslaEnergyDeviceAPI:
         """
         if not force and self._pwcooldown > time.perf_counter():
             raise exceptions.TEDAPIRateLimitedException()
-        with self._api_lock:
+        # Requests wait for their rate governor token in priority order
+        with self._dispatcher.slot(priority):
+            waited = self._acquire(path, force)
             url = f"https://{self._gw_ip}/{path}"
-            r = requests.get(url,
-                verify=False,
-                auth=('Tesla_Energy_Device', self._gw_pwd),
-                timeout=self._timeout)
-            self.check_http_response(r)
+            r = self._pool.request('GET', url,
+                auth=('Tesla_Energy_Device', self._gw_pwd))
+            self.check_http_response(r, path)
+            if self.governor is not None:
+                self.governor.success(path, waited)
             return r
 
 
-    def post(self, path, force=False, headers=None, data=None):
+    def post(self, path, force=False, headers=None, data=None, priority='config',
+            idempotent=False):
         """
         Make an HTTP POST request to the Powerwall Gateway, converting
         some HTTP status codes to exceptions
@@ -226,6 +275,10 @@ class TeslaEnergyDeviceAPI:
             force (bool): Force a query from the API, default false
             headers (dict): Passed through to requests, default None
             data (dict): Passed through to requests, default None
+            priority (str): From dispatcher.PRIORITIES, default 'config'
+            idempotent (bool): The request only reads from the Powerwall, so
+                               can be sent again if the connection is reset,
+                               default False
         Returns:
             requests.Response: The HTTP resposne
         Raises:
@@ -236,19 +289,29 @@ class TeslaEnergyDeviceAPI:
         """
         if not force and self._pwcooldown > time.perf_counter():
             raise exceptions.TEDAPIRateLimitedException()
-        with self._api_lock:
+        # Requests wait for their rate governor token in priority order
+        with self._dispatcher.slot(priority):
+            waited = self._acquire(path, force)
             url = f"https://{self._gw_ip}/{path}"
-            r = requests.post(url,
-                verify=False,
+            r = self._pool.request('POST', url,
+                idempotent=idempotent,
                 auth=('Tesla_Energy_Device', self._gw_pwd),
                 headers=headers,
-                data=data,
-                timeout=self._timeout)
-            self.check_http_response(r)
+                data=data)
+            self.check_http_response(r, path)
             self._pwcooldown = time.perf_counter()
+            if self.governor is not None:
+                self.governor.success(path, waited)
             return r
 
 
+    def _acquire(self, path, force):
+        """Wait for the governor to allow a request, returning True if it waited"""
+        if self.governor is None or force:
+            return False
+        return self.governor.acquire(path, self._timeout)
+
+
     def get_din(self, force=False):
         """
         Get the DIN of the Powerwall Gateway
@@ -264,14 +327,51 @@ class TeslaEnergyDeviceAPI:
                 logger.debug("Using Cached din")
                 return self._cache['din']
             logger.debug("Fetching din from Powerwall...")
-            r = self.request("tedapi/din", force=force)
+            self._templates.clear()
+            r = self.request("tedapi/din", force=force, priority='status')
             if self._cache['din'] not in (None, r.text):
-                raise exceptions.TEDAPIException(
-                    f"DIN changed from '{self._cache['din']}' to '{r.text}'")
+                # A different device answered, so don't reuse its connections
+                self._pool.reset(forget_tls=True)
+                raise exceptions.TEDAPIDinChangedException(self._cache['din'], r.text)
             self._cache['din'] = r.text
             return r.text
 
 
+    def build_request(self, kind: str, din: str = None) -> bytes:
+        """
+        Get a serialized request from the template registry, which is cleared
+        whenever the DIN is fetched again with get_din(force=True)
+        Parameters:
+            kind (str): 'config', 'firmware' or a key into messages.QUERIES
+            din (str): DIN of a device to query through the gateway, default
+                       None to query the gateway itself
+        Returns:
+            bytes: Serialized protobuf message
+        """
+        gateway = self.get_din()
+        if din is None:
+            return self._templates.get(kind, gateway)
+        return self._templates.get(kind, din, sender_din=gateway)
+
+
+    def get_connection_stats(self) -> dict:
+        """
+        Get the TLS handshake and connection reuse counters of the pool
+        Returns:
+            dict: See connection.ConnectionPool.get_stats()
+        """
+        return self._pool.get_stats()
+
+
+    def get_dispatch_stats(self) -> dict:
+        """
+        Get the slot wait and request latency counters of each priority
+        Returns:
+            dict: See dispatcher.PriorityDispatcher.get_stats()
+        """
+        return self._dispatcher.get_stats()
+
+
 ###
 ### Powerwall3API class
 ###
@@ -281,7 +381,17 @@ class Powerwall3API:
        tesla - TeslaEnergyDeviceApi object
        cacheexpire - Cache Expiration in seconds
        configexpire - Configuration Cache Expiration in seconds
+       expire - Dictionary of cache expiration in seconds by function name,
+                overriding cacheexpire and configexpire (default: None)
        timeout - API Timeout in seconds
+       stale_if_error - When refreshing an expired entry fails, or is
+                        refused during a rate limit cooldown, return the last
+                        value as long as it is not older than max_stale
+       max_stale - Dictionary of the maximum age in seconds of a value served
+                   when refreshing it fails, by function name (default:
+                   DEFAULT_MAX_STALE)
+       status_fields - Dotted paths of the get_status() fields to keep, or
+                       None to keep the full status
 
     Functions:
        get_config() - Get the Powerwall Gateway Configuration
@@ -294,6 +404,13 @@ class Powerwall3API:
        get_pw3_vitals() - Get the Powerwall 3 Vitals Information
        get_device_controller() - Get the Powerwall Device Controller Status
        battery_level() - Get the battery level as a percentage
+       get_fetch_stats() - Get the number of fetches made and coalesced
+       get_cache_age(key) - Get the age of the last value fetched for a key
+       get_stale_age(key) - Get the age of the last value returned for a key
+                            if it was stale
+       get_metadata() - Get the last config and firmware fetched
+       set_metadata(metadata) - Fill the cache with earlier metadata
+       clear() - Drop every cached value
 
     Note:
        This module requires access to the Powerwall Gateway. You can add a route to
@@ -304,19 +421,214 @@ class Powerwall3API:
             tesla: TeslaEnergyDeviceAPI,
             cacheexpire: int = 5,
             configexpire: int = 5,
-            timeout: int = 5) -> None:
+            expire: dict = None,
+            timeout: int = 5,
+            stale_if_error: bool = False,
+            max_stale: dict = None,
+            status_fields: list = None) -> None:
         self._tesla = tesla
         self._timeout = timeout
 
+        # Entries expire by function name, so each can be refreshed at its own rate
+        self._expire = expire or {}
+
         # _config used for get_config and get_firmware
-        self._config = TTLCache(maxsize=4, ttl=configexpire)
+        self._config = TLRUCache(maxsize=4, ttu=self._ttu(configexpire))
+
+        # _cache used for all other API calls except get_din, sized for the
+        # per Powerwall entries once the battery blocks are known
+        self._cache = TLRUCache(maxsize=self._cache_size(0), ttu=self._ttu(cacheexpire))
+
+        # TLRUCache is not thread safe, and expires entries on access
+        self._cache_lock = Lock()
+
+        # Last value fetched for each key and when, kept past expiry for
+        # stale-if-error and get_cache_age()
+        self._fetched = {}
+        self._stale_if_error = stale_if_error
+        self._max_stale = DEFAULT_MAX_STALE | (max_stale or {})
+        # Keys whose last value returned was stale, see get_stale_age()
+        self._stale = set()
+
+        # get_status() can only send the one signed query, so the fields that
+        # are not used are dropped from the response instead
+        self._status_fields = None
+        if status_fields:
+            self._status_fields = messages.compile_fields(status_fields)
+
+        # One fetch in flight per cache key, shared by all concurrent callers
+        self._flight = SingleFlight(timeout)
+
+
+    def _cached(self, cache, key, fetch, force=False):
+        """
+        Get a value from a cache, calling fetch() to refresh it when missing
+        or forced.  Concurrent callers for the same key share a single fetch.
+        With stale_if_error, the last value is returned if the fetch
+        fails and it is not older than max_stale, see get_stale_age().
+        Parameters:
+            cache (TLRUCache): The cache holding the value
+            key (str): The cache key
+            fetch (callable): Fetches the value from the Powerwall
+            force (bool): Skip the cache, default False
+        Returns:
+            The cached or fetched value
+        Raises:
+            TimeoutError: Waiting for another caller's fetch timed out
+        """
+        def load():
+            # Another caller may have just filled the cache
+            if not force:
+                with self._cache_lock:
+                    value = cache.get(key)
+                if value is not None:
+                    logger.debug("Using Cached %s", key)
+                    return value
+            value = fetch()
+            with self._cache_lock:
+                cache[key] = value
+                self._fetched[key] = (value, time.monotonic())
+            return value
+
+        if not force:
+            with self._cache_lock:
+                value = cache.get(key)
+            if value is not None:
+                logger.debug("Using Cached %s", key)
+                return value
+        try:
+            value = self._flight.do(key, load)
+        except (exceptions.TEDAPIException, OSError) as e:
+            # TimeoutError is an OSError, and the cooldown raises TEDAPIRateLimitedException
+            with self._cache_lock:
+                stale = self._fetched.get(key)
+            if force or not self._stale_if_error or stale is None:
+                raise
+            age = time.monotonic() - stale[1]
+            if age > self._max_stale.get(key.split('(')[0], 0):
+                raise
+            logger.warning("Using stale %s (%.1fs old) as fetching it failed: %r", key, age, e)
+            with self._cache_lock:
+                self._stale.add(key)
+            return stale[0]
+        with self._cache_lock:
+            self._stale.discard(key)
+        return value
+
+
+    def _ttu(self, default: float):
+        """
+        Get the function a cache uses to set when an entry expires
+        Parameters:
+            default (float): Expiration in seconds for functions not in expire
+        Returns:
+            callable: Takes the key, value and current time, and returns the
+                      time the entry expires
+        """
+        def ttu(key, value, now):
+            # pylint: disable=W0613 # method signature
+            return now + self._expire.get(key.split('(')[0], default)
+        return ttu
+
+
+    @staticmethod
+    def _cache_size(blocks: int) -> int:
+        """
+        Size of _cache for a number of battery blocks, which each have a
+        get_pw_vitals and a get_battery_block entry
+        """
+        return 8 + 2 * blocks
+
+
+    def _resize_cache(self, blocks: int) -> None:
+        """Grow _cache so per Powerwall entries never evict each other"""
+        size = self._cache_size(blocks)
+        with self._cache_lock:
+            if self._cache.maxsize >= size:
+                return
+            logger.debug("Resizing cache to %d entries for %d battery blocks", size, blocks)
+            cache = TLRUCache(maxsize=size, ttu=self._cache.ttu)
+            cache.update(self._cache.items())
+            self._cache = cache
+
+
+    def get_cache_age(self, key: str) -> float:
+        """
+        Get the age of the last value fetched for a key
+        Parameters:
+            key (str): The function name, with the DIN in parentheses for per
+                       Powerwall functions, e.g. "get_pw_vitals(din)"
+        Returns:
+            float: Age in seconds, or None if never fetched
+        """
+        with self._cache_lock:
+            fetched = self._fetched.get(key)
+        if fetched is None:
+            return None
+        return time.monotonic() - fetched[1]
+
+
+    def get_stale_age(self, key: str) -> float:
+        """
+        Get the age of the last value returned for a key, if it was a stale
+        value returned because fetching a fresh one failed
+        Parameters:
+            key (str): The function name, with the DIN in parentheses for per
+                       Powerwall functions, e.g. "get_pw_vitals(din)"
+        Returns:
+            float: Age in seconds, or None if the value was not stale
+        """
+        with self._cache_lock:
+            if key not in self._stale:
+                return None
+        return self.get_cache_age(key)
+
+
+    def get_metadata(self) -> dict:
+        """
+        Get the last system config and firmware fetched, to be saved and
+        passed to set_metadata() after a restart
+        Returns:
+            dict: Last value by function name from METADATA, without those
+                  not fetched yet
+        """
+        with self._cache_lock:
+            return {key: self._fetched[key][0] for key in METADATA if key in self._fetched}
+
 
-        # _cache used for all other API calls except get_din
-        self._cache = TTLCache(maxsize=16, ttl=cacheexpire)
+    def set_metadata(self, metadata: dict) -> None:
+        """
+        Fill the cache with metadata from get_metadata(), so the system can be
+        described before anything is fetched.  The values are returned until
+        they expire or clear() is called.
+        Parameters:
+            metadata (dict): Values by function name from METADATA
+        """
+        with self._cache_lock:
+            for key in METADATA:
+                if key in metadata:
+                    self._config[key] = metadata[key]
+        config = metadata.get('get_config') or {}
+        self._resize_cache(len(config.get('battery_blocks') or []))
 
-        self._locks = {}
-        for i in inspect.getmembers(self, predicate=inspect.ismethod):
-            self._locks[i[0]] = TimeoutRLock(timeout)
+
+    def clear(self) -> None:
+        """Drop every cached value, so each is fetched on its next call"""
+        with self._cache_lock:
+            self._config.clear()
+            self._cache.clear()
+
+
+    def get_fetch_stats(self) -> dict:
+        """
+        Get the number of fetches made from the Powerwall, and the number of
+        concurrent callers that shared one instead of making their own
+        Returns:
+            dict:
+                calls (int): Fetches made
+                coalesced (int): Callers that shared an in-flight fetch
+        """
+        return self._flight.get_stats()
 
 
     # TEDAPI Functions
@@ -354,44 +666,28 @@ class Powerwall3API:
             json.JSONDecodeError
             TEDAPIException
         """
-        with self._locks['get_config']:
-            if not force:
-                try:
-                    value = self._config["get_config"]
-                    logger.debug("Using Cached config")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Check Connection
             self._tesla.connect()
 
             # Fetch Configuration from Powerwall
             logger.debug("Get Configuration from Powerwall")
 
-            # Build Protobuf to fetch config
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.recipient.din = self._tesla.get_din()  # DIN of Powerwall
-            pb.message.config.send.num = 1
-            pb.message.config.send.file = "config.json"
-            pb.tail.value = 1
-
             r = self._tesla.post(
                 "tedapi/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('config'),
+                priority='config',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.config.recv.file.text
-            data = json.loads(payload)
+            data = messages.parse_config_response(r.content)
             logger.debug("Configuration: %s", data)
-            self._config["get_config"] = data
+            self._resize_cache(len(data.get('battery_blocks') or []))
             return data
 
+        return self._cached(self._config, "get_config", fetch, force)
+
 
     def get_status(self, force=False):
         """
@@ -444,49 +740,32 @@ class Powerwall3API:
             json.JSONDecodeError
             TEDAPIException
         """
-        with self._locks['get_status']:
-            if not force:
-                try:
-                    value = self._cache["get_status"]
-                    logger.debug("Using Cached status")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Check Connection
             self._tesla.connect()
 
             # Fetch Current Status from Powerwall
             logger.debug("Get Status from Powerwall")
 
-            # Build Protobuf to fetch status
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.recipient.din = self._tesla.get_din()  # DIN of Powerwall
-            pb.message.payload.send.num = 2
-            pb.message.payload.send.payload.value = 1
-            # pylint: disable=C0301
-            pb.message.payload.send.payload.text = " query DeviceControllerQuery {\n  control {\n    systemStatus {\n        nominalFullPackEnergyWh\n        nominalEnergyRemainingWh\n    }\n    islanding {\n        customerIslandMode\n        contactorClosed\n        microGridOK\n        gridOK\n    }\n    meterAggregates {\n      location\n      realPowerW\n    }\n    alerts {\n      active\n    },\n    siteShutdown {\n      isShutDown\n      reasons\n    }\n    batteryBlocks {\n      din\n      disableReasons\n    }\n    pvInverters {\n      din\n      disableReasons\n    }\n  }\n  system {\n    time\n    sitemanagerStatus {\n      isRunning\n    }\n    updateUrgencyCheck  {\n      urgency\n      version {\n        version\n        gitHash\n      }\n      timestamp\n    }\n  }\n  neurio {\n    isDetectingWiredMeters\n    readings {\n      serial\n      dataRead {\n        voltageV\n        realPowerW\n        reactivePowerVAR\n        currentA\n      }\n      timestamp\n    }\n    pairings {\n      serial\n      shortId\n      status\n      errors\n      macAddress\n      isWired\n      modbusPort\n      modbusId\n      lastUpdateTimestamp\n    }\n  }\n  pw3Can {\n    firmwareUpdate {\n      isUpdating\n      progress {\n         updating\n         numSteps\n         currentStep\n         currentStepProgress\n         progress\n      }\n    }\n  }\n  esCan {\n    bus {\n      PVAC {\n        packagePartNumber\n        packageSerialNumber\n        subPackagePartNumber\n        subPackageSerialNumber\n        PVAC_Status {\n          isMIA\n          PVAC_Pout\n          PVAC_State\n          PVAC_Vout\n          PVAC_Fout\n        }\n        PVAC_InfoMsg {\n          PVAC_appGitHash\n        }\n        PVAC_Logging {\n          isMIA\n          PVAC_PVCurrent_A\n          PVAC_PVCurrent_B\n          PVAC_PVCurrent_C\n          PVAC_PVCurrent_D\n          PVAC_PVMeasuredVoltage_A\n          PVAC_PVMeasuredVoltage_B\n          PVAC_PVMeasuredVoltage_C\n          PVAC_PVMeasuredVoltage_D\n          PVAC_VL1Ground\n          PVAC_VL2Ground\n        }\n        alerts {\n          isComplete\n          isMIA\n          active\n        }\n      }\n      PINV {\n        PINV_Status {\n          isMIA\n          PINV_Fout\n          PINV_Pout\n          PINV_Vout\n          PINV_State\n          PINV_GridState\n        }\n        PINV_AcMeasurements {\n          isMIA\n          PINV_VSplit1\n          PINV_VSplit2\n        }\n        PINV_PowerCapability {\n          isComplete\n          isMIA\n          PINV_Pnom\n        }\n        alerts {\n          isComplete\n          isMIA\n          active\n        }\n      }\n      PVS {\n        PVS_Status {\n          isMIA\n          PVS_State\n          PVS_vLL\n          PVS_StringA_Connected\n          PVS_StringB_Connected\n          PVS_StringC_Connected\n          PVS_StringD_Connected\n          PVS_SelfTestState\n        }\n        alerts {\n          isComplete\n          isMIA\n          active\n        }\n      }\n      THC {\n        packagePartNumber\n        packageSerialNumber\n        THC_InfoMsg {\n          isComplete\n          isMIA\n          THC_appGitHash\n        }\n        THC_Logging {\n          THC_LOG_PW_2_0_EnableLineState\n        }\n      }\n      POD {\n        POD_EnergyStatus {\n          isMIA\n          POD_nom_energy_remaining\n          POD_nom_full_pack_energy\n        }\n        POD_InfoMsg {\n            POD_appGitHash\n        }\n      }\n      MSA {\n        packagePartNumber\n        packageSerialNumber\n        MSA_InfoMsg {\n          isMIA\n          MSA_appGitHash\n          MSA_assemblyId\n        }\n        METER_Z_AcMeasurements {\n          isMIA\n          lastRxTime\n          METER_Z_CTA_InstRealPower\n          METER_Z_CTA_InstReactivePower\n          METER_Z_CTA_I\n          METER_Z_VL1G\n          METER_Z_CTB_InstRealPower\n          METER_Z_CTB_InstReactivePower\n          METER_Z_CTB_I\n          METER_Z_VL2G\n        }\n        MSA_Status {\n          lastRxTime\n        }\n      }\n      SYNC {\n        packagePartNumber\n        packageSerialNumber\n        SYNC_InfoMsg {\n          isMIA\n          SYNC_appGitHash\n        }\n        METER_X_AcMeasurements {\n          isMIA\n          isComplete\n          lastRxTime\n          METER_X_CTA_InstRealPower\n          METER_X_CTA_InstReactivePower\n          METER_X_CTA_I\n          METER_X_VL1N\n          METER_X_CTB_InstRealPower\n          METER_X_CTB_InstReactivePower\n          METER_X_CTB_I\n          METER_X_VL2N\n          METER_X_CTC_InstRealPower\n          METER_X_CTC_InstReactivePower\n          METER_X_CTC_I\n          METER_X_VL3N\n        }\n        METER_Y_AcMeasurements {\n          isMIA\n          isComplete\n          lastRxTime\n          METER_Y_CTA_InstRealPower\n          METER_Y_CTA_InstReactivePower\n          METER_Y_CTA_I\n          METER_Y_VL1N\n          METER_Y_CTB_InstRealPower\n          METER_Y_CTB_InstReactivePower\n          METER_Y_CTB_I\n          METER_Y_VL2N\n          METER_Y_CTC_InstRealPower\n          METER_Y_CTC_InstReactivePower\n          METER_Y_CTC_I\n          METER_Y_VL3N\n        }\n        SYNC_Status {\n          lastRxTime\n        }\n      }\n      ISLANDER {\n        ISLAND_GridConnection {\n          ISLAND_GridConnected\n          isComplete\n        }\n        ISLAND_AcMeasurements {\n          ISLAND_VL1N_Main\n          ISLAND_FreqL1_Main\n          ISLAND_VL2N_Main\n          ISLAND_FreqL2_Main\n          ISLAND_VL3N_Main\n          ISLAND_FreqL3_Main\n          ISLAND_VL1N_Load\n          ISLAND_FreqL1_Load\n          ISLAND_VL2N_Load\n          ISLAND_FreqL2_Load\n          ISLAND_VL3N_Load\n          ISLAND_FreqL3_Load\n          ISLAND_GridState\n          lastRxTime\n          isComplete\n          isMIA\n        }\n      }\n    }\n    enumeration {\n      inProgress\n      numACPW\n      numPVI\n    }\n    firmwareUpdate {\n      isUpdating\n      powerwalls {\n        updating\n        numSteps\n        currentStep\n        currentStepProgress\n        progress\n      }\n      msa {\n        updating\n        numSteps\n        currentStep\n        currentStepProgress\n        progress\n      }\n      sync {\n        updating\n        numSteps\n        currentStep\n        currentStepProgress\n        progress\n      }\n      pvInverters {\n        updating\n        numSteps\n        currentStep\n        currentStepProgress\n        progress\n      }\n    }\n    phaseDetection {\n      inProgress\n      lastUpdateTimestamp\n      powerwalls {\n        din\n        progress\n        phase\n      }\n    }\n    inverterSelfTests {\n      isRunning\n      isCanceled\n      pinvSelfTestsResults {\n        din\n        overall {\n          status\n          test\n          summary\n          setMagnitude\n          setTime\n          tripMagnitude\n          tripTime\n          accuracyMagnitude\n          accuracyTime\n          currentMagnitude\n          timestamp\n          lastError\n        }\n        testResults {\n          status\n          test\n          summary\n          setMagnitude\n          setTime\n          tripMagnitude\n          tripTime\n          accuracyMagnitude\n          accuracyTime\n          currentMagnitude\n          timestamp\n          lastError\n        }\n      }\n    }\n  }\n}\n"
-            pb.message.payload.send.code = b'0\201\206\002A\024\261\227\245\177\255\265\272\321r\032\250\275j\305\030\2300\266\022B\242\264pO\262\024vd\267\316\032\f\376\322V\001\f\177*\366\345\333g_/`\v\026\225_qc\023$\323\216y\276~\335A1\022x\002Ap\a_\264\037]\304>\362\356\005\245V\301\177*\b\307\016\246]\037\202\242\353I~\332\317\021\336\006\033q\317\311\264\315\374\036\365s\272\225\215#o!\315z\353\345z\226\365\341\f\265\256r\373\313/\027\037'
-            # pylint: enable=C0301
-            pb.message.payload.send.b.value = "{}"
-            pb.tail.value = 1
-
             r = self._tesla.post(
                 "tedapi/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('status'),
+                priority='status',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.payload.recv.text
-            data = json.loads(payload)
+            data = messages.parse_query_response(r.content)
+            if self._status_fields is not None:
+                try:
+                    data = messages.project(data, self._status_fields)
+                except (KeyError, TypeError) as e:
+                    logger.debug("Status is missing field %s, keeping full status", e)
             logger.debug("Status: %s", data)
-            self._cache["get_status"] = data
             return data
 
+        return self._cached(self._cache, "get_status", fetch, force)
+
 
     def get_device_controller(self, force=False):
         """
@@ -508,49 +787,27 @@ class Powerwall3API:
             json.JSONDecodeError
             TEDAPIException
         """
-        with self._locks['get_device_controller']:
-            if not force:
-                try:
-                    value = self._cache["get_device_controller"]
-                    logger.debug("Using Cached controller")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Check Connection
             self._tesla.connect()
 
             # Fetch Current Status from Powerwall
             logger.debug("Get controller data from Powerwall")
 
-            # Build Protobuf to fetch controller data
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.recipient.din = self._tesla.get_din()  # DIN of Powerwall
-            pb.message.payload.send.num = 2
-            pb.message.payload.send.payload.value = 1
-            # pylint: disable=C0301
-            pb.message.payload.send.payload.text = 'query DeviceControllerQuery($msaComp:ComponentFilter$msaSignals:[String!]){control{systemStatus{nominalFullPackEnergyWh nominalEnergyRemainingWh}islanding{customerIslandMode contactorClosed microGridOK gridOK disableReasons}meterAggregates{location realPowerW}alerts{active}siteShutdown{isShutDown reasons}batteryBlocks{din disableReasons}pvInverters{din disableReasons}}system{time supportMode{remoteService{isEnabled expiryTime sessionId}}sitemanagerStatus{isRunning}updateUrgencyCheck{urgency version{version gitHash}timestamp}}neurio{isDetectingWiredMeters readings{firmwareVersion serial dataRead{voltageV realPowerW reactivePowerVAR currentA}timestamp}pairings{serial shortId status errors macAddress hostname isWired modbusPort modbusId lastUpdateTimestamp}}teslaRemoteMeter{meters{din reading{timestamp firmwareVersion ctReadings{voltageV realPowerW reactivePowerVAR energyExportedWs energyImportedWs currentA}}firmwareUpdate{updating numSteps currentStep currentStepProgress progress}}detectedWired{din serialPort}}pw3Can{firmwareUpdate{isUpdating progress{updating numSteps currentStep currentStepProgress progress}}enumeration{inProgress}}esCan{bus{PVAC{packagePartNumber packageSerialNumber subPackagePartNumber subPackageSerialNumber PVAC_Status{isMIA PVAC_Pout PVAC_State PVAC_Vout PVAC_Fout}PVAC_InfoMsg{PVAC_appGitHash}PVAC_Logging{isMIA PVAC_PVCurrent_A PVAC_PVCurrent_B PVAC_PVCurrent_C PVAC_PVCurrent_D PVAC_PVMeasuredVoltage_A PVAC_PVMeasuredVoltage_B PVAC_PVMeasuredVoltage_C PVAC_PVMeasuredVoltage_D PVAC_VL1Ground PVAC_VL2Ground}alerts{isComplete isMIA active}}PINV{PINV_Status{isMIA PINV_Fout PINV_Pout PINV_Vout PINV_State PINV_GridState}PINV_AcMeasurements{isMIA PINV_VSplit1 PINV_VSplit2}PINV_PowerCapability{isComplete isMIA PINV_Pnom}alerts{isComplete isMIA active}}PVS{PVS_Status{isMIA PVS_State PVS_vLL PVS_StringA_Connected PVS_StringB_Connected PVS_StringC_Connected PVS_StringD_Connected PVS_SelfTestState}PVS_Logging{PVS_numStringsLockoutBits PVS_sbsComplete}alerts{isComplete isMIA active}}THC{packagePartNumber packageSerialNumber THC_InfoMsg{isComplete isMIA THC_appGitHash}THC_Logging{THC_LOG_PW_2_0_EnableLineState}}POD{POD_EnergyStatus{isMIA POD_nom_energy_remaining POD_nom_full_pack_energy}POD_InfoMsg{POD_appGitHash}}SYNC{packagePartNumber packageSerialNumber SYNC_InfoMsg{isMIA SYNC_appGitHash SYNC_assemblyId}METER_X_AcMeasurements{isMIA isComplete METER_X_CTA_InstRealPower METER_X_CTA_InstReactivePower METER_X_CTA_I METER_X_VL1N METER_X_CTB_InstRealPower METER_X_CTB_InstReactivePower METER_X_CTB_I METER_X_VL2N METER_X_CTC_InstRealPower METER_X_CTC_InstReactivePower METER_X_CTC_I METER_X_VL3N}METER_Y_AcMeasurements{isMIA isComplete METER_Y_CTA_InstRealPower METER_Y_CTA_InstReactivePower METER_Y_CTA_I METER_Y_VL1N METER_Y_CTB_InstRealPower METER_Y_CTB_InstReactivePower METER_Y_CTB_I METER_Y_VL2N METER_Y_CTC_InstRealPower METER_Y_CTC_InstReactivePower METER_Y_CTC_I METER_Y_VL3N}}ISLANDER{ISLAND_GridConnection{ISLAND_GridConnected isComplete}ISLAND_AcMeasurements{ISLAND_VL1N_Main ISLAND_FreqL1_Main ISLAND_VL2N_Main ISLAND_FreqL2_Main ISLAND_VL3N_Main ISLAND_FreqL3_Main ISLAND_VL1N_Load ISLAND_FreqL1_Load ISLAND_VL2N_Load ISLAND_FreqL2_Load ISLAND_VL3N_Load ISLAND_FreqL3_Load ISLAND_GridState isComplete isMIA}}}enumeration{inProgress numACPW numPVI}firmwareUpdate{isUpdating powerwalls{updating numSteps currentStep currentStepProgress progress}msa{updating numSteps currentStep currentStepProgress progress}msa1{updating numSteps currentStep currentStepProgress progress}sync{updating numSteps currentStep currentStepProgress progress}pvInverters{updating numSteps currentStep currentStepProgress progress}}phaseDetection{inProgress lastUpdateTimestamp powerwalls{din progress phase}}inverterSelfTests{isRunning isCanceled pinvSelfTestsResults{din overall{status test summary setMagnitude setTime tripMagnitude tripTime accuracyMagnitude accuracyTime currentMagnitude timestamp lastError}testResults{status test summary setMagnitude setTime tripMagnitude tripTime accuracyMagnitude accuracyTime currentMagnitude timestamp lastError}}}}components{msa:components(filter:$msaComp){partNumber serialNumber signals(names:$msaSignals){name value textValue boolValue timestamp}activeAlerts{name}}}ieee20305{longFormDeviceID polledResources{url name pollRateSeconds lastPolledTimestamp}controls{defaultControl{mRID setGradW opModEnergize opModMaxLimW opModImpLimW opModExpLimW opModGenLimW opModLoadLimW}activeControls{opModEnergize opModMaxLimW opModImpLimW opModExpLimW opModGenLimW opModLoadLimW}}registration{dateTimeRegistered pin}}}'
-            pb.message.payload.send.code = b'0\x81\x87\x02B\x01A\x95\x12\xe3B\xd1\xca\x1a\xd3\x00\xf6}\x0bE@/\x9a\x9f\xc0\r\x06%\xac,\x0ej!)\nd\xef\xe67\x8b\xafb\xd7\xf8&\x0b.\xc1\xac\xd9!\x1f\xd6\x83\xffkIm\xf3\\J\xd8\xeeiTY\xde\x7f\xc5xR\x02A\x1dC\x03H\xfb8"\xb0\xe4\xd6\x18\xde\x11\xc45\xb2\xa9VB\xa6J\x8f\x08\x9d\xba\x86\xf1 W\xcdJ\x8c\x02*\x05\x12\xcb{<\x9b\xc8g\xc9\x9d9\x8bR\xb3\x89\xb8\xf1\xf1\x0f\x0e\x16E\xed\xd7\xbf\xd5&)\x92.\x12'
-            pb.message.payload.send.b.value = '{"msaComp":{"types" :["PVS","PVAC", "TESYNC", "TEPINV", "TETHC", "STSTSM",  "TEMSA", "TEPINV" ]},\n\t"msaSignals":[\n\t"MSA_pcbaId",\n\t"MSA_usageId",\n\t"MSA_appGitHash",\n\t"MSA_HeatingRateOccurred",\n\t"THC_AmbientTemp",\n\t"METER_Z_CTA_InstRealPower",\n\t"METER_Z_CTA_InstReactivePower",\n\t"METER_Z_CTA_I",\n\t"METER_Z_VL1G",\n\t"METER_Z_CTB_InstRealPower",\n\t"METER_Z_CTB_InstReactivePower",\n\t"METER_Z_CTB_I",\n\t"METER_Z_VL2G"]}'
-            # pylint: enable=C0301
-            pb.tail.value = 1
-
             r = self._tesla.post(
                 "tedapi/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('device_controller'),
+                priority='config',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.payload.recv.text
-            data = json.loads(payload)
+            data = messages.parse_query_response(r.content)
             logger.debug("Controller: %s", data)
-            self._cache["get_device_controller"] = data
             return data
 
+        return self._cached(self._cache, "get_device_controller", fetch, force)
+
 
     def get_firmware_version(self, force=False, details=False):
         """
@@ -582,71 +839,29 @@ class Powerwall3API:
             json.JSONDecodeError
             TEDAPIException
         """
-        with self._locks['get_firmware_version']:
-            payload = None
+        def fetch():
+            # Check Connection
+            self._tesla.connect()
 
-            if not force:
-                try:
-                    payload = self._config["get_firmware_version"]
-                    logger.debug("Using Cached firmware")
-                except Exception: # pylint: disable=W0718
-                    pass
-
-            if payload is None:
-                # Check Connection
-                self._tesla.connect()
-
-                # Fetch Current Status from Powerwall
-                logger.debug("Get Firmware Version from Powerwall")
-
-                # Build Protobuf to fetch status
-                pb = tedapi_pb2.Message() # pylint: disable=E1101
-                pb.message.deliveryChannel = 1
-                pb.message.sender.local = 1
-                pb.message.recipient.din = self._tesla.get_din()  # DIN of Powerwall
-                pb.message.firmware.request = ""
-                pb.tail.value = 1
-
-                r = self._tesla.post(
-                    "tedapi/v1",
-                    headers={'Content-type': 'application/octet-string'},
-                    data=pb.SerializeToString())
-
-                # Decode response
-                pb = tedapi_pb2.Message() # pylint: disable=E1101
-                pb.ParseFromString(r.content)
-                payload = {
-                    "gateway": {
-                        "partNumber": pb.message.firmware.system.gateway.partNumber,
-                        "serialNumber": pb.message.firmware.system.gateway.serialNumber
-                    },
-                    "din": pb.message.firmware.system.din,
-                    "version": {
-                        "text": pb.message.firmware.system.version.text,
-                        "githash": pb.message.firmware.system.version.githash
-                    },
-                    "five": pb.message.firmware.system.five,
-                    "six": pb.message.firmware.system.six,
-                    "wireless": {
-                        "device": []
-                    }
-                }
-                try:
-                    for device in pb.message.firmware.system.wireless.device:
-                        payload["wireless"]["device"].append({
-                            "company": device.company.value,
-                            "model": device.model.value,
-                            "fcc_id": device.fcc_id.value,
-                            "ic": device.ic.value
-                        })
-                except KeyError as e:
-                    logger.debug("Error parsing wireless devices: %s", e)
-                logger.debug("Firmware Version: %s", payload)
-                self._config["get_firmware_version"] = payload
-
-            if details:
-                return payload
-            return payload["version"]["text"]
+            # Fetch Current Status from Powerwall
+            logger.debug("Get Firmware Version from Powerwall")
+
+            r = self._tesla.post(
+                "tedapi/v1",
+                headers={'Content-type': 'application/octet-string'},
+                data=self._tesla.build_request('firmware'),
+                priority='config',
+                idempotent=True)
+
+            # Decode response
+            payload = messages.parse_firmware_response(r.content)
+            logger.debug("Firmware Version: %s", payload)
+            return payload
+
+        payload = self._cached(self._config, "get_firmware_version", fetch, force)
+        if details:
+            return payload
+        return payload["version"]["text"]
 
 
     def get_components(self, force=False):
@@ -682,48 +897,26 @@ class Powerwall3API:
         if not self._tesla.is_powerwall3():
             raise exceptions.TEDAPIPowerwallVersionException()
 
-        with self._locks['get_components']:
-            if not force:
-                try:
-                    value = self._cache["get_components"]
-                    logger.debug("Using Cached compopnents")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Check Connection
             self._tesla.connect()
 
             # Fetch Configuration from Powerwall
             logger.debug("Get PW3 Components from Powerwall")
 
-            # Build Protobuf to fetch config
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.recipient.din = self._tesla.get_din()  # DIN of Powerwall
-            pb.message.payload.send.num = 2
-            pb.message.payload.send.payload.value = 1
-            # pylint: disable=C0301
-            pb.message.payload.send.payload.text = " query ComponentsQuery (\n  $pchComponentsFilter: ComponentFilter,\n  $pchSignalNames: [String!],\n  $pwsComponentsFilter: ComponentFilter,\n  $pwsSignalNames: [String!],\n  $bmsComponentsFilter: ComponentFilter,\n  $bmsSignalNames: [String!],\n  $hvpComponentsFilter: ComponentFilter,\n  $hvpSignalNames: [String!],\n  $baggrComponentsFilter: ComponentFilter,\n  $baggrSignalNames: [String!],\n  ) {\n  # TODO STST-57686: Introduce GraphQL fragments to shorten\n  pw3Can {\n    firmwareUpdate {\n      isUpdating\n      progress {\n         updating\n         numSteps\n         currentStep\n         currentStepProgress\n         progress\n      }\n    }\n  }\n  components {\n    pws: components(filter: $pwsComponentsFilter) {\n      signals(names: $pwsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    pch: components(filter: $pchComponentsFilter) {\n      signals(names: $pchSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    bms: components(filter: $bmsComponentsFilter) {\n      signals(names: $bmsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    hvp: components(filter: $hvpComponentsFilter) {\n      partNumber\n      serialNumber\n      signals(names: $hvpSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    baggr: components(filter: $baggrComponentsFilter) {\n      signals(names: $baggrSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n  }\n}\n"
-            pb.message.payload.send.code = b'0\201\210\002B\000\270q\354>\243m\325p\371S\253\231\346~:\032\216~\242\263\207\017L\273O\203u\241\270\333w\233\354\276\246h\262\243\255\261\007\202D\277\353x\023O\022\303\216\264\010-\'i6\360>B\237\236\304\244m\002B\001\023Pk\033)\277\236\342R\264\247g\260u\036\023\3662\354\242\353\035\221\234\027\245\321J\342\345\037q\262O\3446-\353\315m1\237zai0\341\207C4\307\300Z\177@h\335\327\0239\252f\n\206W'
-            pb.message.payload.send.b.value = "{\"pwsComponentsFilter\":{\"types\":[\"PW3SAF\"]},\"pwsSignalNames\":[\"PWS_SelfTest\",\"PWS_PeImpTestState\",\"PWS_PvIsoTestState\",\"PWS_RelaySelfTest_State\",\"PWS_MciTestState\",\"PWS_appGitHash\",\"PWS_ProdSwitch_State\"],\"pchComponentsFilter\":{\"types\":[\"PCH\"]},\"pchSignalNames\":[\"PCH_State\",\"PCH_PvState_A\",\"PCH_PvState_B\",\"PCH_PvState_C\",\"PCH_PvState_D\",\"PCH_PvState_E\",\"PCH_PvState_F\",\"PCH_AcFrequency\",\"PCH_AcVoltageAB\",\"PCH_AcVoltageAN\",\"PCH_AcVoltageBN\",\"PCH_packagePartNumber_1_7\",\"PCH_packagePartNumber_8_14\",\"PCH_packagePartNumber_15_20\",\"PCH_packageSerialNumber_1_7\",\"PCH_packageSerialNumber_8_14\",\"PCH_PvVoltageA\",\"PCH_PvVoltageB\",\"PCH_PvVoltageC\",\"PCH_PvVoltageD\",\"PCH_PvVoltageE\",\"PCH_PvVoltageF\",\"PCH_PvCurrentA\",\"PCH_PvCurrentB\",\"PCH_PvCurrentC\",\"PCH_PvCurrentD\",\"PCH_PvCurrentE\",\"PCH_PvCurrentF\",\"PCH_BatteryPower\",\"PCH_AcRealPowerAB\",\"PCH_SlowPvPowerSum\",\"PCH_AcMode\",\"PCH_AcFrequency\",\"PCH_DcdcState_A\",\"PCH_DcdcState_B\",\"PCH_appGitHash\"],\"bmsComponentsFilter\":{\"types\":[\"PW3BMS\"]},\"bmsSignalNames\":[\"BMS_nominalEnergyRemaining\",\"BMS_nominalFullPackEnergy\",\"BMS_appGitHash\"],\"hvpComponentsFilter\":{\"types\":[\"PW3HVP\"]},\"hvpSignalNames\":[\"HVP_State\",\"HVP_appGitHash\"],\"baggrComponentsFilter\":{\"types\":[\"BAGGR\"]},\"baggrSignalNames\":[\"BAGGR_State\",\"BAGGR_OperationRequest\",\"BAGGR_NumBatteriesConnected\",\"BAGGR_NumBatteriesPresent\",\"BAGGR_NumBatteriesExpected\",\"BAGGR_LOG_BattConnectionStatus0\",\"BAGGR_LOG_BattConnectionStatus1\",\"BAGGR_LOG_BattConnectionStatus2\",\"BAGGR_LOG_BattConnectionStatus3\"]}"
-            # pylint: enable=C0301
-            pb.tail.value = 1
-
             r = self._tesla.post("tedapi/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('components'),
+                priority='config',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.payload.recv.text
-            components = json.loads(payload)
+            components = messages.parse_query_response(r.content)
             logger.debug("Components: %s", components)
-            self._cache["get_components"] = components
             return components
 
+        return self._cached(self._cache, "get_components", fetch, force)
+
 
     def get_battery_block(self, din, force=False):
         """
@@ -738,105 +931,48 @@ class Powerwall3API:
         if not self._tesla.is_powerwall3():
             raise exceptions.TEDAPIPowerwallVersionException()
 
-        key = f"get_battery_block({din})"
-
-        with self._locks['get_battery_block']:
-            if key not in self._locks:
-                self._locks[key] = TimeoutRLock(timeout=self._timeout)
-
-        with self._locks[key]:
-            if not force:
-                try:
-                    value = self._cache[key]
-                    logger.debug("Using Cached battery_block")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Fetch Battery Block from Powerwall
             logger.debug("Get Battery Block from Powerwall (%s)", din)
 
-            # Build Protobuf to fetch config
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.sender.din = self._tesla.get_din() # DIN of Primary Powerwall 3 / System
-            pb.message.recipient.din = din   # DIN of Powerwall of Interest
-            pb.message.payload.send.num = 2
-            pb.message.payload.send.payload.value = 1
-            # pylint: disable=C0301
-            pb.message.payload.send.payload.text = " query ComponentsQuery (\n  $pchComponentsFilter: ComponentFilter,\n  $pchSignalNames: [String!],\n  $pwsComponentsFilter: ComponentFilter,\n  $pwsSignalNames: [String!],\n  $bmsComponentsFilter: ComponentFilter,\n  $bmsSignalNames: [String!],\n  $hvpComponentsFilter: ComponentFilter,\n  $hvpSignalNames: [String!],\n  $baggrComponentsFilter: ComponentFilter,\n  $baggrSignalNames: [String!],\n  ) {\n  # TODO STST-57686: Introduce GraphQL fragments to shorten\n  pw3Can {\n    firmwareUpdate {\n      isUpdating\n      progress {\n         updating\n         numSteps\n         currentStep\n         currentStepProgress\n         progress\n      }\n    }\n  }\n  components {\n    pws: components(filter: $pwsComponentsFilter) {\n      signals(names: $pwsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    pch: components(filter: $pchComponentsFilter) {\n      signals(names: $pchSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    bms: components(filter: $bmsComponentsFilter) {\n      signals(names: $bmsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    hvp: components(filter: $hvpComponentsFilter) {\n      partNumber\n      serialNumber\n      signals(names: $hvpSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    baggr: components(filter: $baggrComponentsFilter) {\n      signals(names: $baggrSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n  }\n}\n"
-            pb.message.payload.send.code = b'0\201\210\002B\000\270q\354>\243m\325p\371S\253\231\346~:\032\216~\242\263\207\017L\273O\203u\241\270\333w\233\354\276\246h\262\243\255\261\007\202D\277\353x\023O\022\303\216\264\010-\'i6\360>B\237\236\304\244m\002B\001\023Pk\033)\277\236\342R\264\247g\260u\036\023\3662\354\242\353\035\221\234\027\245\321J\342\345\037q\262O\3446-\353\315m1\237zai0\341\207C4\307\300Z\177@h\335\327\0239\252f\n\206W'
-            pb.message.payload.send.b.value = "{\"pwsComponentsFilter\":{\"types\":[\"PW3SAF\"]},\"pwsSignalNames\":[\"PWS_SelfTest\",\"PWS_PeImpTestState\",\"PWS_PvIsoTestState\",\"PWS_RelaySelfTest_State\",\"PWS_MciTestState\",\"PWS_appGitHash\",\"PWS_ProdSwitch_State\"],\"pchComponentsFilter\":{\"types\":[\"PCH\"]},\"pchSignalNames\":[\"PCH_State\",\"PCH_PvState_A\",\"PCH_PvState_B\",\"PCH_PvState_C\",\"PCH_PvState_D\",\"PCH_PvState_E\",\"PCH_PvState_F\",\"PCH_AcFrequency\",\"PCH_AcVoltageAB\",\"PCH_AcVoltageAN\",\"PCH_AcVoltageBN\",\"PCH_packagePartNumber_1_7\",\"PCH_packagePartNumber_8_14\",\"PCH_packagePartNumber_15_20\",\"PCH_packageSerialNumber_1_7\",\"PCH_packageSerialNumber_8_14\",\"PCH_PvVoltageA\",\"PCH_PvVoltageB\",\"PCH_PvVoltageC\",\"PCH_PvVoltageD\",\"PCH_PvVoltageE\",\"PCH_PvVoltageF\",\"PCH_PvCurrentA\",\"PCH_PvCurrentB\",\"PCH_PvCurrentC\",\"PCH_PvCurrentD\",\"PCH_PvCurrentE\",\"PCH_PvCurrentF\",\"PCH_BatteryPower\",\"PCH_AcRealPowerAB\",\"PCH_SlowPvPowerSum\",\"PCH_AcMode\",\"PCH_AcFrequency\",\"PCH_DcdcState_A\",\"PCH_DcdcState_B\",\"PCH_appGitHash\"],\"bmsComponentsFilter\":{\"types\":[\"PW3BMS\"]},\"bmsSignalNames\":[\"BMS_nominalEnergyRemaining\",\"BMS_nominalFullPackEnergy\",\"BMS_appGitHash\"],\"hvpComponentsFilter\":{\"types\":[\"PW3HVP\"]},\"hvpSignalNames\":[\"HVP_State\",\"HVP_appGitHash\"],\"baggrComponentsFilter\":{\"types\":[\"BAGGR\"]},\"baggrSignalNames\":[\"BAGGR_State\",\"BAGGR_OperationRequest\",\"BAGGR_NumBatteriesConnected\",\"BAGGR_NumBatteriesPresent\",\"BAGGR_NumBatteriesExpected\",\"BAGGR_LOG_BattConnectionStatus0\",\"BAGGR_LOG_BattConnectionStatus1\",\"BAGGR_LOG_BattConnectionStatus2\",\"BAGGR_LOG_BattConnectionStatus3\"]}"
-            # pylint: enable=C0301
-            pb.tail.value = 2
-
             r = self._tesla.post(
                 f"tedapi/device/{din}/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('components', din),
+                priority='config',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.config.recv.file.text
-            data = json.loads(payload)
+            data = messages.parse_config_response(r.content)
             logger.debug("Configuration: %s", data)
-            self._cache[key] = data
             return data
 
+        return self._cached(self._cache, f"get_battery_block({din})", fetch, force)
+
 
     def get_pw_vitals(self, din, force=False):
         """
         Get Powerwall 3 Battery Vitals Data
         """
-        key = f"get_pw_vitals({din})"
-
-        with self._locks['get_pw_vitals']:
-            if key not in self._locks:
-                self._locks[key] = TimeoutRLock(timeout=self._timeout)
-
-        with self._locks[key]:
-            if not force:
-                try:
-                    value = self._cache[key]
-                    logger.debug("Using Cached pw_vitals")
-                    return value
-                except Exception: # pylint: disable=W0718
-                    pass
-
+        def fetch():
             # Check Connection
             self._tesla.connect()
 
             # Fetch Device ComponentsQuery from each Powerwall
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.message.deliveryChannel = 1
-            pb.message.sender.local = 1
-            pb.message.sender.din = self._tesla.get_din() # DIN of Primary Powerwall 3 / System
-            pb.message.recipient.din = din   # DIN of Powerwall of Interest
-            pb.message.payload.send.num = 2
-            pb.message.payload.send.payload.value = 1
-            # pylint: disable=C0301
-            pb.message.payload.send.payload.text = " query ComponentsQuery (\n  $pchComponentsFilter: ComponentFilter,\n  $pchSignalNames: [String!],\n  $pwsComponentsFilter: ComponentFilter,\n  $pwsSignalNames: [String!],\n  $bmsComponentsFilter: ComponentFilter,\n  $bmsSignalNames: [String!],\n  $hvpComponentsFilter: ComponentFilter,\n  $hvpSignalNames: [String!],\n  $baggrComponentsFilter: ComponentFilter,\n  $baggrSignalNames: [String!],\n  ) {\n  # TODO STST-57686: Introduce GraphQL fragments to shorten\n  pw3Can {\n    firmwareUpdate {\n      isUpdating\n      progress {\n         updating\n         numSteps\n         currentStep\n         currentStepProgress\n         progress\n      }\n    }\n  }\n  components {\n    pws: components(filter: $pwsComponentsFilter) {\n      signals(names: $pwsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    pch: components(filter: $pchComponentsFilter) {\n      signals(names: $pchSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    bms: components(filter: $bmsComponentsFilter) {\n      signals(names: $bmsSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    hvp: components(filter: $hvpComponentsFilter) {\n      partNumber\n      serialNumber\n      signals(names: $hvpSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n    baggr: components(filter: $baggrComponentsFilter) {\n      signals(names: $baggrSignalNames) {\n        name\n        value\n        textValue\n        boolValue\n        timestamp\n      }\n      activeAlerts {\n        name\n      }\n    }\n  }\n}\n"
-            pb.message.payload.send.code = b'0\201\210\002B\000\270q\354>\243m\325p\371S\253\231\346~:\032\216~\242\263\207\017L\273O\203u\241\270\333w\233\354\276\246h\262\243\255\261\007\202D\277\353x\023O\022\303\216\264\010-\'i6\360>B\237\236\304\244m\002B\001\023Pk\033)\277\236\342R\264\247g\260u\036\023\3662\354\242\353\035\221\234\027\245\321J\342\345\037q\262O\3446-\353\315m1\237zai0\341\207C4\307\300Z\177@h\335\327\0239\252f\n\206W'
-            pb.message.payload.send.b.value = "{\"pwsComponentsFilter\":{\"types\":[\"PW3SAF\"]},\"pwsSignalNames\":[\"PWS_SelfTest\",\"PWS_PeImpTestState\",\"PWS_PvIsoTestState\",\"PWS_RelaySelfTest_State\",\"PWS_MciTestState\",\"PWS_appGitHash\",\"PWS_ProdSwitch_State\"],\"pchComponentsFilter\":{\"types\":[\"PCH\"]},\"pchSignalNames\":[\"PCH_State\",\"PCH_PvState_A\",\"PCH_PvState_B\",\"PCH_PvState_C\",\"PCH_PvState_D\",\"PCH_PvState_E\",\"PCH_PvState_F\",\"PCH_AcFrequency\",\"PCH_AcVoltageAB\",\"PCH_AcVoltageAN\",\"PCH_AcVoltageBN\",\"PCH_packagePartNumber_1_7\",\"PCH_packagePartNumber_8_14\",\"PCH_packagePartNumber_15_20\",\"PCH_packageSerialNumber_1_7\",\"PCH_packageSerialNumber_8_14\",\"PCH_PvVoltageA\",\"PCH_PvVoltageB\",\"PCH_PvVoltageC\",\"PCH_PvVoltageD\",\"PCH_PvVoltageE\",\"PCH_PvVoltageF\",\"PCH_PvCurrentA\",\"PCH_PvCurrentB\",\"PCH_PvCurrentC\",\"PCH_PvCurrentD\",\"PCH_PvCurrentE\",\"PCH_PvCurrentF\",\"PCH_BatteryPower\",\"PCH_AcRealPowerAB\",\"PCH_SlowPvPowerSum\",\"PCH_AcMode\",\"PCH_AcFrequency\",\"PCH_DcdcState_A\",\"PCH_DcdcState_B\",\"PCH_appGitHash\"],\"bmsComponentsFilter\":{\"types\":[\"PW3BMS\"]},\"bmsSignalNames\":[\"BMS_nominalEnergyRemaining\",\"BMS_nominalFullPackEnergy\",\"BMS_appGitHash\"],\"hvpComponentsFilter\":{\"types\":[\"PW3HVP\"]},\"hvpSignalNames\":[\"HVP_State\",\"HVP_appGitHash\"],\"baggrComponentsFilter\":{\"types\":[\"BAGGR\"]},\"baggrSignalNames\":[\"BAGGR_State\",\"BAGGR_OperationRequest\",\"BAGGR_NumBatteriesConnected\",\"BAGGR_NumBatteriesPresent\",\"BAGGR_NumBatteriesExpected\",\"BAGGR_LOG_BattConnectionStatus0\",\"BAGGR_LOG_BattConnectionStatus1\",\"BAGGR_LOG_BattConnectionStatus2\",\"BAGGR_LOG_BattConnectionStatus3\"]}"
-            # pylint: enable=C0301
-            pb.tail.value = 2
-
             r = self._tesla.post(
                 f"tedapi/device/{din}/v1",
                 headers={'Content-type': 'application/octet-string'},
-                data=pb.SerializeToString())
+                data=self._tesla.build_request('components', din),
+                priority='vitals',
+                idempotent=True)
 
             # Decode response
-            pb = tedapi_pb2.Message() # pylint: disable=E1101
-            pb.ParseFromString(r.content)
-            payload = pb.message.payload.recv.text
-            data = json.loads(payload)
+            data = messages.parse_query_response(r.content)
             logger.debug("Battery Block('%s'): %s", din, data)
-            self._cache[key] = data
             return data
 
+        return self._cached(self._cache, f"get_pw_vitals({din})", fetch, force)
+
 
     def get_battery_blocks(self, force=False):
         """
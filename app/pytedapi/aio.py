@@ -0,0 +1,546 @@
+"""
+Tesla TEDAPI asyncio Classes
+
+ This module provides asyncio versions of TeslaEnergyDeviceAPI and
+ Powerwall3API.  They share the protobuf requests and decoders in
+ pytedapi.messages with the threaded classes, but talk to the gateway over
+ asyncio streams using keep-alive HTTP/1.1 connections, so a single event loop
+ can drive several gateways and several requests in flight at once.
+
+ Classes:
+    AsyncTeslaEnergyDeviceAPI(gw_pwd: str, host: str = GW_IP, timeout: int = 5,
+        cooldown: int = 300, maxsize: int = 2) - Initialize TEDAPI
+    AsyncPowerwall3API(tesla: AsyncTeslaEnergyDeviceAPI, cacheexpire: int = 5,
+        configexpire: int = 5, timeout: int = 5) - Initialize Powerwall 3 API
+
+ Example:
+    async with AsyncTeslaEnergyDeviceAPI(password) as tedapi:
+        powerwall = AsyncPowerwall3API(tedapi)
+        status = await powerwall.get_status()
+"""
+
+import asyncio
+import base64
+import logging
+import ssl
+import time
+
+from cachetools import TTLCache
+
+from . import GW_IP
+from . import TeslaEnergyDeviceAPI
+from . import exceptions
+from . import messages
+from .connection import IDEMPOTENT_METHODS
+
+# Setup Logging
+logger = logging.getLogger(__name__)
+
+_OCTET_STRING = {'Content-type': 'application/octet-string'}
+
+
+class Response:
+    """The parts of an HTTP response used by the TEDAPI clients"""
+    def __init__(self, status_code: int, headers: dict, content: bytes) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        """The response body decoded as UTF-8"""
+        return self.content.decode('utf-8', errors='replace')
+
+
+###
+### _HTTPConnectionPool class
+###
+class _HTTPConnectionPool:
+    """
+    A minimal HTTP/1.1 client keeping up to maxsize connections alive to a
+    single host.  Certificates are not verified, as the gateway uses a
+    self-signed certificate.
+    """
+    def __init__(self, host: str, timeout: int, maxsize: int) -> None:
+        self._host = host
+        self._addr, _, port = host.partition(':')
+        self._port = int(port) if port else 443
+        self._timeout = timeout
+        self._ssl = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self._ssl.check_hostname = False
+        self._ssl.verify_mode = ssl.CERT_NONE
+        self._slots = asyncio.Semaphore(maxsize)
+        self._idle = []
+        self._stats = {'requests': 0, 'handshakes': 0, 'reused': 0, 'resets': 0}
+
+
+    async def request(self, method: str, path: str,
+            headers: dict = None, data: bytes = None, idempotent: bool = None) -> Response:
+        """
+        Send a request, reusing an idle connection when there is one.  If the
+        idle connection was reset, idempotent requests are sent again on a new
+        one, which is the default for IDEMPOTENT_METHODS.
+        Raises:
+            ConnectionError
+            TimeoutError
+        """
+        async with self._slots:
+            conn = None
+            while self._idle and conn is None:
+                conn = self._idle.pop()
+                if conn[1].is_closing() or conn[0].at_eof():
+                    conn[1].close()
+                    conn = None
+            if conn is not None:
+                try:
+                    resp, keep = await asyncio.wait_for(
+                        self._roundtrip(conn, method, path, headers, data),
+                        self._timeout)
+                    self._stats['reused'] += 1
+                    return self._finish(conn, resp, keep)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    # The gateway drops idle keep-alive connections, so try
+                    # once more on a new connection, unless the request may
+                    # have been received and can't safely be sent twice
+                    conn[1].close()
+                    self._stats['resets'] += 1
+                    if not (method in IDEMPOTENT_METHODS if idempotent is None else idempotent):
+                        raise ConnectionError(f"Connection reset by {self._host}") from e
+                    logger.debug("Connection to gateway reset, reconnecting: %s", e)
+                except BaseException:
+                    conn[1].close()
+                    raise
+
+            conn = await asyncio.wait_for(
+                asyncio.open_connection(self._addr, self._port, ssl=self._ssl),
+                self._timeout)
+            self._stats['handshakes'] += 1
+            try:
+                resp, keep = await asyncio.wait_for(
+                    self._roundtrip(conn, method, path, headers, data),
+                    self._timeout)
+            except asyncio.IncompleteReadError as e:
+                conn[1].close()
+                raise ConnectionError(f"Connection closed by {self._host}") from e
+            except BaseException:
+                conn[1].close()
+                raise
+            return self._finish(conn, resp, keep)
+
+
+    def _finish(self, conn, resp: Response, keep: bool) -> Response:
+        self._stats['requests'] += 1
+        if keep:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        return resp
+
+
+    async def _roundtrip(self, conn, method, path, headers, data):
+        reader, writer = conn
+        body = data or b''
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self._host}",
+                 f"Content-Length: {len(body)}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status = await reader.readuntil(b'\r\n')
+        version, code = status.split(b' ', 2)[:2]
+        resp_headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            resp_headers[name.strip().lower()] = value.strip()
+
+        keep = (version == b'HTTP/1.1'
+                and resp_headers.get('connection', '').lower() != 'close')
+        if resp_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    # Skip any trailers
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readuntil(b'\r\n')
+            content = b''.join(chunks)
+        elif 'content-length' in resp_headers:
+            content = await reader.readexactly(int(resp_headers['content-length']))
+        else:
+            content = await reader.read()
+            keep = False
+        return Response(int(code), resp_headers, content), keep
+
+
+    async def close(self) -> None:
+        """Close all idle connections"""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+    def get_stats(self) -> dict:
+        """Get the connection counters"""
+        return dict(self._stats)
+
+
+###
+### AsyncTeslaEnergyDeviceAPI class
+###
+class AsyncTeslaEnergyDeviceAPI:
+    """
+    Parameters:
+       gw_pwd - Powerwall Gateway Password
+       host - Powerwall Gateway IP Address (default: 192.168.91.1)
+       timeout - API Timeout in seconds
+       cooldown - Time in seconds to suspend calls if the Powerwall returns a
+                  BUSY code
+       maxsize - Maximum number of requests in flight to the gateway
+
+    Functions:
+       connect() - Connect to the Powerwall Gateway if not already connected
+       reconnect() - Reconnect to the Powerwall Gateway
+       request() - Send a simple GET request to the Powerwall Gateway
+       post() - Send a POST to the Powerwall Gateway
+       get_din() - Get the DIN from the Powerwall Gateway
+       close() - Close all connections to the Powerwall Gateway
+
+    Note:
+       All functions except is_powerwall3() are coroutines.  Network errors
+       are raised as ConnectionError and TimeoutError rather than the
+       requests exceptions raised by TeslaEnergyDeviceAPI.
+    """
+    def __init__(self,
+            gw_pwd: str,
+            host: str = GW_IP,
+            timeout: int = 5,
+            cooldown: int = 300,
+            maxsize: int = 2) -> None:
+        if not gw_pwd:
+            raise ValueError("Missing gw_pwd")
+        self._gw_ip = host
+        self._timeout = timeout
+        self._cooldown = cooldown
+        self._pwcooldown = 0
+        # There is no rate governor, so check_http_response() starts the
+        # cooldown on busy responses
+        self.governor = None
+        self._auth = 'Basic ' + base64.b64encode(
+            f"Tesla_Energy_Device:{gw_pwd}".encode('utf-8')).decode('ascii')
+        self._din_lock = asyncio.Lock()
+        self._cache = {'din': None, 'pw3': False}
+        self._pool = _HTTPConnectionPool(host, timeout, maxsize)
+        self._templates = messages.RequestTemplates()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # Same status code handling as the threaded client
+    check_http_response = TeslaEnergyDeviceAPI.check_http_response
+
+    # TEDAPI Functions
+
+    def is_powerwall3(self) -> bool:
+        """Check if the system we are talking to is a PW3"""
+        return self._cache['pw3']
+
+
+    async def connect(self) -> None:
+        """Connect to the Powerwall Gateway if not already connected"""
+        if self._cache['din'] is None:
+            await self.reconnect()
+
+
+    async def reconnect(self) -> None:
+        """
+        Reconnect to the Powerwall Gateway
+        Raises:
+            Exception
+        """
+        logger.debug("Testing Connection to Powerwall Gateway: %s", self._gw_ip)
+        try:
+            resp = await self._pool.request('GET', '/')
+            if resp.status_code != 200:
+                # Connected but appears to be Powerwall 3
+                logger.debug("Detected Powerwall 3 Gateway")
+                self._cache['pw3'] = True
+            await self.get_din(force=True)
+        except exceptions.TEDAPIException:
+            raise
+        except Exception:
+            logger.error("Unable to connect to Powerwall Gateway: %s", self._gw_ip)
+            logger.error("Please verify your your host has a route to the Gateway.")
+            raise
+
+
+    async def request(self, path, force=False) -> Response:
+        """
+        Make a simple HTTP GET request to the Powerwall Gateway, converting
+        some HTTP status codes to exceptions
+        Parameters:
+            path (str): The URI path
+            force (bool): Force a query from the API, default false
+        Returns:
+            Response: The HTTP resposne
+        Raises:
+            TEDAPIRateLimitedException
+            TEDAPIRateLimitingException
+            TEDAPIAccessDeniedException
+            TEDAPIException
+        """
+        if not force and self._pwcooldown > time.perf_counter():
+            raise exceptions.TEDAPIRateLimitedException()
+        r = await self._pool.request('GET', f"/{path}",
+            headers={'Authorization': self._auth})
+        self.check_http_response(r)
+        return r
+
+
+    async def post(self, path, force=False, headers=None, data=None,
+            idempotent=False) -> Response:
+        """
+        Make an HTTP POST request to the Powerwall Gateway, converting
+        some HTTP status codes to exceptions
+        Parameters:
+            path (str): The URI path
+            force (bool): Force a query from the API, default false
+            headers (dict): Extra request headers, default None
+            data (bytes): The request body, default None
+            idempotent (bool): The request only reads from the Powerwall, so
+                               can be sent again if the connection is reset,
+                               default False
+        Returns:
+            Response: The HTTP resposne
+        Raises:
+            TEDAPIRateLimitedException
+            TEDAPIRateLimitingException
+            TEDAPIAccessDeniedException
+            TEDAPIException
+        """
+        if not force and self._pwcooldown > time.perf_counter():
+            raise exceptions.TEDAPIRateLimitedException()
+        r = await self._pool.request('POST', f"/{path}",
+            headers=(headers or {}) | {'Authorization': self._auth},
+            data=data, idempotent=idempotent)
+        self.check_http_response(r)
+        return r
+
+
+    async def get_din(self, force=False) -> str:
+        """
+        Get the DIN of the Powerwall Gateway
+        Parameters:
+            force (bool): Force a query of the API, default False
+        Returns:
+            str: The Powerwall Gateway's DIN
+        Raises:
+            TEDAPIException
+        """
+        async with self._din_lock:
+            if not force and self._cache['din'] is not None:
+                logger.debug("Using Cached din")
+                return self._cache['din']
+            logger.debug("Fetching din from Powerwall...")
+            self._templates.clear()
+            r = await self.request("tedapi/din", force=force)
+            if self._cache['din'] not in (None, r.text):
+                await self._pool.close()
+                raise exceptions.TEDAPIDinChangedException(self._cache['din'], r.text)
+            self._cache['din'] = r.text
+            return r.text
+
+
+    async def build_request(self, kind: str, din: str = None) -> bytes:
+        """
+        Get a serialized request from the template registry, see
+        TeslaEnergyDeviceAPI.build_request()
+        """
+        gateway = await self.get_din()
+        if din is None:
+            return self._templates.get(kind, gateway)
+        return self._templates.get(kind, din, sender_din=gateway)
+
+
+    async def close(self) -> None:
+        """Close all connections to the Powerwall Gateway"""
+        await self._pool.close()
+
+
+    def get_connection_stats(self) -> dict:
+        """Get the connection reuse counters"""
+        return self._pool.get_stats()
+
+
+###
+### AsyncPowerwall3API class
+###
+class AsyncPowerwall3API:
+    """
+    Parameters:
+       tesla - AsyncTeslaEnergyDeviceAPI object
+       cacheexpire - Cache Expiration in seconds
+       configexpire - Configuration Cache Expiration in seconds
+       timeout - Time in seconds to wait for another caller fetching the
+                 same data
+
+    Functions:
+       get_config() - Get the Powerwall Gateway Configuration
+       get_status() - Get the Powerwall Gateway Status
+       get_firmware_version() - Get the Powerwall Firmware Version
+       get_battery_blocks() - Get list of Powerwall Battery Blocks
+       get_components() - Get the Powerwall 3 Device Information
+       get_battery_block(din) - Get the Powerwall 3 Battery Block Information
+       get_pw_vitals(din) - Get the Powerwall 3 Vitals Information
+
+    Note:
+       All functions are coroutines returning the same data as the
+       Powerwall3API function of the same name.
+    """
+    def __init__(self,
+            tesla: AsyncTeslaEnergyDeviceAPI,
+            cacheexpire: int = 5,
+            configexpire: int = 5,
+            timeout: int = 5) -> None:
+        self._tesla = tesla
+        self._timeout = timeout
+
+        # _config used for get_config and get_firmware
+        self._config = TTLCache(maxsize=4, ttl=configexpire)
+
+        # _cache used for all other API calls except get_din
+        self._cache = TTLCache(maxsize=16, ttl=cacheexpire)
+
+        self._locks = {}
+
+
+    async def _cached(self, cache, key, fetch, force):
+        """Return cache[key], or await fetch() to fill it, one fetch per key at a time"""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        await asyncio.wait_for(lock.acquire(), self._timeout)
+        try:
+            if not force:
+                try:
+                    value = cache[key]
+                    logger.debug("Using Cached %s", key)
+                    return value
+                except KeyError:
+                    pass
+            value = await fetch()
+            cache[key] = value
+            return value
+        finally:
+            lock.release()
+
+
+    async def _post(self, path, data, parse):
+        await self._tesla.connect()
+        # Every query only reads from the Powerwall
+        r = await self._tesla.post(path, headers=_OCTET_STRING, data=data, idempotent=True)
+        return parse(r.content)
+
+
+    async def get_config(self, force=False) -> dict:
+        """Get the Powerwall Gateway Configuration, see Powerwall3API.get_config()"""
+        async def fetch():
+            logger.debug("Get Configuration from Powerwall")
+            data = await self._post("tedapi/v1",
+                await self._tesla.build_request('config'),
+                messages.parse_config_response)
+            logger.debug("Configuration: %s", data)
+            return data
+        return await self._cached(self._config, "get_config", fetch, force)
+
+
+    async def get_status(self, force=False) -> dict:
+        """Get the Powerwall Gateway Status, see Powerwall3API.get_status()"""
+        async def fetch():
+            logger.debug("Get Status from Powerwall")
+            data = await self._post("tedapi/v1",
+                await self._tesla.build_request('status'),
+                messages.parse_query_response)
+            logger.debug("Status: %s", data)
+            return data
+        return await self._cached(self._cache, "get_status", fetch, force)
+
+
+    async def get_firmware_version(self, force=False, details=False):
+        """
+        Get the Powerwall Firmware version info, see
+        Powerwall3API.get_firmware_version()
+        """
+        async def fetch():
+            logger.debug("Get Firmware Version from Powerwall")
+            payload = await self._post("tedapi/v1",
+                await self._tesla.build_request('firmware'),
+                messages.parse_firmware_response)
+            logger.debug("Firmware Version: %s", payload)
+            return payload
+        payload = await self._cached(self._config, "get_firmware_version", fetch, force)
+        if details:
+            return payload
+        return payload["version"]["text"]
+
+
+    async def get_components(self, force=False) -> dict:
+        """Get the Powerwall 3 Device Information, see Powerwall3API.get_components()"""
+        if not self._tesla.is_powerwall3():
+            raise exceptions.TEDAPIPowerwallVersionException()
+
+        async def fetch():
+            logger.debug("Get PW3 Components from Powerwall")
+            components = await self._post("tedapi/v1",
+                await self._tesla.build_request('components'),
+                messages.parse_query_response)
+            logger.debug("Components: %s", components)
+            return components
+        return await self._cached(self._cache, "get_components", fetch, force)
+
+
+    async def get_battery_block(self, din, force=False) -> dict:
+        """
+        Get the Powerwall 3 Battery Block Information, see
+        Powerwall3API.get_battery_block()
+        """
+        if not self._tesla.is_powerwall3():
+            raise exceptions.TEDAPIPowerwallVersionException()
+
+        async def fetch():
+            logger.debug("Get Battery Block from Powerwall (%s)", din)
+            data = await self._post(f"tedapi/device/{din}/v1",
+                await self._tesla.build_request('components', din),
+                messages.parse_config_response)
+            logger.debug("Configuration: %s", data)
+            return data
+        return await self._cached(self._cache, f"get_battery_block({din})", fetch, force)
+
+
+    async def get_pw_vitals(self, din, force=False) -> dict:
+        """Get Powerwall 3 Battery Vitals Data, see Powerwall3API.get_pw_vitals()"""
+        async def fetch():
+            data = await self._post(f"tedapi/device/{din}/v1",
+                await self._tesla.build_request('components', din),
+                messages.parse_query_response)
+            logger.debug("Battery Block('%s'): %s", din, data)
+            return data
+        return await self._cached(self._cache, f"get_pw_vitals({din})", fetch, force)
+
+
+    async def get_battery_blocks(self, force=False) -> list:
+        """Return Powerwall Battery Blocks"""
+        config = await self.get_config(force)
+        return config.get('battery_blocks') or []
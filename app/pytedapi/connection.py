@@ -0,0 +1,222 @@
+"""Module providing a persistent, pooled HTTPS transport for the TEDAPI"""
+
+import logging
+import ssl
+import time
+from threading import RLock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+# Methods that can safely be sent again after a reset, as in urllib3's Retry
+IDEMPOTENT_METHODS = frozenset(('DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT', 'TRACE'))
+
+
+class _ResumingSSLContext(ssl.SSLContext):
+    """
+    An SSLContext that offers the last seen TLS session when wrapping new
+    sockets and counts full vs resumed handshakes.  Certificates are not
+    verified, as the gateway uses a self-signed certificate.
+    """
+    def __init__(self, *args, **kwargs):
+        # pylint: disable=W0613 # protocol is consumed by SSLContext.__new__
+        super().__init__()
+        self.check_hostname = False
+        self.verify_mode = ssl.CERT_NONE
+        self.tls_session = None
+        self.handshakes = 0
+        self.resumed = 0
+
+    def stash_session(self, sock: ssl.SSLSocket) -> None:
+        """Keep the TLS session of a socket for later resumption"""
+        try:
+            session = sock.session
+        except (ValueError, ssl.SSLError):
+            session = None
+        if session is not None:
+            self.tls_session = session
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get('session') is None and self.tls_session is not None:
+            kwargs['session'] = self.tls_session
+        sslsock = super().wrap_socket(sock, *args, **kwargs)
+        if sslsock.session_reused:
+            self.resumed += 1
+        else:
+            self.handshakes += 1
+        return sslsock
+
+
+class _TEDAPIAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that builds its connection pools on a shared SSL context, and
+    hands the TLS session of each response's connection to the context.  TLS
+    1.3 session tickets only arrive after the handshake, so the session is
+    collected once the response headers have been read.
+    """
+    def __init__(self, ssl_context, **kwargs):
+        # Must be set before HTTPAdapter.__init__ calls init_poolmanager()
+        self._ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def build_response(self, req, resp):
+        sock = getattr(resp.connection, 'sock', None)
+        if isinstance(sock, ssl.SSLSocket):
+            self._ssl_context.stash_session(sock)
+        return super().build_response(req, resp)
+
+
+class ConnectionPool:
+    """
+    A long lived requests.Session to the gateway that keeps connections alive
+    between calls and resumes TLS sessions when a new connection is needed.
+    Up to maxsize requests can be sent at once from different threads, with
+    the connection counters being approximate while they overlap.
+
+    Parameters:
+       timeout - HTTP timeout in seconds
+       maxsize - Maximum number of connections kept open to the gateway
+
+    Functions:
+       request() - Send an HTTP request, rebuilding the pool and sending
+                   idempotent requests once more on a reset
+       reset() - Drop all connections and build a new pool
+       get_stats() - Get handshake and connection reuse counters
+    """
+    def __init__(self, timeout: int = 5, maxsize: int = 1) -> None:
+        self._timeout = timeout
+        self._maxsize = maxsize
+        self._session = None
+        self._ssl_context = None
+        self._lock = RLock()
+        self._stats = {
+            'requests': 0,
+            'handshakes': 0,
+            'resumed': 0,
+            'reused': 0,
+            'resets': 0,
+            'new_conn_time': 0.0,
+            'reused_conn_time': 0.0
+        }
+        self.reset(forget_tls=True)
+
+
+    def reset(self, forget_tls: bool = False) -> None:
+        """
+        Close all pooled connections and build a new pool
+        Parameters:
+            forget_tls (bool): Also discard the cached TLS session, which is
+                               needed when the device on the other end changed
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._stats['resets'] += 1
+            if forget_tls or self._ssl_context is None:
+                if self._ssl_context is not None:
+                    self._stats['handshakes'] += self._ssl_context.handshakes
+                    self._stats['resumed'] += self._ssl_context.resumed
+                self._ssl_context = _ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            self._session = requests.Session()
+            self._session.mount('https://', _TEDAPIAdapter(
+                self._ssl_context,
+                pool_connections=1,
+                pool_maxsize=self._maxsize,
+                max_retries=0))
+
+
+    def _new_connections(self) -> int:
+        return self._ssl_context.handshakes + self._ssl_context.resumed
+
+
+    def request(self, method: str, url: str, idempotent: bool = None,
+            **kwargs) -> requests.Response:
+        """
+        Send an HTTP request over the pool
+        Parameters:
+            method (str): The HTTP method
+            url (str): The full URL
+            idempotent (bool): The request can be sent again if the connection
+                               is reset, as it may already have been received,
+                               default True for IDEMPOTENT_METHODS
+            **kwargs: Passed through to requests.Session.request()
+        Returns:
+            requests.Response: The HTTP response
+        Raises:
+            requests.exceptions.RequestException
+        """
+        # Passed on every call, as a session level verify=False is overridden by
+        # REQUESTS_CA_BUNDLE in the environment
+        kwargs['verify'] = False
+        kwargs.setdefault('timeout', self._timeout)
+        session = self._session
+        connections = self._new_connections()
+        start = time.perf_counter()
+        try:
+            r = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError):
+            raise
+        except requests.exceptions.ConnectionError as e:
+            # The gateway drops idle keep-alive connections, so rebuild the pool
+            # and try once more before giving up, unless the request may have
+            # been received and can't safely be sent twice
+            with self._lock:
+                # Unless a concurrent request already rebuilt it
+                if self._session is session:
+                    logger.debug("Connection to gateway reset, rebuilding pool: %s", e)
+                    self.reset()
+                session = self._session
+            if not (method in IDEMPOTENT_METHODS if idempotent is None else idempotent):
+                raise
+            connections = self._new_connections()
+            start = time.perf_counter()
+            r = session.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._stats['requests'] += 1
+            if self._new_connections() > connections:
+                self._stats['new_conn_time'] += elapsed
+            else:
+                self._stats['reused'] += 1
+                self._stats['reused_conn_time'] += elapsed
+        return r
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the connection counters
+        Returns:
+            dict:
+                requests (int): Requests sent
+                handshakes (int): Full TLS handshakes
+                resumed (int): Resumed TLS handshakes
+                reused (int): Requests sent on an already open connection
+                resets (int): Number of times the pool was rebuilt
+                new_conn_time (float): Seconds spent on requests that opened a
+                                       connection
+                reused_conn_time (float): Seconds spent on requests that reused
+                                          a connection
+                saved_time (float): Estimated seconds saved by reusing
+                                    connections
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['handshakes'] += self._ssl_context.handshakes
+            stats['resumed'] += self._ssl_context.resumed
+        new_conns = stats['requests'] - stats['reused']
+        stats['saved_time'] = 0.0
+        if new_conns and stats['reused']:
+            per_new = stats['new_conn_time'] / new_conns
+            per_reused = stats['reused_conn_time'] / stats['reused']
+            stats['saved_time'] = max(per_new - per_reused, 0.0) * stats['reused']
+        return stats
@@ -0,0 +1,152 @@
+"""Module providing a priority dispatcher for TEDAPI requests"""
+
+import itertools
+import time
+from contextlib import contextmanager
+from threading import Condition
+
+# Request priorities, most urgent first.  Status carries the grid power and
+# grid connection state, so it goes ahead of the vitals of each Powerwall,
+# which go ahead of the config, firmware and component queries.
+PRIORITIES = ('status', 'vitals', 'config')
+
+
+###
+### PriorityDispatcher class
+###
+class PriorityDispatcher:
+    """
+    Hands out a fixed number of request slots, serving waiting requests by
+    priority rather than in arrival order.  Each second a request waits
+    raises its priority by 1/aging levels, so a steady stream of urgent
+    requests can't starve the others.
+
+    Parameters:
+       slots - Requests allowed in flight at once (default: 1)
+       timeout - Default seconds to wait for a slot (default: 5)
+       aging - Seconds of waiting that raise a request by one priority
+               level (default: 1)
+
+    Functions:
+       slot(priority) - Context manager holding a slot for a request
+       get_stats() - Get the wait and latency counters of each priority
+    """
+    def __init__(self, slots: int = 1, timeout: float = 5, aging: float = 1) -> None:
+        self.timeout = timeout
+        self._aging = aging
+        self._free = slots
+        self._cond = Condition()
+        self._seq = itertools.count()
+        # (level, enqueued, seq) of each waiting request
+        self._waiting = []
+        self._stats = {name: {'requests': 0, 'queued': 0, 'timeouts': 0,
+                              'wait_time': 0.0, 'max_wait': 0.0,
+                              'latency': 0.0, 'max_latency': 0.0}
+                       for name in PRIORITIES}
+
+
+    def _next(self, now: float) -> tuple:
+        """Returns the waiting request to serve next"""
+        return min(self._waiting,
+                   key=lambda w: (w[0] - (now - w[1]) / self._aging, w[2]))
+
+
+    def acquire(self, priority: str, timeout: float = None) -> float:
+        """
+        Wait for a free slot
+        Parameters:
+            priority (str): The request priority, from PRIORITIES
+            timeout (float): Most seconds to wait, default the dispatcher's
+        Returns:
+            float: Seconds waited
+        Raises:
+            TimeoutError: If no slot was free in time
+        """
+        if timeout is None:
+            timeout = self.timeout
+        start = time.monotonic()
+        waiter = (PRIORITIES.index(priority), start, next(self._seq))
+        with self._cond:
+            stats = self._stats[priority]
+            if self._free and not self._waiting:
+                self._free -= 1
+                stats['requests'] += 1
+                return 0.0
+            self._waiting.append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._free and self._next(now) is waiter:
+                        break
+                    if now >= start + timeout:
+                        stats['timeouts'] += 1
+                        raise TimeoutError(f"Could not acquire a request slot within "
+                                           f"specified timeout of {timeout}s")
+                    self._cond.wait(start + timeout - now)
+                self._free -= 1
+            finally:
+                self._waiting.remove(waiter)
+                # Let the next request through if slots are still free
+                if self._free and self._waiting:
+                    self._cond.notify_all()
+            wait = now - start
+            stats['requests'] += 1
+            stats['queued'] += 1
+            stats['wait_time'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+        return wait
+
+
+    def release(self, priority: str, latency: float = 0.0) -> None:
+        """
+        Free a slot
+        Parameters:
+            priority (str): The priority the slot was acquired with
+            latency (float): Seconds from asking for the slot to finishing
+                             the request, default 0
+        """
+        with self._cond:
+            self._free += 1
+            stats = self._stats[priority]
+            stats['latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+            if self._waiting:
+                self._cond.notify_all()
+
+
+    @contextmanager
+    def slot(self, priority: str):
+        """
+        Context manager holding a slot for a request
+        Parameters:
+            priority (str): The request priority, from PRIORITIES
+        Raises:
+            TimeoutError: If no slot was free in time
+        """
+        start = time.monotonic()
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority, time.monotonic() - start)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the wait and latency counters of each priority
+        Returns:
+            dict: By priority:
+                requests (int): Slots handed out
+                queued (int): Requests that had to wait for a slot
+                timeouts (int): Requests that gave up waiting
+                wait_time (float): Seconds spent waiting for slots
+                max_wait (float): Longest wait for a slot
+                latency (float): Seconds from asking for a slot to the end
+                                 of the request, summed over requests
+                max_latency (float): Longest of those
+                waiting (int): Requests waiting now
+        """
+        with self._cond:
+            waiting = [w[0] for w in self._waiting]
+            return {name: stats | {'waiting': waiting.count(i)}
+                    for i, (name, stats) in enumerate(self._stats.items())}
@@ -24,6 +24,11 @@ class TEDAPINotConnectedException(TEDAPIException):
     def __init__(self):
         super().__init__(self, "Not Connected - Unable to get configuration")
 
+class TEDAPIDinChangedException(TEDAPIException):
+    """Exception class indicating a different gateway answered"""
+    def __init__(self, old, new):
+        super().__init__(self, f"DIN changed from '{old}' to '{new}'")
+
 class TEDAPIPowerwallVersionException(TEDAPIException):
     """Exception class indicating the version of a Powerwall is not supported"""
     def __init__(self):
@@ -0,0 +1,232 @@
+"""Module providing an adaptive rate governor for TEDAPI requests"""
+
+import logging
+import time
+from threading import Lock
+
+from . import exceptions
+
+logger = logging.getLogger(__name__)
+
+# Starting rate in requests per second and burst size of each endpoint.  The
+# burst covers the requests of one update, such as the vitals of 16 blocks.
+DEFAULT_BUDGETS = {
+    'din': (0.2, 2),
+    'v1': (1.0, 4),
+    'device': (1.0, 16)
+}
+
+
+def endpoint(path: str) -> str:
+    """Returns the budget an API path is counted against"""
+    if path.startswith('tedapi/device/'):
+        return 'device'
+    name = path.rsplit('/', 1)[-1]
+    return name if name in DEFAULT_BUDGETS else 'v1'
+
+
+###
+### TokenBucket class
+###
+class TokenBucket:
+    """
+    A token bucket refilled at an adjustable rate.  Requests that find it
+    empty reserve the next token and wait for it, so concurrent callers are
+    spaced out rather than all retrying at once.
+
+    Parameters:
+       rate - Tokens added per second
+       capacity - Most tokens held, the largest burst allowed
+
+    Functions:
+       reserve() - Take a token, returning the seconds to wait for it
+    """
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+
+    def reserve(self, now: float) -> float:
+        """
+        Take a token, going into debt for it if the bucket is empty
+        Parameters:
+            now (float): The monotonic time
+        Returns:
+            float: Seconds until the token is available, 0 if it is now
+        """
+        self.tokens = min(self.tokens + (now - self._updated) * self.rate, self.capacity)
+        self._updated = now
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0.0)
+
+
+###
+### RateGovernor class
+###
+class RateGovernor:
+    """
+    Budgets the requests made to each TEDAPI endpoint with a token bucket,
+    learning the rate the gateway accepts with additive increase and
+    multiplicative decrease (AIMD).  A rate limited response halves the rate
+    of its endpoint, and the rate climbs back slowly while requests are
+    having to wait for tokens or are refused one, so it only grows while it
+    is holding requests back and probes the gateway's limit about once every
+    few minutes, even from min_rate where most requests are refused.  The
+    learned rates can be saved with get_rates() and restored on the next
+    start.
+
+    Parameters:
+       rates - Dictionary of learned rates by endpoint to start from, as
+               returned by get_rates() (default: None for DEFAULT_BUDGETS)
+       min_rate - Lowest rate in requests per second (default: 1/60)
+       max_rate - Highest rate in requests per second (default: 10)
+       increase - Requests per second added for each minute requests spend
+                  held back (default: 0.01)
+       decrease - Factor the rate is multiplied by when rate limited
+                  (default: 0.5)
+
+    Functions:
+       acquire(path, timeout) - Wait for a token to request a path
+       success(path, waited) - Record a request that succeeded
+       limited(path) - Record a rate limited response
+       get_rates() - Get the learned rate of each endpoint
+       get_stats() - Get the rate, tokens and counters of each endpoint
+    """
+    # pylint: disable=R0913
+    def __init__(self,
+            rates: dict = None,
+            min_rate: float = 1 / 60,
+            max_rate: float = 10,
+            increase: float = 0.01,
+            decrease: float = 0.5) -> None:
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._lock = Lock()
+        self._buckets = {}
+        self._stats = {}
+        for name, (rate, capacity) in DEFAULT_BUDGETS.items():
+            rate = (rates or {}).get(name, rate)
+            self._buckets[name] = TokenBucket(self._clamp(rate), capacity)
+            self._stats[name] = {'requests': 0, 'waits': 0, 'wait_time': 0.0,
+                                 'rejected': 0, 'limited': 0, 'decreases': 0}
+        # When each rate was last cut and raised
+        self._decreased = {name: 0.0 for name in DEFAULT_BUDGETS}
+        self._increased = {name: 0.0 for name in DEFAULT_BUDGETS}
+
+
+    def _clamp(self, rate: float) -> float:
+        return min(max(float(rate), self._min_rate), self._max_rate)
+
+
+    def _held(self, name: str, now: float) -> None:
+        # Raise the rate by the time since requests were last held back, up
+        # to a minute.  Called with the lock held.
+        bucket = self._buckets[name]
+        held = min(now - self._increased[name], 60)
+        self._increased[name] = now
+        bucket.rate = self._clamp(bucket.rate + self._increase * held / 60)
+
+
+    def acquire(self, path: str, timeout: float) -> bool:
+        """
+        Wait for a token to request a path
+        Parameters:
+            path (str): The API path
+            timeout (float): Most seconds to wait
+        Returns:
+            bool: True if the request had to wait
+        Raises:
+            TEDAPIRateLimitedException: If no token is available in time
+        """
+        name = endpoint(path)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets[name]
+            stats = self._stats[name]
+            wait = bucket.reserve(now)
+            if wait > timeout:
+                # Give the token back, as the request won't be sent
+                bucket.tokens += 1
+                stats['rejected'] += 1
+                self._held(name, now)
+                raise exceptions.TEDAPIRateLimitedException()
+            stats['requests'] += 1
+            if wait:
+                stats['waits'] += 1
+                stats['wait_time'] += wait
+        if wait:
+            logger.debug("Waiting %.2fs for a '%s' request token", wait, name)
+            time.sleep(wait)
+        return wait > 0
+
+
+    def success(self, path: str, waited: bool) -> None:
+        """
+        Record a request that succeeded, raising the rate of its endpoint if
+        the request had to wait for a token, by the time since requests were
+        last held back up to a minute
+        Parameters:
+            path (str): The API path
+            waited (bool): The request waited, as returned by acquire()
+        """
+        if not waited:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._held(endpoint(path), now)
+
+
+    def limited(self, path: str) -> None:
+        """
+        Record a rate limited response, cutting the rate of its endpoint.
+        Responses to requests sent before the cut only count once.
+        Parameters:
+            path (str): The API path
+        """
+        name = endpoint(path)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets[name]
+            self._stats[name]['limited'] += 1
+            if now - self._decreased[name] < 1 / bucket.rate:
+                return
+            self._decreased[name] = now
+            self._stats[name]['decreases'] += 1
+            bucket.rate = self._clamp(bucket.rate * self._decrease)
+            # Start the new rate from an empty bucket
+            bucket.tokens = min(bucket.tokens, 0.0)
+            rate = bucket.rate
+        logger.warning("Rate limited by Powerwall, reducing '%s' requests to %.3f/s", name, rate)
+
+
+    def get_rates(self) -> dict:
+        """
+        Get the learned rates
+        Returns:
+            dict: Requests per second by endpoint
+        """
+        with self._lock:
+            return {name: bucket.rate for name, bucket in self._buckets.items()}
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the state and counters of each endpoint
+        Returns:
+            dict: By endpoint:
+                rate (float): Requests per second allowed
+                tokens (float): Requests that can be sent now
+                requests (int): Requests allowed
+                waits (int): Requests that waited for a token
+                wait_time (float): Seconds spent waiting
+                rejected (int): Requests refused as no token was available in time
+                limited (int): Rate limited responses
+                decreases (int): Times the rate was cut
+        """
+        with self._lock:
+            return {name: {'rate': bucket.rate, 'tokens': bucket.tokens} | self._stats[name]
+                    for name, bucket in self._buckets.items()}
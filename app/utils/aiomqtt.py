@@ -0,0 +1,103 @@
+"""Module providing an asyncio driver for the paho MQTT client"""
+import asyncio
+import logging
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+###
+### AsyncioMQTT class
+###
+class AsyncioMQTT():
+    """
+    Drives a paho MQTT client from an asyncio event loop instead of the
+    network thread started by loop_start().  The client's socket is read and
+    written by loop callbacks, and keepalives and reconnects are handled by a
+    task, so all client callbacks run on the event loop.  It must be created
+    before the client connects.
+
+    Parameters:
+        loop (AbstractEventLoop): The event loop to run the client on
+        client (Client): The paho MQTT client
+        min_delay (float): Seconds to wait before the first reconnect attempt,
+                           doubling after each failure, default 1
+        max_delay (float): Maximum seconds between reconnect attempts,
+                           default 120
+
+    Functions:
+        stop() - Stop driving the client
+    """
+    def __init__(self, loop, client, min_delay: float = 1, max_delay: float = 120) -> None:
+        self._loop = loop
+        self._client = client
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._misc = None
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+
+    def _on_socket_open(self, client, userdata, sock) -> None:
+        """Callback to start reading the socket once connected"""
+        # pylint: disable=W0613 # method signature
+        self._loop.add_reader(sock, self._read, sock)
+        if self._misc is None:
+            self._misc = self._loop.create_task(self._misc_loop())
+
+
+    def _on_socket_close(self, client, userdata, sock) -> None:
+        """Callback to stop using the socket once closed"""
+        # pylint: disable=W0613 # method signature
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+
+    def _on_socket_register_write(self, client, userdata, sock) -> None:
+        """Callback to write the socket once it can take more data"""
+        # pylint: disable=W0613 # method signature
+        self._loop.add_writer(sock, self._client.loop_write)
+
+
+    def _on_socket_unregister_write(self, client, userdata, sock) -> None:
+        """Callback to stop writing the socket once there is nothing to send"""
+        # pylint: disable=W0613 # method signature
+        self._loop.remove_writer(sock)
+
+
+    def _read(self, sock) -> None:
+        """Read the socket, including data TLS has already decrypted"""
+        self._client.loop_read()
+        pending = getattr(sock, 'pending', None)
+        while pending is not None and self._client.socket() is sock and pending() > 0:
+            self._client.loop_read()
+
+
+    async def _misc_loop(self) -> None:
+        """Send keepalives, retry publishes and reconnect when disconnected"""
+        delay = self._min_delay
+        while True:
+            if self._client.loop_misc() != mqtt_client.MQTT_ERR_NO_CONN:
+                await asyncio.sleep(1)
+                continue
+            logger.warning("Disconnected from MQTT, reconnecting in %ss", delay)
+            await asyncio.sleep(delay)
+            try:
+                self._client.reconnect()
+                delay = self._min_delay
+            except OSError as e:
+                logger.warning("Failed to reconnect to MQTT: %s", e)
+                delay = min(delay * 2, self._max_delay)
+
+
+    def stop(self) -> None:
+        """Stop driving the client"""
+        if self._misc is not None:
+            self._misc.cancel()
+            self._misc = None
+        sock = self._client.socket()
+        if sock is not None:
+            self._loop.remove_reader(sock)
+            self._loop.remove_writer(sock)
@@ -0,0 +1,132 @@
+"""Module providing a circuit breaker with exponential backoff"""
+import time
+from threading import Lock
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+###
+### CircuitBreaker class
+###
+class CircuitBreaker():
+    """
+    Tracks the health of a remote service.  Calls are allowed while the
+    breaker is closed, and once threshold calls in a row have failed it opens
+    and refuses calls for the backoff time.  The next call allowed after that
+    half-opens it as a probe: success closes the breaker, while failure opens
+    it again with the backoff doubled, up to max_backoff.
+
+    Polls are started and ended by different threads with the asyncio
+    runtime, so the state is locked.
+
+    Parameters:
+        backoff (float): Seconds the breaker stays open the first time
+        max_backoff (float): Most seconds the breaker stays open
+        threshold (int): Failures in a row that open the breaker, default 1
+
+    Functions:
+        allow(now) - Check if a call may be made, half-opening the breaker
+                     once the backoff is over
+        success() - Record a call that succeeded, closing the breaker
+        failure(now) - Record a call that failed, opening the breaker
+        get_state() - Get the breaker state
+        retry_in(now) - Seconds until an open breaker allows a probe
+        get_stats() - Get the state, failure and open counters
+    """
+    def __init__(self, backoff: float, max_backoff: float, threshold: int = 1) -> None:
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._threshold = threshold
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opens = 0
+        self._delay = backoff
+        self._retry_at = 0.0
+
+
+    def allow(self, now: float = None) -> bool:
+        """
+        Check if a call may be made
+        Parameters:
+            now (float): The monotonic time, default now
+        Returns:
+            bool: True unless the breaker is open
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN:
+                if now < self._retry_at:
+                    return False
+                self._state = HALF_OPEN
+            return True
+
+
+    def success(self) -> bool:
+        """
+        Record a call that succeeded, closing the breaker
+        Returns:
+            bool: True if the breaker was open or half-open
+        """
+        with self._lock:
+            recovered = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+            self._delay = self._backoff
+            return recovered
+
+
+    def failure(self, now: float = None) -> bool:
+        """
+        Record a call that failed, opening the breaker if it was half-open
+        or threshold calls in a row have failed
+        Parameters:
+            now (float): The monotonic time the call was made, default now
+        Returns:
+            bool: True if the breaker was closed and is now open
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN:
+                # The probe failed, so back off for longer
+                self._delay = min(self._delay * 2, self._max_backoff)
+            elif self._failures < self._threshold:
+                return False
+            opened = self._state == CLOSED
+            self._state = OPEN
+            self._opens += opened
+            self._retry_at = now + self._delay
+            return opened
+
+
+    def get_state(self) -> str:
+        """Returns the breaker state, CLOSED, OPEN or HALF_OPEN"""
+        with self._lock:
+            return self._state
+
+
+    def retry_in(self, now: float = None) -> float:
+        """Returns the seconds until an open breaker allows a probe"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            return max(self._retry_at - now, 0.0)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the breaker state and counters
+        Returns:
+            dict:
+                state (str): CLOSED, OPEN or HALF_OPEN
+                failures (int): Calls in a row that have failed
+                opens (int): Times the breaker has opened
+                backoff (float): Seconds the breaker is next held open for
+        """
+        with self._lock:
+            return {'state': self._state, 'failures': self._failures,
+                    'opens': self._opens, 'backoff': self._delay}
@@ -0,0 +1,80 @@
+"""Module providing JSON encoding and decoding with an optional fast backend"""
+import json
+import math
+import re
+
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+
+BACKEND = 'json' if orjson is None else 'orjson'
+
+# orjson and json format floats below 1e-4 or from 1e16 up differently
+# (0.00001 vs 1e-05, 1e16 vs 1e+16).  Output containing anything that
+# could be such a float is re-encoded with json, so both backends always
+# produce the same bytes.  The checks are cheap scans rather than a regex
+# matching number tokens, which would cost more than orjson saves.
+_EXPONENT = re.compile(rb'e[-0-9]')
+_SMALL_FLOAT = b'0.0000'
+
+
+def _finite(obj):
+    # NaN and Infinity aren't valid JSON, orjson writes them as null
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def _json_dumps(obj) -> bytes:
+    try:
+        data = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+    except ValueError:
+        data = json.dumps(_finite(obj), ensure_ascii=False, separators=(',', ':'))
+    return data.encode('utf-8')
+
+
+def loads(data):
+    """
+    Decode a JSON document
+    Parameters:
+        data (str | bytes): The document to decode
+    Returns:
+        The decoded object
+    Raises:
+        json.JSONDecodeError
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # json also accepts NaN and Infinity, and gives the usual error
+            # for anything that really is malformed
+            pass
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """
+    Encode an object as compact UTF-8 JSON, with NaN and Infinity as null.
+    The output is the same whichever backend is in use.
+    Parameters:
+        obj: The object to encode
+    Returns:
+        bytes: The encoded document
+    Raises:
+        TypeError: obj contains something that can't be encoded
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj)
+        except TypeError:
+            # Non-str keys, integers over 64 bits, etc.
+            return _json_dumps(obj)
+        if _SMALL_FLOAT not in data and _EXPONENT.search(data) is None:
+            return data
+    return _json_dumps(obj)
@@ -0,0 +1,63 @@
+"""Module providing single-flight call coalescing"""
+from threading import Event, Lock
+
+###
+### SingleFlight class
+###
+class _Call():
+    """A call in flight and the result it produced"""
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """
+    Coalesces concurrent calls for the same key, so only one is in flight
+    at a time.  Callers arriving while a call for their key is running wait
+    for it and receive its result, or have its exception raised.  Waiting
+    raises TimeoutError after the timeout passed to the constructor.
+    """
+    def __init__(self, timeout: int) -> None:
+        self.timeout = timeout
+        self._lock = Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """Run fn() unless a call for key is in flight, returning its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['calls'] += 1
+                leader = True
+            else:
+                self._stats['coalesced'] += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                raise TimeoutError(f"Could not get shared result for '{key}' "
+                                   f"within specified timeout of {self.timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> dict:
+        """Returns the number of calls made and the number coalesced into them"""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,55 @@
+"""Module providing small JSON state files kept across restarts"""
+import logging
+import os
+from threading import Lock
+
+from . import codec
+
+logger = logging.getLogger(__name__)
+
+# Held while writing, as sites refreshed in worker threads can save at once
+# and each file is written through the same temporary file
+_lock = Lock()
+
+
+def load(path: str, default=None):
+    """
+    Load a state file
+    Parameters:
+        path (str): The file to read
+        default: Returned if the file is missing or can't be read, default None
+    Returns:
+        The decoded state, or default
+    """
+    try:
+        with open(path, 'rb') as stream:
+            return codec.loads(stream.read())
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable state file '%s': %s", path, e)
+        return default
+
+
+def save(path: str, state) -> bool:
+    """
+    Save a state file, writing a temporary file and renaming it over the
+    old one so a crash or power cut never leaves a partial file
+    Parameters:
+        path (str): The file to write
+        state: The JSON serializable state
+    Returns:
+        bool: True if saved, False if it couldn't be written
+    """
+    tmp = f"{path}.tmp"
+    try:
+        with _lock:
+            with open(tmp, 'wb') as stream:
+                stream.write(codec.dumps(state))
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(tmp, path)
+        return True
+    except OSError as e:
+        logger.warning("Unable to save state file '%s': %s", path, e)
+        return False
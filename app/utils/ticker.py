@@ -0,0 +1,152 @@
+"""Module providing a drift-free fixed-rate ticker"""
+import math
+import random
+import time
+from collections import deque
+from threading import Lock
+
+###
+### Ticker class
+###
+class Ticker():
+    """
+    Fixed-rate ticks aligned to wall clock boundaries, so with a 30s interval
+    ticks fall on :00 and :30 of each minute.  The boundaries are set once
+    from the wall clock and then kept on the monotonic clock, so ticks don't
+    drift with wakeup latency or jump with clock changes.  Ticks are spread
+    by a random delay of up to jitter seconds after each boundary, without
+    moving the boundaries.  Boundaries that pass while the caller is late are
+    skipped rather than run back to back, and a tick that falls while the
+    cycle it started is still running is counted as an overrun and dropped.
+
+    Ticks are waited for and started by one thread, with cycles ended by
+    another, so the cycle accounting is locked.
+
+    Parameters:
+        interval (float): Seconds between ticks
+        jitter (float): Maximum random delay after each boundary, default 0
+
+    Functions:
+        timeout() - Seconds until the next tick is due
+        due() - Check if the next tick is due, moving on to the one after
+        begin() - Start the cycle for a due tick, unless one is running
+        end(duration) - End the running cycle, recording how long it took
+        get_stats() - Get the tick, overrun and cycle duration stats
+    """
+    # Number of recent cycle durations kept for percentiles
+    WINDOW = 100
+
+    def __init__(self, interval: float, jitter: float = 0) -> None:
+        self._interval = interval
+        self._jitter = jitter
+        self._next = self._align()
+        self._delay = self._random_delay()
+        self._lock = Lock()
+        self._running = False
+        self._durations = deque(maxlen=self.WINDOW)
+        self._stats = {
+            'ticks': 0,
+            'skipped': 0,
+            'overruns': 0,
+            'cycles': 0,
+            'total': 0.0,
+            'max': 0.0
+        }
+
+
+    def _align(self) -> float:
+        """Returns the monotonic time of the next wall clock boundary"""
+        wall = time.time()
+        boundary = math.floor(wall / self._interval + 1) * self._interval
+        return time.monotonic() + boundary - wall
+
+
+    def _random_delay(self) -> float:
+        """Returns the jitter for the next tick"""
+        return random.uniform(0, self._jitter) if self._jitter else 0.0
+
+
+    def timeout(self) -> float:
+        """Returns the seconds until the next tick is due"""
+        return max(self._next + self._delay - time.monotonic(), 0)
+
+
+    def due(self) -> bool:
+        """
+        Check if the next tick is due, and if so move on to the boundary
+        after it, skipping any that have already passed
+        Returns:
+            bool: True if a tick is due, False if woken early
+        """
+        now = time.monotonic()
+        if now < self._next + self._delay:
+            return False
+        missed = int((now - self._next) // self._interval)
+        self._next += (missed + 1) * self._interval
+        self._delay = self._random_delay()
+        with self._lock:
+            self._stats['ticks'] += 1
+            self._stats['skipped'] += missed
+        return True
+
+
+    def begin(self) -> bool:
+        """
+        Start the cycle for a due tick
+        Returns:
+            bool: True if started, False if the previous cycle is still
+                  running, which is counted as an overrun
+        """
+        with self._lock:
+            if self._running:
+                self._stats['overruns'] += 1
+                return False
+            self._running = True
+            return True
+
+
+    def end(self, duration: float) -> None:
+        """
+        End the running cycle
+        Parameters:
+            duration (float): Seconds the cycle took
+        """
+        with self._lock:
+            self._running = False
+            self._durations.append(duration)
+            self._stats['cycles'] += 1
+            self._stats['total'] += duration
+            self._stats['max'] = max(self._stats['max'], duration)
+
+
+    def get_stats(self) -> dict:
+        """
+        Get the tick and cycle stats
+        Returns:
+            dict:
+                interval (float): Seconds between ticks
+                ticks (int): Ticks that were due
+                skipped (int): Boundaries skipped while late
+                overruns (int): Ticks dropped as the previous cycle was running
+                cycles (int): Cycles ended
+                last (float): Seconds the last cycle took
+                mean (float): Mean seconds per cycle
+                p95 (float): 95th percentile of the recent cycles
+                max (float): Longest cycle in seconds
+                load (float): Mean cycle time as a fraction of the interval
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            durations = sorted(self._durations)
+            last = self._durations[-1] if self._durations else 0.0
+        total = stats.pop('total')
+        mean = total / stats['cycles'] if stats['cycles'] else 0.0
+        p95 = durations[min(int(len(durations) * 0.95), len(durations) - 1)] if durations else 0.0
+        return {
+            'interval': self._interval,
+            **stats,
+            'last': last,
+            'mean': mean,
+            'p95': p95,
+            'load': mean / self._interval
+        }
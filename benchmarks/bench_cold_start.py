@@ -0,0 +1,109 @@
+"""
+Benchmark of the time from starting the add-on to its first discovery and
+state messages at the fake broker, with no saved metadata (cold) vs the
+metadata saved by the last run (warm) vs that and the state snapshot saved by
+the last run (snapshot), against a fake gateway with the given latency.  The
+first fresh state is the first not replayed from the snapshot.  The add-on
+runs in-process from Powerwall3MQTT(), so the interpreter start and imports
+are not included.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs N] [--latency S] [--runtime threads|asyncio]
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import tempfile
+import threading
+import time
+
+import common
+from fake_broker import FakeBroker
+from fake_gateway import FakeGateway
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = os.environ.get('LOGLEVEL', 'WARNING')
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_REPORT_VITALS'] = 'True'
+import powerwall3mqtt # pylint: disable=C0413
+
+
+def first(broker: FakeBroker, seen: int, suffix: str, start: float, fresh: bool = False) -> float:
+    """
+    Returns the seconds from start to the first new message on a topic ending
+    in suffix, skipping those replayed from the snapshot if fresh
+    """
+    for ts, topic, payload in broker.messages[seen:]:
+        if topic.endswith(suffix) and not (fresh and b'"snapshot_age"' in payload):
+            return ts - start
+    return None
+
+
+def run(broker: FakeBroker) -> dict:
+    """Start the add-on, stopping it once it has sent a fresh state"""
+    # The last run is stopped with messages still on their way to the broker
+    time.sleep(0.2)
+    seen = len(broker.messages)
+
+    def stop():
+        while first(broker, seen, '/state', 0, fresh=True) is None:
+            time.sleep(0.001)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    watcher = threading.Thread(target=stop, daemon=True)
+    watcher.start()
+    start = time.monotonic()
+    powerwall3mqtt.Powerwall3MQTT().run()
+    watcher.join()
+    return {'discovery': first(broker, seen, '/config', start),
+            'state': first(broker, seen, '/state', start),
+            'fresh': first(broker, seen, '/state', start, fresh=True)}
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help="seconds added to each fake gateway response")
+    parser.add_argument('--blocks', type=int, default=2)
+    parser.add_argument('--runtime', default='threads', choices=('threads', 'asyncio'))
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, FakeBroker() as broker, \
+            FakeGateway(blocks=args.blocks, latency=args.latency) as gateway:
+        os.environ.update({
+            'POWERWALL3MQTT_CONFIG_MQTT_HOST': '127.0.0.1',
+            'POWERWALL3MQTT_CONFIG_MQTT_PORT': str(broker.port),
+            'POWERWALL3MQTT_CONFIG_TEDAPI_HOST': gateway.address,
+            'POWERWALL3MQTT_CONFIG_RUNTIME': args.runtime,
+        })
+        powerwall3mqtt.RATE_STATE = os.path.join(tmp, 'tedapi_rates.json')
+        powerwall3mqtt.METADATA_STATE = os.path.join(tmp, 'tedapi_metadata.json')
+        powerwall3mqtt.STATE_SNAPSHOT = os.path.join(tmp, 'mqtt_snapshot.json')
+        # Each mode starts from what the runs of the last one saved
+        for start, keep in (('cold', ()), ('warm', ('METADATA_STATE',)),
+                            ('snapshot', ('METADATA_STATE', 'STATE_SNAPSHOT'))):
+            results = []
+            for _ in range(args.runs):
+                for name in ('METADATA_STATE', 'STATE_SNAPSHOT'):
+                    path = getattr(powerwall3mqtt, name)
+                    if name not in keep and os.path.exists(path):
+                        os.remove(path)
+                results.append(run(broker))
+            rows.append({'start': start} | {
+                f"first {kind} ms": f"{statistics.median(r[key] for r in results) * 1000:.1f}"
+                for key, kind in (('discovery', 'discovery'), ('state', 'state'),
+                                  ('fresh', 'fresh state'))})
+    common.report(
+        f"Time to first publish, {args.runtime} runtime, {args.blocks} block(s) with vitals, "
+        f"{args.latency * 1000:.0f}ms gateway latency, median of {args.runs}",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
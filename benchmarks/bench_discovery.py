@@ -0,0 +1,68 @@
+"""
+Benchmark of Powerwall3MQTT.discover() when Home Assistant comes online, with
+the discovery messages cached and only built again when the device metadata
+changes, versus building and encoding them every time as before.  The 0.5s
+sleep that used to follow is not included, as states are now deferred to the
+main loop instead of blocking it.
+
+Usage:
+    python benchmarks/bench_discovery.py [--number N]
+"""
+
+import argparse
+import os
+
+import common
+import payloads
+from bench_poll_cycle import MQTTSink
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = 'localhost'
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+import powerwall3mqtt # pylint: disable=C0413
+from hamqtt.devices import TeslaSystem # pylint: disable=C0413
+from utils import codec # pylint: disable=C0413
+
+
+def discover_rebuild(mqtt, tesla) -> None:
+    """Powerwall3MQTT.discover() as it was, without the sleep"""
+    for message in tesla.get_discoveries(prefix='homeassistant',
+                                         will_topic=powerwall3mqtt.WILL_TOPIC):
+        mqtt.publish(message['topic'], codec.dumps(message['payload']))
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=500)
+    args = parser.parse_args()
+
+    app = powerwall3mqtt.Powerwall3MQTT()
+    sink = MQTTSink()
+    rows = []
+    for blocks in (1, 4, 16):
+        tesla = TeslaSystem(payloads.StaticAPI(blocks), report_vitals=True)
+        site = powerwall3mqtt.Site('localhost', 'fake', 30, 0)
+        site.tesla = tesla
+        app.discover(sink, site)
+        rebuild = common.per_call(lambda: discover_rebuild(sink, tesla), args.number) # pylint: disable=W0640
+        cached = common.per_call(lambda: app.discover(sink, site), args.number) # pylint: disable=W0640
+        unchanged = common.per_call(
+            lambda: app.discover(sink, site, force=False), args.number) # pylint: disable=W0640
+        rows.append({
+            'blocks': blocks,
+            'messages': len(tesla.powerwalls) + 1,
+            'rebuild us': f"{rebuild:.1f}",
+            'cached us': f"{cached:.1f}",
+            'speedup': f"{rebuild / cached:.1f}x",
+            'metadata check us': f"{unchanged:.1f}",
+        })
+    common.report(
+        f"Discovery when HA comes online ({args.number} calls each, {codec.BACKEND})",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
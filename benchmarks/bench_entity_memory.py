@@ -0,0 +1,124 @@
+"""
+Benchmark of the memory used by the entities of a TeslaSystem and its
+PowerWall3 devices, with the __slots__ entities sharing interned descriptors
+versus the previous entities keeping all their metadata in an instance
+__dict__, and of memory growth while a 16 block system is polled for --days
+at the default poll interval.
+
+Usage:
+    python benchmarks/bench_entity_memory.py [--days N] [--interval S]
+"""
+
+import argparse
+import copy
+import gc
+import tracemalloc
+
+import common
+import payloads
+from bench_state_publishing import DEADBANDS, FULL_REFRESH_CYCLES, QuietAPI
+
+from hamqtt import entities
+from hamqtt.devices import TeslaSystem
+from utils import codec
+
+
+class LegacyEntity:
+    """Stands in for an entity as it was, with its attributes in __dict__"""
+
+
+def legacy_copy(entity: entities.Entity) -> LegacyEntity:
+    """Returns a copy of entity with the attributes the previous classes had"""
+    legacy = LegacyEntity()
+    legacy.__dict__.update({
+        'prefix': entity.prefix,
+        'name': entity.name,
+        'platform': entity.platform,
+        'template': entity.template,
+        'device_class': entity.device_class,
+        'unit': entity.unit,
+        'state_class': entity.state_class,
+        'value': getattr(entity, 'value', None),
+        'enabled': entity.enabled,
+    })
+    if isinstance(entity, entities.ValueEntity):
+        legacy.__dict__['published'] = entity.published
+    return legacy
+
+
+def get_entities(item) -> list:
+    """Returns every entity of a device, including those in nested dicts"""
+    found = []
+    for value in (vars(item) if not isinstance(item, dict) else item).values():
+        if isinstance(value, entities.Entity):
+            found.append(value)
+        elif isinstance(value, dict):
+            found += get_entities(value)
+    return found
+
+
+def run_days(days: float, interval: int) -> list:
+    """Poll a quiet 16 block system, returning the traced memory each day"""
+    for cls, deadband in DEADBANDS.items():
+        cls.deadband = deadband
+    api = QuietAPI(16, 5)
+    tesla = TeslaSystem(api, report_vitals=True)
+    cycles_per_day = 86400 // interval
+    samples = []
+    tracemalloc.start()
+    try:
+        for cycle in range(int(days * cycles_per_day) + 1):
+            api.step()
+            tesla.update()
+            full = cycle % FULL_REFRESH_CYCLES == 0
+            for message in tesla.get_states('homeassistant', changed_only=not full):
+                codec.dumps(message['payload'])
+            if cycle % cycles_per_day == 0:
+                gc.collect()
+                samples.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    return samples
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--days', type=float, default=3)
+    parser.add_argument('--interval', type=int, default=30)
+    args = parser.parse_args()
+
+    rows = []
+    for blocks in (1, 4, 16):
+        tesla = TeslaSystem(payloads.StaticAPI(blocks), report_vitals=True)
+        tesla.update()
+        found = get_entities(tesla)
+        for pw in tesla.powerwalls.values():
+            found += get_entities(pw)
+        legacy = common.retained(lambda: [legacy_copy(e) for e in found]) # pylint: disable=W0640
+        slots = common.retained(lambda: [copy.copy(e) for e in found]) # pylint: disable=W0640
+        rows.append({
+            'blocks': blocks,
+            'entities': len(found),
+            'descriptors': len({e.descriptor for e in found}),
+            'dict KiB': f"{legacy / 1024:.1f}",
+            'slots KiB': f"{slots / 1024:.1f}",
+            'B/entity': f"{legacy / len(found):.0f} -> {slots / len(found):.0f}",
+            'reduction': f"{legacy / slots:.1f}x",
+        })
+    common.report("Memory of the entities of a TeslaSystem, __dict__ vs __slots__",
+                  rows, list(rows[0].keys()))
+
+    samples = run_days(args.days, args.interval)
+    rows = [{
+        'day': day,
+        'traced KiB': f"{size / 1024:.1f}",
+        'growth B': size - samples[0],
+    } for day, size in enumerate(samples)]
+    common.report(
+        f"Traced memory polling 16 blocks every {args.interval}s for {args.days:g} days",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of the JSON work done in one poll cycle, with the standard json
+module as before versus utils.codec, for a range of battery block counts.
+Decoding covers the get_status() and get_pw_vitals() response text; encoding
+covers the MQTT state messages built by TeslaSystem.get_states(), once per
+message plus once more for the DEBUG log as before.
+
+Usage:
+    python benchmarks/bench_json_codec.py [--number N]
+"""
+
+import argparse
+import json
+
+import common
+import payloads
+
+from hamqtt.devices import TeslaSystem
+from utils import codec
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=500)
+    args = parser.parse_args()
+
+    rows = []
+    for blocks in (1, 4, 16):
+        api = payloads.StaticAPI(blocks)
+        texts = [json.dumps(api.get_status())]
+        texts += [json.dumps(api.get_pw_vitals(vin)) for vin in payloads.battery_vins(blocks)]
+
+        tesla = TeslaSystem(api)
+        tesla.update()
+        states = [m['payload'] for m in tesla.get_states(prefix='homeassistant')]
+        for payload in states:
+            # pylint: disable=W0212
+            assert codec.dumps(payload) == codec._json_dumps(payload)
+
+        def decode_json():
+            for text in texts:
+                json.loads(text)
+
+        def decode_codec():
+            for text in texts:
+                codec.loads(text)
+
+        def encode_json():
+            for payload in states:
+                json.dumps(payload)
+                json.dumps(payload)
+
+        def encode_codec():
+            for payload in states:
+                codec.dumps(payload).decode('utf-8')
+
+        times = {name: common.per_call(fn, args.number) for name, fn in (
+            ('decode json', decode_json), ('decode codec', decode_codec),
+            ('encode json', encode_json), ('encode codec', encode_codec))}
+        before = times['decode json'] + times['encode json']
+        after = times['decode codec'] + times['encode codec']
+        rows.append({
+            'blocks': blocks,
+            'decoded B': sum(len(t) for t in texts),
+            'messages': len(states),
+            **{f"{name} us": f"{value:.1f}" for name, value in times.items()},
+            'saved us/cycle': f"{before - after:.1f}",
+        })
+    common.report(
+        f"JSON per poll cycle, json vs codec ({codec.BACKEND}, "
+        f"{args.number} cycles each)",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark of running several gateways (tedapi_gateways) in one add-on process
+against fake gateways.  For each number of sites it measures the memory
+retained by the connected sites and the CPU time of polling each of them,
+giving the cost of each added site, and compares the memory with running a
+separate process for each gateway, as was needed before.
+
+Usage:
+    python benchmarks/bench_multi_gateway.py [--sites N] [--blocks N] [--polls N]
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import common
+from bench_poll_cycle import MQTTSink
+from fake_gateway import FakeGateway
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = 'localhost'
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_REPORT_VITALS'] = 'True'
+# Polls run back to back, far faster than the rate governor allows
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_RATE_GOVERNOR'] = 'False'
+import powerwall3mqtt # pylint: disable=C0413
+from paho.mqtt import client as mqtt_client # pylint: disable=C0413
+
+
+def rss() -> int:
+    """Returns the resident set size of this process in bytes"""
+    with open('/proc/self/statm', 'r', encoding='utf-8') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def make_app(gateways: list) -> powerwall3mqtt.Powerwall3MQTT:
+    """Create the add-on configured for the fake gateways"""
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_GATEWAYS'] = json.dumps(
+        [{'host': gateway.address, 'password': 'fake'} for gateway in gateways])
+    return powerwall3mqtt.Powerwall3MQTT()
+
+
+def run(gateways: list, polls: int) -> dict:
+    """Start a site for each gateway and poll them, returning the costs"""
+    sink = MQTTSink()
+    gc.collect()
+    before = rss()
+    tracemalloc.start()
+    try:
+        app = make_app(gateways)
+        sites = app._sites # pylint: disable=W0212
+        for site in sites:
+            app.start_site(sink, site)
+        app._deadlines.clear() # pylint: disable=W0212
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    resident = rss() - before
+
+    # Polls between the vitals, config and firmware refreshes, which only
+    # fetch the status
+    cpu = 0.0
+    wall = 0.0
+    for _ in range(polls):
+        for site in sites:
+            # pylint: disable=W0212
+            site.next_refresh.pop('status', None)
+            site.tesla.tedapi._cache.clear()
+        wall -= time.perf_counter()
+        cpu -= time.thread_time()
+        for site in sites:
+            app.update(sink, site, True)
+        cpu += time.thread_time()
+        wall += time.perf_counter()
+    return {
+        'traced': traced,
+        'rss': resident,
+        'cpu': cpu / polls,
+        'wall': wall / polls,
+        'connected': sum(site.tesla is not None for site in sites),
+    }
+
+
+def child(address: str) -> None:
+    """Print the resident memory of a process running a single gateway"""
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_GATEWAYS'] = json.dumps(
+        [{'host': address, 'password': 'fake'}])
+    app = powerwall3mqtt.Powerwall3MQTT()
+    app.start_site(MQTTSink(), app._sites[0]) # pylint: disable=W0212
+    # Each process has its own MQTT client too
+    mqtt_client.Client(client_id='bench',
+                       callback_api_version=mqtt_client.CallbackAPIVersion.VERSION2)
+    gc.collect()
+    print(rss())
+
+
+def process_rss(address: str) -> int:
+    """Returns the resident memory of a separate process for one gateway"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', address],
+        check=True, capture_output=True, text=True, cwd=common.APP_DIR)
+    return int(result.stdout.split()[-1])
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sites', type=int, default=16)
+    parser.add_argument('--blocks', type=int, default=2)
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < args.sites] + [args.sites]
+    with contextlib.ExitStack() as stack:
+        gateways = [stack.enter_context(FakeGateway(blocks=args.blocks, site=i))
+                    for i in range(args.sites)]
+        # Warm up imports and the protobuf and JSON codecs
+        run(gateways[:1], 1)
+        process = process_rss(gateways[0].address)
+
+        rows = []
+        for count in counts:
+            result = run(gateways[:count], args.polls)
+            assert result['connected'] == count
+            rows.append({
+                'sites': count,
+                'traced KiB': f"{result['traced'] / 1024:.0f}",
+                'KiB/site': f"{result['traced'] / count / 1024:.0f}",
+                'RSS MiB': f"{result['rss'] / 2**20:.1f}",
+                'process per site MiB': f"{process * count / 2**20:.1f}",
+                'poll CPU ms': f"{result['cpu'] * 1000:.2f}",
+                'CPU ms/site': f"{result['cpu'] * 1000 / count:.2f}",
+                'poll wall ms': f"{result['wall'] * 1000:.1f}",
+            })
+    common.report(
+        f"Gateways in one process, {args.blocks} block(s) each with vitals, "
+        f"status polls averaged over {args.polls}",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
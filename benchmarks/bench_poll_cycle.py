@@ -0,0 +1,210 @@
+"""
+End-to-end benchmark of Powerwall3MQTT.update(), the work done on every poll,
+against the fake gateway and an in-process MQTT sink.  The time of each stage
+is measured separately, excluding the stages it calls:
+
+    fetch       TeslaEnergyDeviceAPI.request()/post(), the HTTPS round trip
+    parse       decoding the protobuf response (messages.parse_*())
+    decode      JSON decoding of the response text (codec.loads())
+    cache       Powerwall3API response caching
+    mapping     TeslaSystem.update(), mapping responses to entities
+    get_states  building the MQTT state messages
+    serialize   JSON encoding of the messages (codec.dumps())
+    publish     handing the messages to MQTT
+
+Scenarios cover 1, 4 and 16 battery blocks, with vitals on and off, and with
+a cold cache (every response fetched) or a warm one (every response cached).
+Every data source is refreshed on each cycle, see bench_poll_schedule.py for
+how often each is refreshed.
+Results are printed and saved as JSON.
+
+Usage:
+    python benchmarks/bench_poll_cycle.py [--cycles N] [--latency S] [--output FILE]
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import common
+from fake_gateway import FakeGateway
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = 'localhost'
+import powerwall3mqtt # pylint: disable=C0413
+import pytedapi # pylint: disable=C0413
+from hamqtt.devices import TeslaSystem # pylint: disable=C0413
+from pytedapi import messages # pylint: disable=C0413
+from utils import codec # pylint: disable=C0413
+
+STAGES = ('fetch', 'parse', 'decode', 'cache', 'mapping',
+          'get_states', 'serialize', 'publish')
+
+
+class StageTimer():
+    """
+    Accumulates the time spent in wrapped functions by stage, excluding time
+    spent in other wrapped functions they call.  Only calls made by the thread
+    that created it are timed, not those made by the fake gateway.
+    """
+    def __init__(self) -> None:
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self._stack = []
+        self._thread = threading.get_ident()
+
+
+    def reset(self) -> None:
+        """Zero the totals"""
+        self.totals = dict.fromkeys(STAGES, 0.0)
+
+
+    def wrap(self, owner, name: str, stage: str) -> None:
+        """Replace owner.name with a wrapper timing it as stage"""
+        fn = getattr(owner, name)
+        stack = self._stack
+        thread = self._thread
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if threading.get_ident() != thread:
+                return fn(*args, **kwargs)
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                self.totals[stage] += elapsed - nested
+                if stack:
+                    stack[-1] += elapsed
+
+        setattr(owner, name, timed)
+
+
+class MQTTSink():
+    """Stands in for the paho MQTT client, counting what is published"""
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+
+
+    def publish(self, topic, payload):
+        """See paho.mqtt.client.Client.publish()"""
+        self.messages += 1
+        self.bytes += len(topic) + len(payload)
+        return (0, self.messages)
+
+
+def instrument(timer: StageTimer, sink: MQTTSink) -> None:
+    """Wrap the functions making up each stage"""
+    # pylint: disable=W0212
+    timer.wrap(pytedapi.TeslaEnergyDeviceAPI, 'request', 'fetch')
+    timer.wrap(pytedapi.TeslaEnergyDeviceAPI, 'post', 'fetch')
+    for name in ('parse_config_response', 'parse_query_response', 'parse_firmware_response'):
+        timer.wrap(messages, name, 'parse')
+    timer.wrap(codec, 'loads', 'decode')
+    timer.wrap(pytedapi.Powerwall3API, '_cached', 'cache')
+    timer.wrap(TeslaSystem, 'update', 'mapping')
+    timer.wrap(TeslaSystem, 'get_states', 'get_states')
+    timer.wrap(codec, 'dumps', 'serialize')
+    timer.wrap(sink, 'publish', 'publish')
+
+
+def run_scenario(gateway, timer, sink, vitals: bool, cycles: int) -> list:
+    """Run the cold and warm cache cycles of a scenario"""
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_HOST'] = gateway.address
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+    # Cycles run back to back, far faster than the rate governor allows
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_RATE_GOVERNOR'] = 'False'
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_REPORT_VITALS'] = str(vitals)
+    app = powerwall3mqtt.Powerwall3MQTT()
+    site = app._sites[0] # pylint: disable=W0212
+    tesla = app.connect_tedapi(site)
+    # The first update sends discovery, and the main loop would then send
+    # the states it defers
+    app.update(sink, site, True)
+    app._deadlines.clear() # pylint: disable=W0212
+
+    results = []
+    for cache in ('cold', 'warm'):
+        timer.reset()
+        sink.messages = sink.bytes = 0
+        requests = gateway.get_stats()['requests']
+        total = 0.0
+        for _ in range(cycles):
+            # pylint: disable=W0212
+            # Every data source is due, as on the first poll
+            site.next_refresh.clear()
+            if cache == 'cold':
+                tesla.tedapi._cache.clear()
+                tesla.tedapi._config.clear()
+            start = time.perf_counter()
+            app.update(sink, site, True)
+            total += time.perf_counter() - start
+        results.append({
+            'blocks': gateway.blocks,
+            'vitals': vitals,
+            'cache': cache,
+            'cycles': cycles,
+            'total_us': total * 1e6 / cycles,
+            'stages_us': {k: v * 1e6 / cycles for k, v in timer.totals.items()},
+            'requests': (gateway.get_stats()['requests'] - requests) / cycles,
+            'messages': sink.messages / cycles,
+            'bytes': sink.bytes / cycles,
+        })
+    return results
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds added to each fake gateway response")
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), 'poll_cycle.json'))
+    args = parser.parse_args()
+
+    timer = StageTimer()
+    sink = MQTTSink()
+    instrument(timer, sink)
+
+    results = []
+    for blocks in (1, 4, 16):
+        with FakeGateway(blocks=blocks, latency=args.latency) as gateway:
+            for vitals in (False, True):
+                results += run_scenario(gateway, timer, sink, vitals, args.cycles)
+
+    rows = [{
+        'blocks': r['blocks'],
+        'vitals': 'on' if r['vitals'] else 'off',
+        'cache': r['cache'],
+        'requests': f"{r['requests']:.0f}",
+        **{f"{k} us": f"{v:.0f}" for k, v in r['stages_us'].items()},
+        'total us': f"{r['total_us']:.0f}",
+    } for r in results]
+    common.report(
+        f"Powerwall3MQTT.update() by stage ({args.cycles} cycles each, "
+        f"{args.latency * 1000:.0f}ms latency, {codec.BACKEND})",
+        rows, list(rows[0].keys()))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'python': sys.version,
+            'platform': platform.platform(),
+            'json_backend': codec.BACKEND,
+            'latency': args.latency,
+            'scenarios': results,
+        }, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark of the requests made to the gateway over an hour of polling, with
+every data source refreshed on each poll as before (the status cache expiring
+after 4s and the config and firmware cache after 29s) versus the multi-rate
+schedule of Powerwall3MQTT.refresh(), which refreshes vitals, config and
+firmware at their own intervals.  A simulated clock is used, and the cache
+expiry of each function is emulated the way Powerwall3API applies it.
+
+Usage:
+    python benchmarks/bench_poll_schedule.py [--blocks N] [--hours N]
+"""
+
+import argparse
+import os
+import types
+
+import common
+import payloads
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = 'localhost'
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+import powerwall3mqtt # pylint: disable=C0413
+from hamqtt.devices import TeslaSystem # pylint: disable=C0413
+
+# Cache expiry of the previous fixed rate polling
+FIXED_EXPIRE = {
+    'get_status': 4,
+    'get_pw_vitals': 4,
+    'get_config': 29,
+    'get_firmware_version': 29
+}
+
+
+class Clock():
+    """A simulated time.monotonic()"""
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """See time.monotonic()"""
+        return self.now
+
+
+class CachingAPI(payloads.StaticAPI):
+    """StaticAPI with the caching of Powerwall3API, counting cache misses"""
+    def __init__(self, blocks: int, clock: Clock, expire: dict) -> None:
+        super().__init__(blocks)
+        self._clock = clock
+        self._expire = expire
+        self._expires = {}
+        self.requests = 0
+
+    def _fetch(self, key: str) -> None:
+        """Count a request unless the key is cached"""
+        now = self._clock.now
+        if now >= self._expires.get(key, 0):
+            self.requests += 1
+            self._expires[key] = now + self._expire[key.split('(')[0]]
+
+    def get_firmware_version(self, details=False):
+        """See Powerwall3API.get_firmware_version()"""
+        self._fetch('get_firmware_version')
+        return super().get_firmware_version(details)
+
+    def get_config(self, force=False):
+        """See Powerwall3API.get_config()"""
+        self._fetch('get_config')
+        return super().get_config(force)
+
+    def get_status(self, force=False):
+        """See Powerwall3API.get_status()"""
+        self._fetch('get_status')
+        return super().get_status(force)
+
+    def get_pw_vitals(self, din, force=False):
+        """See Powerwall3API.get_pw_vitals()"""
+        self._fetch(f'get_pw_vitals({din})')
+        return super().get_pw_vitals(din, force)
+
+
+def run(blocks: int, hours: float, interval: int, multirate: bool) -> dict:
+    """Poll for a number of hours, returning the requests made"""
+    clock = Clock()
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_POLL_INTERVAL'] = str(interval)
+    app = powerwall3mqtt.Powerwall3MQTT()
+    powerwall3mqtt.time = types.SimpleNamespace(monotonic=clock.monotonic)
+    expire = FIXED_EXPIRE
+    if multirate:
+        # As set by Powerwall3MQTT.connect_tedapi()
+        slack = interval / 2
+        expire = FIXED_EXPIRE | {
+            'get_pw_vitals': app._config['tedapi_vitals_interval'] - slack, # pylint: disable=W0212
+            'get_config': app._config['tedapi_config_interval'] - slack, # pylint: disable=W0212
+            'get_firmware_version': app._config['tedapi_firmware_interval'] - slack # pylint: disable=W0212
+        }
+    api = CachingAPI(blocks, clock, expire)
+    tesla = TeslaSystem(api, report_vitals=True)
+    site = powerwall3mqtt.Site('localhost', 'fake', interval, 0)
+    site.tesla = tesla
+    api.requests = 0
+    api._expires.clear() # pylint: disable=W0212
+    polls = int(hours * 3600 / interval)
+    for _ in range(polls):
+        if multirate:
+            app.refresh(site)
+        else:
+            tesla.update()
+        clock.now += interval
+    return {'polls': polls, 'requests': api.requests}
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--blocks', type=int, default=4)
+    parser.add_argument('--hours', type=float, default=1)
+    args = parser.parse_args()
+
+    real_time = powerwall3mqtt.time
+    rows = []
+    try:
+        for multirate, interval in ((False, 30), (False, 10), (True, 30), (True, 10), (True, 5)):
+            result = run(args.blocks, args.hours, interval, multirate)
+            rows.append({
+                'schedule': 'multi-rate' if multirate else 'fixed',
+                'poll s': interval,
+                'status polls': result['polls'],
+                'requests': result['requests'],
+                'requests/poll': f"{result['requests'] / result['polls']:.2f}",
+            })
+    finally:
+        powerwall3mqtt.time = real_time
+    common.report(
+        f"Gateway requests over {args.hours:g} hour(s) with {args.blocks} block(s) "
+        "and vitals on (default vitals, config and firmware intervals)",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
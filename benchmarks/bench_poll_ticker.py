@@ -0,0 +1,113 @@
+"""
+Simulation of the poll timing over --hours, with the previous timing_loop()
+waiting the poll interval after each wakeup versus utils.ticker.Ticker.  Each
+wakeup is late by up to --latency seconds, and --slow of the updates take
+longer than the interval, as with vitals on a large system.  Updates run one
+at a time on the main loop, so ticks queue behind slow ones.  A simulated
+clock is used, so it runs in well under a second.
+
+Usage:
+    python benchmarks/bench_poll_ticker.py [--hours N] [--latency S] [--slow F]
+"""
+
+import argparse
+import random
+import types
+
+import common # pylint: disable=W0611
+
+from utils import ticker
+
+
+def durations(rng: random.Random, interval: float, slow: float):
+    """Yields update durations, a fraction slow of them longer than interval"""
+    while True:
+        if rng.random() < slow:
+            yield interval * rng.uniform(1.1, 2.5)
+        else:
+            yield interval * rng.uniform(0.05, 0.2)
+
+
+def run_wait(interval: float, hours: float, latency: float, slow: float) -> dict:
+    """The previous timing_loop(), queueing a tick after each wait"""
+    rng = random.Random(0)
+    update = durations(rng, interval, slow)
+    wake = free = 0.0
+    ticks = backlog = 0
+    delays = []
+    while wake < hours * 3600:
+        wake += interval + rng.uniform(0, latency)
+        ticks += 1
+        start = max(wake, free)
+        free = start + next(update)
+        delays.append(start - wake)
+        # Ticks queued behind the one just started
+        backlog = max(backlog, int((free - wake) // interval))
+    return {'ticks': ticks, 'cycles': ticks, 'overruns': 0, 'backlog': backlog,
+            'drift': wake - ticks * interval, 'delays': delays}
+
+
+def run_ticker(interval: float, hours: float, latency: float, slow: float) -> dict:
+    """Ticker driving the same updates, dropping ticks while one is running"""
+    rng = random.Random(0)
+    update = durations(rng, interval, slow)
+    clock = types.SimpleNamespace(now=0.0)
+    ticker.time = types.SimpleNamespace(monotonic=lambda: clock.now,
+                                        time=lambda: clock.now)
+    tick = ticker.Ticker(interval)
+    first = tick.timeout()
+    running = None
+    delays = []
+    while clock.now < hours * 3600:
+        clock.now += tick.timeout() + rng.uniform(0, latency)
+        if running is not None and running[0] <= clock.now:
+            tick.end(running[1])
+            running = None
+        boundary = tick._next # pylint: disable=W0212
+        if not tick.due() or not tick.begin():
+            continue
+        duration = next(update)
+        running = (clock.now + duration, duration)
+        delays.append(clock.now - boundary)
+    stats = tick.get_stats()
+    # Drift of the next boundary from where a fixed rate would put it
+    drift = tick._next - first - round((tick._next - first) / interval) * interval # pylint: disable=W0212
+    return {'ticks': stats['ticks'], 'cycles': stats['cycles'] + (running is not None),
+            'overruns': stats['overruns'], 'backlog': 0, 'drift': drift, 'delays': delays}
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--interval', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--slow', type=float, default=0.05)
+    args = parser.parse_args()
+
+    real_time = ticker.time
+    rows = []
+    try:
+        for name, run in (('wait', run_wait), ('ticker', run_ticker)):
+            result = run(args.interval, args.hours, args.latency, args.slow)
+            delays = sorted(result['delays'])
+            rows.append({
+                'timing': name,
+                'ticks': result['ticks'],
+                'updates': result['cycles'],
+                'dropped': result['overruns'],
+                'max queued': result['backlog'],
+                'drift s': f"{result['drift']:.2f}",
+                'mean delay s': f"{sum(delays) / len(delays):.2f}",
+                'max delay s': f"{delays[-1]:.2f}",
+            })
+    finally:
+        ticker.time = real_time
+    common.report(
+        f"Poll timing over {args.hours:g}h at {args.interval:g}s, "
+        f"{args.slow:.0%} slow updates, up to {args.latency * 1000:g}ms wakeup latency",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
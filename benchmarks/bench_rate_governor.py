@@ -0,0 +1,172 @@
+"""
+Simulation of polling a gateway that rate limits requests, comparing the
+previous handling (a 300s cooldown after each 429 and a poll interval that
+grows by 1s each time) with the adaptive rate governor.  The gateway only
+allows --busy-limit requests per second for the first hour, as when another
+client is using it, and --limit after that.  The governor starts from its
+default rates, and again from the rates it had learned by the end of the busy
+hour, as restored after a restart.  Time is simulated, so hours of polling
+run in moments.
+
+Usage:
+    python benchmarks/bench_rate_governor.py [--hours N] [--limit R] [--busy-limit R]
+"""
+
+import argparse
+import types
+
+import common # pylint: disable=W0611
+
+from pytedapi import exceptions
+from pytedapi import governor as governor_module
+from pytedapi.governor import RateGovernor, TokenBucket
+
+INTERVAL = 10
+COOLDOWN = 300
+TIMEOUT = 5
+BUSY = 3600
+
+
+class Clock:
+    """A simulated monotonic clock"""
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """See time.monotonic()"""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """See time.sleep()"""
+        self.now += seconds
+
+
+class Gateway:
+    """A gateway answering 429 once requests exceed its rate limit"""
+    # pylint: disable=R0913
+    def __init__(self, clock: Clock, busy_limit: float, limit: float, burst: int) -> None:
+        self.clock = clock
+        self.start = clock.now
+        self.limit = limit
+        self.bucket = TokenBucket(busy_limit, burst)
+        self.bucket._updated = clock.now # pylint: disable=W0212
+        self.requests = 0
+        self.limited = 0
+
+    def busy(self) -> bool:
+        """Returns True during the busy hour"""
+        return self.clock.now < self.start + BUSY
+
+    def allow(self) -> bool:
+        """Returns True if a request is answered, False for a 429"""
+        self.requests += 1
+        if not self.busy():
+            self.bucket.rate = self.limit
+        if self.bucket.reserve(self.clock.now) > 0:
+            # A refused request doesn't use up the limit
+            self.bucket.tokens += 1
+            self.limited += 1
+            return False
+        return True
+
+
+def poll_paths(blocks: int) -> list:
+    """The requests of a poll, the status then the vitals of each block"""
+    return ['tedapi/v1'] + [f"tedapi/device/{i}/v1" for i in range(blocks)]
+
+
+def run_cooldown(clock: Clock, gateway: Gateway, blocks: int, hours: float) -> dict:
+    """Poll with the cooldown and growing poll interval"""
+    interval = INTERVAL
+    cooldown = 0.0
+    end = clock.now + hours * 3600
+    ok = last = 0
+    while clock.now < end:
+        if clock.now >= cooldown:
+            for _ in poll_paths(blocks):
+                if not gateway.allow():
+                    cooldown = clock.now + COOLDOWN
+                    interval += 1
+                    break
+            else:
+                ok += 1
+                last += clock.now >= end - 3600
+        clock.now += interval
+    return {'ok': ok, 'last': last, 'interval': interval}
+
+
+def run_governor(clock: Clock, gateway: Gateway, governor: RateGovernor,
+                 blocks: int, hours: float) -> dict:
+    """Poll through the rate governor at the fixed poll interval"""
+    end = clock.now + hours * 3600
+    ok = last = 0
+    boundary = clock.now
+    busy_rates = None
+    while clock.now < end:
+        if busy_rates is None and not gateway.busy():
+            busy_rates = governor.get_rates()
+        for path in poll_paths(blocks):
+            try:
+                waited = governor.acquire(path, TIMEOUT)
+            except exceptions.TEDAPIRateLimitedException:
+                break
+            if not gateway.allow():
+                governor.limited(path)
+                break
+            governor.success(path, waited)
+        else:
+            ok += 1
+            last += clock.now >= end - 3600
+        # Polls that run past the next boundary skip it
+        boundary += INTERVAL * (int((clock.now - boundary) // INTERVAL) + 1)
+        clock.now = boundary
+    return {'ok': ok, 'last': last, 'interval': INTERVAL, 'busy_rates': busy_rates}
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hours', type=float, default=6)
+    parser.add_argument('--limit', type=float, default=1.0,
+                        help="requests per second the gateway allows")
+    parser.add_argument('--busy-limit', type=float, default=0.3,
+                        help="requests per second allowed in the first hour")
+    parser.add_argument('--blocks', type=int, default=4)
+    args = parser.parse_args()
+
+    real_time = governor_module.time
+    rows = []
+    learned = None
+    try:
+        for name in ('cooldown', 'governor', 'governor warm'):
+            clock = Clock()
+            governor_module.time = types.SimpleNamespace(
+                monotonic=clock.monotonic, sleep=clock.sleep)
+            gateway = Gateway(clock, args.busy_limit, args.limit, args.blocks + 1)
+            if name == 'cooldown':
+                result = run_cooldown(clock, gateway, args.blocks, args.hours)
+                rates = '-'
+            else:
+                governor = RateGovernor(rates=learned if name == 'governor warm' else None)
+                result = run_governor(clock, gateway, governor, args.blocks, args.hours)
+                learned = learned or result['busy_rates']
+                rates = ', '.join(f"{k} {v:.2f}" for k, v in governor.get_rates().items())
+            rows.append({
+                'policy': name,
+                'complete polls': result['ok'],
+                'last hour': f"{result['last']} / {3600 // INTERVAL}",
+                'requests': gateway.requests,
+                '429s': gateway.limited,
+                'final interval s': result['interval'],
+                'final rates /s': rates,
+            })
+    finally:
+        governor_module.time = real_time
+    common.report(
+        f"{args.hours:g}h of {INTERVAL}s polls with {args.blocks} blocks' vitals, gateway "
+        f"limited to {args.busy_limit:g} requests/s for an hour then {args.limit:g}",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark of recovering from a gateway error.  A fatal exit costs a restart
+of the add-on: a new interpreter, MQTT connect, DIN fetch, discovery and cold
+caches before the first state is sent, timed here from starting a process to
+its first state at the fake broker (the supervisor's own restart delay is not
+included).  With the circuit breaker the add-on stays up, so recovery is the
+next poll probing the gateway, timed in-process against the fake gateway.
+The probe schedule for outages of different lengths is then simulated with
+30s polls.
+
+Usage:
+    python benchmarks/bench_recovery.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import common
+from fake_broker import FakeBroker
+from fake_gateway import FakeGateway
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = 'localhost'
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+# Polls run back to back, far faster than the rate governor allows
+os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_RATE_GOVERNOR'] = 'False'
+import powerwall3mqtt # pylint: disable=C0413
+from utils.breaker import CircuitBreaker # pylint: disable=C0413
+
+POLL_INTERVAL = 30
+OUTAGES = (10, 60, 300, 1800)
+
+
+class MQTTSink():
+    """Stands in for the paho MQTT client, recording when states are published"""
+    def __init__(self) -> None:
+        self.states = []
+
+
+    def publish(self, topic, payload):
+        """See paho.mqtt.client.Client.publish()"""
+        if topic.endswith('/state'):
+            self.states.append((time.perf_counter(), payload))
+        return (0, len(self.states))
+
+
+def restart(broker: FakeBroker, gateway: FakeGateway) -> float:
+    """Returns the seconds from starting the add-on to its first state"""
+    env = os.environ | {
+        'POWERWALL3MQTT_CONFIG_MQTT_HOST': '127.0.0.1',
+        'POWERWALL3MQTT_CONFIG_MQTT_PORT': str(broker.port),
+        'POWERWALL3MQTT_CONFIG_TEDAPI_HOST': gateway.address,
+    }
+    seen = len(broker.messages)
+    start = time.monotonic()
+    process = subprocess.Popen( # pylint: disable=R1732
+        [sys.executable, 'powerwall3mqtt.py'], cwd=common.APP_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            states = [ts for ts, topic, _ in broker.messages[seen:] if topic.endswith('/state')]
+            if states:
+                return states[0] - start
+            if process.poll() is not None or time.monotonic() > start + 30:
+                raise RuntimeError("The add-on didn't send a state")
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def due(site) -> None:
+    """Make the status of a site due and uncached, as on the next poll"""
+    site.next_refresh.pop('status', None)
+    site.tesla.tedapi._cache.clear() # pylint: disable=W0212
+
+
+def probe(gateway: FakeGateway) -> float:
+    """Returns the seconds the poll probing a recovered gateway takes to send states"""
+    os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_HOST'] = gateway.address
+    app = powerwall3mqtt.Powerwall3MQTT()
+    site = app._sites[0] # pylint: disable=W0212
+    sink = MQTTSink()
+    app.start_site(sink, site)
+    app._deadlines.clear() # pylint: disable=W0212
+    # A failed poll opens the breaker
+    gateway.faults = ((500, 1.0),)
+    gateway._stats.setdefault(500, 0) # pylint: disable=W0212
+    due(site)
+    app.update(sink, site, True)
+    assert site.breaker.get_state() == 'open'
+    gateway.faults = ()
+    # The next poll probes as soon as it is due, without waiting for it here
+    site.breaker._retry_at = 0 # pylint: disable=W0212
+    due(site)
+    start = time.perf_counter()
+    app.update(sink, site, True)
+    assert site.breaker.get_state() == 'closed'
+    return sink.states[-1][0] - start
+
+
+def simulate(outage: float) -> dict:
+    """Simulate polls through an outage starting just after a poll"""
+    breaker = CircuitBreaker(POLL_INTERVAL, powerwall3mqtt.BREAKER_MAX_BACKOFF)
+    down, up = 1, 1 + outage
+    probes = 0
+    t = 0
+    while True:
+        t += POLL_INTERVAL
+        if not breaker.allow(t + POLL_INTERVAL / 2):
+            continue
+        if down <= t < up:
+            probes += breaker.get_state() == 'half-open'
+            breaker.failure(t)
+        else:
+            breaker.success()
+            return {'failed probes': probes, 'recovered after s': t - up,
+                    'unavailable s': t - POLL_INTERVAL}
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeBroker() as broker, FakeGateway(blocks=2) as gateway:
+        restarts = [restart(broker, gateway) for _ in range(args.runs)]
+        probes = [probe(gateway) for _ in range(args.runs)]
+    rows = [
+        {'recovery': 'restart, to first state',
+         'median ms': f"{statistics.median(restarts) * 1000:.0f}",
+         'max ms': f"{max(restarts) * 1000:.0f}"},
+        {'recovery': 'breaker probe poll',
+         'median ms': f"{statistics.median(probes) * 1000:.1f}",
+         'max ms': f"{max(probes) * 1000:.1f}"},
+    ]
+    common.report(f"Recovery work once the gateway answers, {args.runs} runs", rows,
+        list(rows[0].keys()))
+
+    rows = [{'outage s': outage} | simulate(outage) for outage in OUTAGES]
+    common.report(
+        f"Breaker probes with {POLL_INTERVAL}s polls, backing off to "
+        f"{powerwall3mqtt.BREAKER_MAX_BACKOFF}s",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of status requests competing with vitals and config requests for
+the gateway, served in arrival order vs by priority with the request
+dispatcher.  Worker threads keep fetching the vitals of each block and the
+config from the fake gateway, as a slow vitals update and the config checks
+do, while the status is fetched on a fixed interval.
+
+Usage:
+    python benchmarks/bench_request_priority.py [--seconds S] [--latency S]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import common # pylint: disable=W0611
+from fake_gateway import FakeGateway
+
+import pytedapi
+from pytedapi.dispatcher import PriorityDispatcher
+
+STATUS_INTERVAL = 0.5
+
+
+def worker(stop: threading.Event, fetch, latencies: list) -> None:
+    """Call fetch() until stopped, recording how long each call took"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            fetch()
+        except TimeoutError:
+            pass
+        latencies.append(time.perf_counter() - start)
+
+
+def run(gateway: FakeGateway, fifo: bool, workers: int, seconds: float) -> dict:
+    """Returns the latencies of each kind of request"""
+    tedapi = pytedapi.TeslaEnergyDeviceAPI('fake', host=gateway.address)
+    if fifo:
+        # Ageing this fast serves the longest waiting request first
+        tedapi._dispatcher = PriorityDispatcher(1, 5, aging=1e-9) # pylint: disable=W0212
+    api = pytedapi.Powerwall3API(tedapi)
+    vins = gateway.vins
+
+    latencies = {'status': [], 'vitals': [], 'config': []}
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker, args=(
+        stop, lambda i=i: api.get_pw_vitals(vins[i % len(vins)], force=True),
+        latencies['vitals'])) for i in range(workers)]
+    threads.append(threading.Thread(target=worker, args=(
+        stop, lambda: api.get_config(force=True), latencies['config'])))
+    for thread in threads:
+        thread.start()
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        api.get_status(force=True)
+        latencies['status'].append(time.perf_counter() - start)
+        time.sleep(max(STATUS_INTERVAL - (time.perf_counter() - start), 0))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds added to each fake gateway response")
+    parser.add_argument('--blocks', type=int, default=4)
+    args = parser.parse_args()
+
+    rows = []
+    with FakeGateway(blocks=args.blocks, latency=args.latency) as gateway:
+        for workers in (1, 4):
+            for fifo in (True, False):
+                latencies = run(gateway, fifo, workers, args.seconds)
+                status = sorted(latencies['status'])
+                rows.append({
+                    'vitals workers': workers,
+                    'order': 'arrival' if fifo else 'priority',
+                    'status p50 ms': f"{statistics.median(status) * 1000:.0f}",
+                    'status p95 ms': f"{status[int(len(status) * 0.95)] * 1000:.0f}",
+                    'status max ms': f"{status[-1] * 1000:.0f}",
+                    'vitals/s': f"{len(latencies['vitals']) / args.seconds:.1f}",
+                    'config max ms': f"{max(latencies['config']) * 1000:.0f}",
+                })
+    common.report(
+        f"Status every {STATUS_INTERVAL * 1000:.0f}ms against busy vitals and config "
+        f"workers, {args.latency * 1000:.0f}ms gateway latency, 1 request in flight",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of building and serializing TEDAPI requests on every call
+versus serving them from the request template registry.
+
+Usage:
+    python benchmarks/bench_request_templates.py [--number N]
+"""
+
+import argparse
+
+import common  # pylint: disable=W0611 # sets up sys.path
+
+from pytedapi import messages
+
+GATEWAY_DIN = "1232100-00-E--TG123456789012"
+PW_DIN = "1707000-11-J--TG123456789013"
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    builders = {
+        'config': lambda: messages.build_config_request(GATEWAY_DIN),
+        'firmware': lambda: messages.build_firmware_request(GATEWAY_DIN),
+        'status': lambda: messages.build_query_request('status', GATEWAY_DIN),
+        'vitals': lambda: messages.build_query_request(
+            'components', PW_DIN, sender_din=GATEWAY_DIN),
+    }
+    registry = messages.RequestTemplates()
+    cached = {
+        'config': lambda: registry.get('config', GATEWAY_DIN),
+        'firmware': lambda: registry.get('firmware', GATEWAY_DIN),
+        'status': lambda: registry.get('status', GATEWAY_DIN),
+        'vitals': lambda: registry.get('components', PW_DIN, sender_din=GATEWAY_DIN),
+    }
+
+    rows = []
+    for kind, build in builders.items():
+        assert build() == cached[kind]()
+        rows.append({
+            'request': kind,
+            'bytes': len(build()),
+            'build us': f"{common.per_call(build, args.number):.2f}",
+            'cached us': f"{common.per_call(cached[kind], args.number):.2f}",
+            'build alloc B': common.peak_alloc(build),
+            'cached alloc B': common.peak_alloc(cached[kind]),
+        })
+    common.report(f"Request building ({args.number} calls each)", rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark of the threads and asyncio runtimes (the runtime option) running the
+add-on end to end against the fake gateway and fake broker.  For each runtime
+it measures the threads the add-on runs, how long after an HA online message
+discovery is sent (with no debounce), how late polls are sent after their
+interval boundary, and how long shutdown takes after SIGTERM.
+
+Usage:
+    python benchmarks/bench_runtime.py [--polls N] [--blocks N]
+"""
+
+import argparse
+import os
+import signal
+import statistics
+import threading
+import time
+
+import common
+from fake_broker import FakeBroker
+from fake_gateway import FakeGateway
+
+# powerwall3mqtt loads logger.yaml from the working directory
+os.chdir(common.APP_DIR)
+os.environ['POWERWALL3MQTT_CONFIG_LOG_LEVEL'] = 'WARNING'
+import powerwall3mqtt # pylint: disable=C0413
+
+INTERVAL = 5
+
+
+def app_threads(baseline: set) -> list:
+    """Returns the names of the threads started by the add-on"""
+    return sorted(t.name for t in threading.enumerate()
+                  if t.ident not in baseline
+                  and not t.name.startswith('fake')
+                  and 'process_request_thread' not in t.name)
+
+
+def run(runtime: str, polls: int, broker: FakeBroker, gateway: FakeGateway) -> dict:
+    """Run the add-on with a runtime, returning its measurements"""
+    os.environ['POWERWALL3MQTT_CONFIG_RUNTIME'] = runtime
+    baseline = {t.ident for t in threading.enumerate()}
+    app = powerwall3mqtt.Powerwall3MQTT()
+    state_topic = f"homeassistant/device/TeslaEnergySystem_{gateway.din}/state"
+    result = {}
+
+    def driver():
+        # Initial discovery and states
+        start = len(broker.messages)
+        broker.wait_for(start + 2 * (len(gateway.vins) + 1))
+        time.sleep(0.5)
+        result['threads'] = app_threads(baseline)
+
+        # HA coming online
+        count = len(broker.messages)
+        sent = time.monotonic()
+        broker.send('homeassistant/status', b'online')
+        broker.wait_for(count + 1)
+        result['wakeup'] = broker.messages[count][0] - sent
+        # Skip the states sent after discovery
+        time.sleep(powerwall3mqtt.DISCOVERY_DELAY + 0.5)
+
+        # Polls, timed from their interval boundary
+        late = []
+        offset = time.time() - time.monotonic()
+        for _ in range(polls):
+            count = len(broker.messages)
+            while True:
+                broker.wait_for(count + 1, INTERVAL * 2)
+                arrived, topic, _ = broker.messages[count]
+                count += 1
+                if topic == state_topic:
+                    break
+            late.append((arrived + offset) % INTERVAL)
+        result['late'] = late
+
+        result['stopping'] = time.monotonic()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=driver, name='fake driver', daemon=True)
+    thread.start()
+    app.run()
+    result['shutdown'] = time.monotonic() - result['stopping']
+    thread.join()
+    return result
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--polls', type=int, default=3)
+    parser.add_argument('--blocks', type=int, default=2)
+    args = parser.parse_args()
+
+    rows = []
+    with FakeBroker() as broker, FakeGateway(blocks=args.blocks) as gateway:
+        os.environ['POWERWALL3MQTT_CONFIG_MQTT_HOST'] = '127.0.0.1'
+        os.environ['POWERWALL3MQTT_CONFIG_MQTT_PORT'] = str(broker.port)
+        os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_HOST'] = gateway.address
+        os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD'] = 'fake'
+        os.environ['POWERWALL3MQTT_CONFIG_TEDAPI_POLL_INTERVAL'] = str(INTERVAL)
+        os.environ['POWERWALL3MQTT_CONFIG_MQTT_HA_STATUS_DEBOUNCE'] = '0'
+        for runtime in ('threads', 'asyncio'):
+            result = run(runtime, args.polls, broker, gateway)
+            rows.append({
+                'runtime': runtime,
+                'threads': len(result['threads']),
+                'online to discovery ms': f"{result['wakeup'] * 1000:.2f}",
+                'poll late ms': f"{statistics.mean(result['late']) * 1000:.1f}",
+                'shutdown ms': f"{result['shutdown'] * 1000:.1f}",
+            })
+            print(f"{runtime} threads: {', '.join(result['threads'])}")
+    print()
+    common.report(
+        f"Add-on runtimes, {args.blocks} block(s), {args.polls} polls at {INTERVAL}s",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of the MQTT state messages sent on a quiet system (no solar, battery
+idle), sending every device state on every poll versus only changed states
+with the add-on's default deadbands and full refresh interval.  The load
+varies by up to --noise watts between polls.
+
+Usage:
+    python benchmarks/bench_state_publishing.py [--cycles N] [--noise W]
+"""
+
+import argparse
+import random
+
+import common
+import payloads
+
+from hamqtt import entities
+from hamqtt.devices import TeslaSystem
+from utils import codec
+
+# The defaults of the mqtt_deadband_* and mqtt_full_refresh_cycles options
+DEADBANDS = {
+    entities.PowerValue: 10.0,
+    entities.EnergyStorage: 10.0,
+    entities.Voltage: 1.0,
+    entities.Current: 0.1,
+    entities.Duration: 1800.0
+}
+FULL_REFRESH_CYCLES = 10
+
+
+class QuietAPI(payloads.StaticAPI):
+    """StaticAPI with the values of a quiet system, drifting on each step()"""
+    def __init__(self, blocks: int, noise: float) -> None:
+        super().__init__(blocks)
+        self._rng = random.Random(0)
+        self._noise = noise
+        self._load = 400.0
+        for vitals in self._vitals.values():
+            for signal in vitals['components']['pch'][0]['signals']:
+                if signal['name'].startswith('PCH_PvCurrent'):
+                    signal['value'] = 0.0
+
+
+    def step(self) -> None:
+        """Move to the values of the next poll"""
+        rng = self._rng
+        load = round(self._load + rng.uniform(-self._noise, self._noise), 2)
+        battery = round(rng.uniform(-2, 2), 2)
+        meters = {'LOAD': load, 'SITE': round(load - battery, 2), 'SOLAR': 0.0,
+                  'BATTERY': battery}
+        for meter in self._status['control']['meterAggregates']:
+            meter['realPowerW'] = meters[meter['location']]
+        self._status['control']['systemStatus']['nominalEnergyRemainingWh'] -= 1
+        for vitals in self._vitals.values():
+            for signal in vitals['components']['pch'][0]['signals']:
+                if signal['name'].startswith('PCH_PvVoltage'):
+                    signal['value'] = rng.uniform(-0.5, 0.5)
+
+
+def run(blocks: int, noise: float, cycles: int, changed_only: bool) -> tuple:
+    """Returns the number of messages and bytes sent over the cycles"""
+    api = QuietAPI(blocks, noise)
+    tesla = TeslaSystem(api, report_vitals=True)
+    count = size = 0
+    for cycle in range(cycles):
+        api.step()
+        tesla.update()
+        full = not changed_only or cycle % FULL_REFRESH_CYCLES == 0
+        for message in tesla.get_states('homeassistant', changed_only=not full):
+            count += 1
+            size += len(codec.dumps(message['payload']))
+    return count, size
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cycles', type=int, default=120)
+    parser.add_argument('--noise', type=float, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for blocks in (1, 4, 16):
+        for cls in DEADBANDS:
+            cls.deadband = 0
+        every = run(blocks, args.noise, args.cycles, changed_only=False)
+        for cls, deadband in DEADBANDS.items():
+            cls.deadband = deadband
+        changed = run(blocks, args.noise, args.cycles, changed_only=True)
+        rows.append({
+            'blocks': blocks,
+            'every msgs': every[0],
+            'every KiB': f"{every[1] / 1024:.1f}",
+            'changed msgs': changed[0],
+            'changed KiB': f"{changed[1] / 1024:.1f}",
+            'reduction': f"{every[1] / changed[1]:.1f}x",
+        })
+    common.report(
+        f"MQTT state messages over {args.cycles} polls of a quiet system "
+        f"(load +/-{args.noise:g}W)",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
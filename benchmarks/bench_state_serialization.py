@@ -0,0 +1,96 @@
+"""
+Benchmark of building and encoding the MQTT state messages of a TeslaSystem
+and its PowerWall3 devices each poll, with the compiled state plans versus
+the previous search of each device's attributes with vars() and issubclass().
+Both must produce the same bytes.
+
+Usage:
+    python benchmarks/bench_state_serialization.py [--number N]
+"""
+
+import argparse
+
+import common
+import payloads
+
+from hamqtt import entities
+from hamqtt.devices import TeslaSystem
+from utils import codec
+
+
+def recurse(item):
+    """Device.recurse() as it was, building the nested values of a dictionary"""
+    if issubclass(type(item), entities.Entity):
+        return item.get()
+    if issubclass(type(item), dict):
+        values = {}
+        for i in item.keys():
+            value = recurse(item[i])
+            if value is not None:
+                values[i] = value
+        if len(values):
+            return values
+    return None
+
+
+def get_state_reflect(device, prefix: str) -> dict:
+    """Device.get_state() as it was, searching the attributes on every call"""
+    msg = {}
+    msg['topic'] = f"{prefix}/device/{device.device_id}/state"
+    msg['payload'] = {}
+    msg['payload']['mqtt_availability'] = "offline"
+    if device.get_updated():
+        msg['payload']['mqtt_availability'] = "online"
+    for name, value in vars(device).items():
+        if issubclass(type(value), entities.ValueEntity):
+            msg['payload'][name] = value.get()
+        elif issubclass(type(value), dict):
+            value = recurse(value)
+            if value is not None:
+                msg['payload'][name] = value
+    return msg
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=500)
+    args = parser.parse_args()
+
+    rows = []
+    for blocks in (1, 4, 16):
+        tesla = TeslaSystem(payloads.StaticAPI(blocks), report_vitals=True)
+        devices = [tesla, *tesla.powerwalls.values()]
+
+        def encode_reflect():
+            return [codec.dumps(get_state_reflect(d, 'homeassistant')['payload'])
+                    for d in devices] # pylint: disable=W0640
+
+        def encode_plan():
+            return [codec.dumps(d.get_state('homeassistant')['payload'])
+                    for d in devices] # pylint: disable=W0640
+
+        # Compare before the first update, with every value None, and after
+        assert encode_plan() == encode_reflect()
+        tesla.update()
+        assert encode_plan() == encode_reflect()
+
+        reflect = common.per_call(encode_reflect, args.number)
+        plan = common.per_call(encode_plan, args.number)
+        rows.append({
+            'blocks': blocks,
+            'devices': len(devices),
+            'reflect us': f"{reflect:.1f}",
+            'plan us': f"{plan:.1f}",
+            'speedup': f"{reflect / plan:.1f}x",
+            'reflect peak B': common.peak_alloc(encode_reflect),
+            'plan peak B': common.peak_alloc(encode_plan),
+        })
+    common.report(
+        f"State messages built and encoded per poll ({args.number} polls each, "
+        f"{codec.BACKEND})",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
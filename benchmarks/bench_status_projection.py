@@ -0,0 +1,62 @@
+"""
+Benchmark of the full get_status() result versus the lean projection of the
+fields used by TeslaSystem, for a range of battery block counts.  The signed
+status query cannot be changed, so both start from the same response; the
+projection shrinks what is cached, logged and mapped on every poll.
+
+Usage:
+    python benchmarks/bench_status_projection.py [--number N]
+"""
+
+import argparse
+import json
+
+import common
+import payloads
+
+from hamqtt.devices import TeslaSystem
+from pytedapi import messages
+from pytedapi import tedapi_pb2
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    fields = messages.compile_fields(TeslaSystem.STATUS_FIELDS)
+    rows = []
+    for blocks in (1, 4, 16):
+        pb = tedapi_pb2.Message() # pylint: disable=E1101
+        pb.message.payload.recv.text = json.dumps(payloads.status(blocks))
+        content = pb.SerializeToString()
+
+        full = messages.parse_query_response(content)
+        lean = messages.project(full, fields)
+
+        def decode_full():
+            return messages.parse_query_response(content)
+
+        def decode_lean():
+            return messages.project(messages.parse_query_response(content), fields)
+
+        rows.append({
+            'blocks': blocks,
+            'wire B': len(content),
+            'full B': len(json.dumps(full)),
+            'lean B': len(json.dumps(lean)),
+            'full us': f"{common.per_call(decode_full, args.number):.1f}",
+            'lean us': f"{common.per_call(decode_lean, args.number):.1f}",
+            'full log us': f"{common.per_call(lambda: str(full), args.number):.1f}",
+            'lean log us': f"{common.per_call(lambda: str(lean), args.number):.1f}",
+            'full kept B': common.retained(decode_full),
+            'lean kept B': common.retained(decode_lean),
+        })
+    common.report(
+        f"get_status() decode, full vs lean ({args.number} calls each)",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
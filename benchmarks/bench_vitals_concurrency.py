@@ -0,0 +1,65 @@
+"""
+Benchmark of update cycles with vitals against the fake gateway, fetching
+the vitals of each Powerwall one after another (tedapi_max_inflight 1) vs
+several at once.  Each cycle fetches the status and the vitals of every
+battery block with the cache cleared, timed against the number of blocks.
+
+Usage:
+    python benchmarks/bench_vitals_concurrency.py [--cycles N] [--latency S]
+"""
+
+import argparse
+import time
+
+import common # pylint: disable=W0611
+from fake_gateway import FakeGateway
+
+import pytedapi
+from hamqtt.devices import TeslaSystem
+
+INFLIGHT = (1, 2, 4, 8)
+
+
+def run(gateway: FakeGateway, max_inflight: int, cycles: int) -> float:
+    """Returns the mean seconds per update cycle"""
+    tedapi = pytedapi.TeslaEnergyDeviceAPI(
+        'fake', host=gateway.address, max_inflight=max_inflight)
+    api = pytedapi.Powerwall3API(tedapi, cacheexpire=4, configexpire=29)
+    tesla = TeslaSystem(api, report_vitals=True, max_inflight=max_inflight)
+    # Open the pooled connections
+    api._cache.clear() # pylint: disable=W0212
+    tesla.update(('status', 'vitals'))
+    total = 0.0
+    for _ in range(cycles):
+        api._cache.clear() # pylint: disable=W0212
+        start = time.perf_counter()
+        tesla.update(('status', 'vitals'))
+        total += time.perf_counter() - start
+    return total / cycles
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds added to each fake gateway response")
+    args = parser.parse_args()
+
+    rows = []
+    for blocks in (1, 2, 4, 8, 16):
+        with FakeGateway(blocks=blocks, latency=args.latency) as gateway:
+            times = {n: run(gateway, n, args.cycles) for n in INFLIGHT}
+        row = {'blocks': blocks}
+        for n, seconds in times.items():
+            row[f"inflight {n} ms"] = f"{seconds * 1000:.0f}"
+        row['best speedup'] = f"{times[1] / min(times.values()):.1f}x"
+        rows.append(row)
+    common.report(
+        f"Status and vitals update cycle, {args.latency * 1000:.0f}ms gateway latency, "
+        f"{args.cycles} cycles",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of PowerWall3.update(), mapping a get_pw_vitals() payload to the
+battery and PV string entities, with the signals indexed by name versus the
+previous scan of every pch signal for each string.  Extra signals are added to
+the payload to show how each scales with its size.
+
+Usage:
+    python benchmarks/bench_vitals_mapping.py [--number N]
+"""
+
+import argparse
+
+import common
+import payloads
+
+from hamqtt.devices import PowerWall3, TeslaSystem
+
+
+def update_scan(pw: PowerWall3) -> None:
+    """PowerWall3.update() as it was, scanning the signals for each string"""
+    data = pw.tedapi.get_pw_vitals(pw.vin)
+    for signal in data['components']['bms'][0]['signals']:
+        match signal['name']:
+            case "BMS_nominalEnergyRemaining":
+                pw.battery_remaining.set(int(signal['value'] * 1000))
+            case "BMS_nominalFullPackEnergy":
+                pw.battery_capacity.set(int(signal['value'] * 1000))
+
+    for i, item in pw.strings.items():
+        pv_voltage = 0
+        pv_current = 0
+        for component in data['components']['pch']:
+            signals = component['signals']
+            for signal in signals:
+                if signal['name'] == f'PCH_PvState_{i}':
+                    item['mode'].set(signal['textValue'])
+                elif signal['name'] == f'PCH_PvVoltage{i}':
+                    pv_voltage = round(max(signal['value'], 0), 2)
+                    item['voltage'].set(pv_voltage)
+                elif signal['name'] == f'PCH_PvCurrent{i}':
+                    pv_current = round(max(signal['value'], 0), 2)
+                    item['current'].set(pv_current)
+        pv_power = pv_voltage * pv_current
+        item['power'].set(round(pv_power, 2))
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    for extra in (0, 100, 1000, 10000):
+        api = payloads.StaticAPI(1, extra_signals=extra)
+        pw = next(iter(TeslaSystem(api).powerwalls.values()))
+        signals = sum(len(c['signals']) for c in api.get_pw_vitals(pw.vin)['components']['pch'])
+
+        pw.update()
+        update_scan(pw)
+        before = pw.get_state('homeassistant')
+        pw.update()
+        assert pw.get_state('homeassistant') == before
+
+        scan = common.per_call(lambda: update_scan(pw), args.number) # pylint: disable=W0640
+        indexed = common.per_call(pw.update, args.number)
+        rows.append({
+            'pch signals': signals,
+            'scan us': f"{scan:.1f}",
+            'indexed us': f"{indexed:.1f}",
+            'speedup': f"{scan / indexed:.1f}x",
+        })
+    common.report(
+        f"PowerWall3.update() vitals mapping ({args.number} calls each)",
+        rows, list(rows[0].keys()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Helpers shared by the benchmark scripts"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def per_call(fn, number: int) -> float:
+    """Returns the mean wall time of fn() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) * 1e6 / number
+
+
+def peak_alloc(fn) -> int:
+    """Returns the peak number of bytes allocated by one call of fn()"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def retained(fn) -> int:
+    """Returns the number of bytes still allocated for the result of fn()"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        size = tracemalloc.get_traced_memory()[0] - before
+        del result
+        return size
+    finally:
+        tracemalloc.stop()
+
+
+def report(title: str, rows: list, columns: list) -> None:
+    """Prints rows of dictionaries as a simple table"""
+    print(title)
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+    print()
@@ -0,0 +1,205 @@
+"""
+A fake MQTT 3.1.1 broker, accepting any client and recording what each
+publishes, so the add-on can run end to end without a real broker.  QoS 0
+only, with no retained messages or forwarding between clients, but Home
+Assistant status messages can be sent to every subscribed client to stand in
+for HA coming online or going offline.
+
+Usage:
+    python benchmarks/fake_broker.py [--port 1883]
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+
+# MQTT control packet types
+CONNECT, CONNACK, PUBLISH, SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = (
+    1, 2, 3, 8, 9, 12, 13, 14)
+
+
+def _encode_length(length: int) -> bytes:
+    """Encode an MQTT remaining length"""
+    data = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        data.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(data)
+
+
+def publish_packet(topic: str, payload: bytes) -> bytes:
+    """Build a QoS 0 PUBLISH packet"""
+    topic = topic.encode('utf-8')
+    body = struct.pack('!H', len(topic)) + topic + payload
+    return bytes([PUBLISH << 4]) + _encode_length(len(body)) + body
+
+
+###
+### FakeBroker class
+###
+class FakeBroker():
+    """
+    A fake MQTT broker running in background threads
+
+    Parameters:
+        host (str): Address to listen on, default '127.0.0.1'
+        port (int): Port to listen on, default 0 for any free port
+
+    Functions:
+       start() - Start serving in a background thread
+       stop() - Stop serving
+       send(topic, payload) - Send a message to every client subscribed to topic
+       wait_for(count, timeout) - Wait until count messages have been published
+       get_stats() - Get connection and packet counters
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self._server = socket.create_server((host, port))
+        self._lock = threading.Condition()
+        self._clients = {}
+        self._thread = None
+        # (monotonic time, topic, payload) of each message published
+        self.messages = []
+        self._stats = {'connections': 0, 'publish': 0, 'subscribe': 0, 'ping': 0}
+
+
+    @property
+    def port(self) -> int:
+        """The port the broker listens on"""
+        return self._server.getsockname()[1]
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def start(self):
+        """Start accepting clients in a background thread"""
+        self._thread = threading.Thread(target=self._accept, name='fake broker', daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        """Stop serving, closing every client connection"""
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+
+
+    def send(self, topic: str, payload: bytes) -> None:
+        """Send a message to every client subscribed to topic"""
+        packet = publish_packet(topic, payload)
+        with self._lock:
+            for client, topics in self._clients.items():
+                if topic in topics:
+                    client.sendall(packet)
+
+
+    def wait_for(self, count: int, timeout: float = 10) -> bool:
+        """Wait until count messages have been published in total"""
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self.messages) >= count, timeout)
+
+
+    def get_stats(self) -> dict:
+        """Returns the connection and packet counters"""
+        with self._lock:
+            return dict(self._stats)
+
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients[client] = set()
+                self._stats['connections'] += 1
+            threading.Thread(target=self._serve, args=(client,), name='fake broker client',
+                             daemon=True).start()
+
+
+    def _serve(self, client) -> None:
+        stream = client.makefile('rb')
+        try:
+            while True:
+                header = stream.read(1)
+                if not header:
+                    return
+                length, shift = 0, 0
+                while True:
+                    byte = stream.read(1)[0]
+                    length |= (byte & 0x7f) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = stream.read(length)
+                self._handle(client, header[0] >> 4, header[0] & 0x0f, body)
+        except (OSError, IndexError):
+            return
+        finally:
+            with self._lock:
+                self._clients.pop(client, None)
+            client.close()
+
+
+    def _handle(self, client, kind: int, flags: int, body: bytes) -> None:
+        if kind == CONNECT:
+            client.sendall(bytes([CONNACK << 4, 2, 0, 0]))
+        elif kind == PUBLISH:
+            length = struct.unpack('!H', body[:2])[0]
+            topic = body[2:2 + length].decode('utf-8')
+            start = 2 + length + (2 if flags & 0x06 else 0)
+            with self._lock:
+                self.messages.append((time.monotonic(), topic, body[start:]))
+                self._stats['publish'] += 1
+                self._lock.notify_all()
+        elif kind == SUBSCRIBE:
+            packet_id, i, granted = body[:2], 2, bytearray()
+            topics = set()
+            while i < len(body):
+                length = struct.unpack('!H', body[i:i + 2])[0]
+                topics.add(body[i + 2:i + 2 + length].decode('utf-8'))
+                i += 3 + length
+                granted.append(0)
+            with self._lock:
+                self._clients[client] |= topics
+                self._stats['subscribe'] += 1
+            client.sendall(bytes([SUBACK << 4, 2 + len(granted)]) + packet_id + granted)
+        elif kind == PINGREQ:
+            with self._lock:
+                self._stats['ping'] += 1
+            client.sendall(bytes([PINGRESP << 4, 0]))
+        elif kind == DISCONNECT:
+            client.close()
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+
+    with FakeBroker(args.host, args.port) as broker:
+        print(f"Fake MQTT broker listening on {args.host}:{broker.port}")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"stats = {broker.get_stats()}")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""
+A fake Powerwall 3 gateway, serving the TEDAPI endpoints used by pytedapi over
+HTTPS with the synthetic payloads from payloads.py.  The number of battery
+blocks, response latency and payload size can be set, and 429, 503 and 403
+responses injected at random, to exercise polling, caching and rate limit
+handling without a real gateway.
+
+Usage:
+    python benchmarks/fake_gateway.py [--port 8443] [--blocks 1] ...
+
+The add-on can then be pointed at it, for example:
+    POWERWALL3MQTT_CONFIG_TEDAPI_HOST=127.0.0.1:8443 \\
+    POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD=fake ... python app/powerwall3mqtt.py
+"""
+
+import argparse
+import base64
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common # pylint: disable=W0611
+import payloads
+
+from pytedapi import tedapi_pb2
+from utils import codec
+
+USERNAME = 'Tesla_Energy_Device'
+
+# Number of different sets of values served, so values change between polls
+# without building a payload on every request
+VARIANTS = 8
+
+
+def make_certificate(directory: str) -> tuple:
+    """
+    Create a self-signed certificate with openssl
+    Parameters:
+        directory (str): Where to write cert.pem and key.pem
+    Returns:
+        tuple: The certificate and key file names
+    """
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-nodes', '-days', '1',
+         '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+         '-subj', '/CN=fake-powerwall', '-keyout', key, '-out', cert],
+        check=True, capture_output=True)
+    return cert, key
+
+
+###
+### FakeGateway class
+###
+class FakeGateway():
+    """
+    A fake Powerwall 3 gateway running in a background thread
+
+    Parameters:
+        blocks (int): Number of battery blocks, default 1
+        password (str): Gateway password, default 'fake'
+        latency (float): Seconds added to every TEDAPI response, default 0
+        padding (int): Bytes of filler added to every JSON payload, default 0
+        extra_signals (int): Extra signals in each vitals payload, default 0
+        rate_limit (float): Fraction of TEDAPI requests answered 429, default 0
+        unavailable (float): Fraction answered 503, default 0
+        forbidden (float): Fraction answered 403, default 0
+        host (str): Address to listen on, default '127.0.0.1'
+        port (int): Port to listen on, default 0 for any free port
+        cert (str): Certificate file, default None to create one
+        key (str): Key file for cert, default None
+        seed (int): Seed for values and injected errors, default 0
+        site (int): Site number, giving each gateway its own DIN and VINs,
+                    default 0
+
+    Functions:
+       start() - Start serving in a background thread
+       stop() - Stop serving
+       get_stats() - Get request and injected error counters
+    """
+    # pylint: disable=R0902,R0913
+    def __init__(self, blocks: int = 1, password: str = 'fake', latency: float = 0,
+                 padding: int = 0, extra_signals: int = 0, rate_limit: float = 0,
+                 unavailable: float = 0, forbidden: float = 0,
+                 host: str = '127.0.0.1', port: int = 0,
+                 cert: str = None, key: str = None, seed: int = 0, site: int = 0) -> None:
+        self.blocks = blocks
+        self.latency = latency
+        self.padding = padding
+        self.extra_signals = extra_signals
+        self.faults = ((429, rate_limit), (503, unavailable), (403, forbidden))
+        self.site = site
+        self.din = payloads.gateway_din(site)
+        self.vins = payloads.battery_vins(blocks, site)
+        self._auth = 'Basic ' + base64.b64encode(
+            f"{USERNAME}:{password}".encode()).decode()
+        self._cert = cert
+        self._key = key
+        self._seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._count = 0
+        self._stats = {'requests': 0, 'din': 0, 'config': 0, 'firmware': 0,
+                       'status': 0, 'components': 0, 'vitals': 0,
+                       'unknown': 0, 'unauthorized': 0,
+                       429: 0, 503: 0, 403: 0}
+        self._tmpdir = None
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+
+
+    @property
+    def address(self) -> str:
+        """The host:port to use as tedapi_host"""
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def start(self):
+        """Start serving in a background thread, returning self"""
+        if self._cert is None:
+            self._tmpdir = tempfile.TemporaryDirectory() # pylint: disable=R1732
+            self._cert, self._key = make_certificate(self._tmpdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self._cert, self._key)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+
+    def get_stats(self) -> dict:
+        """Returns the number of requests by kind and of injected errors"""
+        with self._lock:
+            return dict(self._stats)
+
+
+    def count(self, kind) -> None:
+        """Count a request of a kind"""
+        with self._lock:
+            self._stats[kind] += 1
+
+
+    def fault(self):
+        """Returns the error status to inject for a request, or None"""
+        with self._lock:
+            self._stats['requests'] += 1
+            roll = self._rng.random()
+            for status, rate in self.faults:
+                if roll < rate:
+                    self._stats[status] += 1
+                    return status
+                roll -= rate
+        return None
+
+
+    def authorized(self, header: str) -> bool:
+        """Check the Authorization header"""
+        return header == self._auth
+
+
+    def response(self, kind: str, din: str) -> bytes:
+        """
+        Get the serialized response to a request, cycling through VARIANTS
+        sets of values
+        Parameters:
+            kind (str): 'config', 'firmware', 'status' or 'components'
+            din (str): DIN of the device queried
+        Returns:
+            bytes: Serialized protobuf message
+        """
+        with self._lock:
+            self._count += 1
+            variant = self._count % VARIANTS if kind in ('status', 'components') else 0
+        key = (kind, din, variant)
+        try:
+            return self._responses[key]
+        except KeyError:
+            pass
+
+        pb = tedapi_pb2.Message() # pylint: disable=E1101
+        pb.message.deliveryChannel = 1
+        pb.message.sender.din = din
+        pb.message.recipient.local = 1
+        match kind:
+            case 'config':
+                pb.message.config.recv.file.name = 'config.json'
+                pb.message.config.recv.file.text = self._json(
+                    payloads.config(self.blocks, self.site))
+            case 'firmware':
+                system = pb.message.firmware.system
+                firmware = payloads.firmware(self.din)
+                system.gateway.partNumber = firmware['gateway']['partNumber']
+                system.gateway.serialNumber = firmware['gateway']['serialNumber']
+                system.din = firmware['din']
+                system.version.text = firmware['version']['text']
+                system.version.githash = firmware['version']['githash']
+                system.six = firmware['six']
+                for device in firmware['wireless']['device']:
+                    entry = system.wireless.device.add()
+                    for field in ('company', 'model', 'fcc_id', 'ic'):
+                        getattr(entry, field).value = device[field]
+            case 'status':
+                pb.message.payload.recv.value = 1
+                pb.message.payload.recv.text = self._json(
+                    payloads.status(self.blocks, self._seed + variant))
+            case 'components':
+                pb.message.payload.recv.value = 1
+                pb.message.payload.recv.text = self._json(
+                    payloads.vitals(din, self._seed + variant, self.extra_signals))
+        pb.tail.value = 1
+        data = pb.SerializeToString()
+        self._responses[key] = data
+        return data
+
+
+    def _json(self, data: dict) -> str:
+        if self.padding:
+            data = data | {'padding': 'x' * self.padding}
+        return codec.dumps(data).decode('utf-8')
+
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler for FakeGateway"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        pass
+
+
+    def _send(self, status: int, body: bytes = b'',
+              content_type: str = 'application/octet-string') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 401:
+            self.send_header('WWW-Authenticate', 'Basic realm="TEDAPI"')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _check(self) -> bool:
+        """Apply authentication, latency and injected errors"""
+        gateway = self.server.gateway
+        if not gateway.authorized(self.headers.get('Authorization')):
+            gateway.count('unauthorized')
+            self._send(401)
+            return False
+        if gateway.latency:
+            time.sleep(gateway.latency)
+        status = gateway.fault()
+        if status is not None:
+            self._send(status)
+            return False
+        return True
+
+
+    def do_GET(self): # pylint: disable=C0103
+        """Handle GET /, which a Powerwall 3 answers 403, and /tedapi/din"""
+        gateway = self.server.gateway
+        if self.path == '/tedapi/din':
+            if self._check():
+                gateway.count('din')
+                self._send(200, gateway.din.encode(), 'text/plain')
+        elif self.path == '/':
+            self._send(403, b'', 'text/html')
+        else:
+            self._send(404)
+
+
+    def do_POST(self): # pylint: disable=C0103
+        """Handle POST /tedapi/v1 and /tedapi/device/{din}/v1"""
+        gateway = self.server.gateway
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        parts = self.path.strip('/').split('/')
+        if parts == ['tedapi', 'v1']:
+            device = gateway.din
+        elif len(parts) == 4 and parts[:2] == ['tedapi', 'device'] and parts[3] == 'v1':
+            device = parts[2]
+            if device not in gateway.vins:
+                self._send(404)
+                return
+        else:
+            self._send(404)
+            return
+        if not self._check():
+            return
+
+        pb = tedapi_pb2.Message() # pylint: disable=E1101
+        try:
+            pb.ParseFromString(body)
+        except Exception: # pylint: disable=W0718
+            gateway.count('unknown')
+            self._send(400)
+            return
+        message = pb.message
+        if message.recipient.din != device:
+            kind = None
+        elif message.HasField('config'):
+            kind = 'config'
+        elif message.firmware.WhichOneof('id') == 'request':
+            kind = 'firmware'
+        elif message.HasField('payload'):
+            text = message.payload.send.payload.text
+            if 'ComponentsQuery' in text:
+                kind = 'components'
+            elif 'DeviceControllerQuery' in text:
+                kind = 'status'
+            else:
+                kind = None
+        else:
+            kind = None
+
+        if kind is None:
+            gateway.count('unknown')
+            self._send(400)
+            return
+        gateway.count('vitals' if device != gateway.din else kind)
+        self._send(200, gateway.response(kind, device))
+
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--password', default='fake')
+    parser.add_argument('--blocks', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds added to each TEDAPI response")
+    parser.add_argument('--padding', type=int, default=0,
+                        help="bytes of filler added to each JSON payload")
+    parser.add_argument('--extra-signals', type=int, default=0,
+                        help="extra signals in each vitals payload")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="fraction of TEDAPI requests answered 429")
+    parser.add_argument('--unavailable', type=float, default=0,
+                        help="fraction of TEDAPI requests answered 503")
+    parser.add_argument('--forbidden', type=float, default=0,
+                        help="fraction of TEDAPI requests answered 403")
+    parser.add_argument('--cert')
+    parser.add_argument('--key')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    gateway = FakeGateway(
+        blocks=args.blocks, password=args.password, latency=args.latency,
+        padding=args.padding, extra_signals=args.extra_signals,
+        rate_limit=args.rate_limit, unavailable=args.unavailable,
+        forbidden=args.forbidden, host=args.host, port=args.port,
+        cert=args.cert, key=args.key, seed=args.seed)
+    with gateway:
+        print(f"Fake gateway {gateway.din} with {args.blocks} block(s) "
+              f"listening on https://{gateway.address}")
+        try:
+            while True:
+                time.sleep(60)
+                print(gateway.get_stats())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Synthetic TEDAPI payloads shaped like those returned by a Powerwall 3 system,
+with any number of battery blocks.  Values are plausible but made up.
+"""
+
+import random
+
+SIGNAL_TIMESTAMP = "2025-03-01T12:00:00.000-08:00"
+
+
+def gateway_din(site: int = 0) -> str:
+    """DIN of the gateway (leader Powerwall) of a site"""
+    return f"1707000-11-J--TG1{site:03d}0000000000"
+
+
+def battery_vins(blocks: int, site: int = 0) -> list:
+    """VINs of the battery blocks of a site, the first being the gateway"""
+    return [f"1707000-11-J--TG1{site:03d}{i:010d}" for i in range(blocks)]
+
+
+def _signal(name, value=None, text=None, boolean=None):
+    return {
+        'name': name,
+        'value': value,
+        'textValue': text,
+        'boolValue': boolean,
+        'timestamp': SIGNAL_TIMESTAMP
+    }
+
+
+def config(blocks: int = 1, site: int = 0, site_name: str = "My Home") -> dict:
+    """The config.json returned by get_config()"""
+    vins = battery_vins(blocks, site)
+    return {
+        'auto_meter_update': True,
+        'battery_blocks': [{
+            'vin': vin,
+            'type': 'Pw3',
+            'min_soe': 0,
+            'max_soe': 100,
+            'disabled_reasons': [],
+            'backup_ready': True,
+            'battery_type': 'ac_powerwall'
+        } for vin in vins],
+        'bridge_inverter': {},
+        'client_protocols': {'modbus': {'enabled': False}},
+        'credentials': [],
+        'customer': {'registered': True, 'emailed_registration': True},
+        'default_real_mode': 'self_consumption',
+        'dio': {'dio_enabled': False},
+        'enable_inverter_meter_readings': True,
+        'freq_shift_load_shed': {'f_shed_enable': False},
+        'freq_support_parameters': {},
+        'industrial_networks': {},
+        'installer': {'company': 'Installer Co', 'phone': '555-0100'},
+        'island_config': {'island_mode': 'manual'},
+        'island_contactor_controller': {},
+        'logging': {},
+        'meters': [{
+            'location': location,
+            'type': 'neurio_w2_tcp',
+            'cts': [True, True, False, False],
+            'inverted': [False, False, False, False],
+            'connection': {'short_id': f"{i:06d}", 'device_serial': f"VAH{i:010d}"}
+        } for i, location in enumerate(('site', 'solar'))],
+        'site_info': {
+            'site_name': site_name,
+            'battery_commission_date': '2024-06-01T10:00:00-07:00',
+            'backup_reserve_percent': 21,
+            'nominal_system_energy_ac': 13.5 * blocks,
+            'nominal_system_power_ac': 11.5 * blocks,
+            'grid_code': {'grid_code': '60Hz_240V_s_UL1741SA:2019_California',
+                          'grid_voltage_setting': 240, 'grid_freq_setting': 60,
+                          'grid_phase_setting': 'Split', 'country': 'United States',
+                          'state': 'California', 'utility': 'Pacific Gas & Electric'},
+            'timezone': 'America/Los_Angeles',
+            'max_site_meter_power_ac': 1000000000,
+            'min_site_meter_power_ac': -1000000000
+        },
+        'solar': {'brand': 'Tesla', 'model': 'Powerwall 3', 'power_rating_watts': 11500},
+        'solars': [],
+        'strategy': {'backup_reserve_percent': 21, 'real_mode': 'self_consumption'},
+        'test_timers': {},
+        'vin': vins[0]
+    }
+
+
+def status(blocks: int = 1, seed: int = 0) -> dict:
+    """The result of the DeviceControllerQuery returned by get_status()"""
+    rng = random.Random(seed)
+    full_pack = int(14250 * blocks)
+    remaining = int(full_pack * rng.uniform(0.2, 1.0))
+    solar = round(rng.uniform(0, 9000), 2)
+    load = round(rng.uniform(300, 5000), 2)
+    battery = round(rng.uniform(-5000, 5000), 2)
+    return {
+        'control': {
+            'alerts': {'active': ['SystemConnectedToGrid', 'FWUpdateSucceeded',
+                                  'PodCommissionTime']},
+            'batteryBlocks': [{
+                'din': vin,
+                'disableReasons': None
+            } for vin in battery_vins(blocks)],
+            'islanding': {
+                'customerIslandMode': 'BackupMode',
+                'contactorClosed': True,
+                'microGridOK': True,
+                'gridOK': True
+            },
+            'meterAggregates': [{
+                'location': location,
+                'realPowerW': power
+            } for location, power in (('LOAD', load), ('SITE', load - solar - battery),
+                                      ('SOLAR', solar), ('BATTERY', battery))],
+            'pvInverters': [],
+            'siteShutdown': {'isShutDown': False, 'reasons': []},
+            'systemStatus': {
+                'nominalFullPackEnergyWh': full_pack,
+                'nominalEnergyRemainingWh': remaining
+            }
+        },
+        'esCan': {
+            'bus': {
+                'ISLANDER': {
+                    'ISLAND_AcMeasurements': {
+                        'ISLAND_FreqL1_Load': 60.0, 'ISLAND_FreqL1_Main': 60.0,
+                        'ISLAND_FreqL2_Load': 60.0, 'ISLAND_FreqL2_Main': 60.0,
+                        'ISLAND_VL1N_Load': 121.2, 'ISLAND_VL1N_Main': 121.3,
+                        'ISLAND_VL2N_Load': 120.8, 'ISLAND_VL2N_Main': 120.9,
+                        'isComplete': True, 'isMIA': False, 'lastRxTime': SIGNAL_TIMESTAMP
+                    },
+                    'ISLAND_GridConnection': {
+                        'ISLAND_GridConnected': 'ISLAND_GridConnected_Connected',
+                        'isComplete': True
+                    }
+                },
+                'MSA': {
+                    'METER_Z_AcMeasurements': {
+                        'METER_Z_CTA_I': 0.0, 'METER_Z_CTA_InstRealPower': 0.0,
+                        'METER_Z_CTB_I': 0.0, 'METER_Z_CTB_InstRealPower': 0.0,
+                        'METER_Z_VL1G': 121.3, 'METER_Z_VL2G': 120.9,
+                        'isMIA': True, 'lastRxTime': SIGNAL_TIMESTAMP
+                    },
+                    'MSA_InfoMsg': {'MSA_appGitHash': None, 'MSA_assemblyId': None}
+                },
+                'PINV': [{
+                    'PINV_AcMeasurements': {
+                        'PINV_VSplit1': 121.0, 'PINV_VSplit2': 120.7,
+                        'isMIA': False, 'lastRxTime': SIGNAL_TIMESTAMP
+                    },
+                    'PINV_PowerCapability': {
+                        'PINV_Pnom': 11.5, 'isComplete': True, 'isMIA': False
+                    },
+                    'PINV_Status': {
+                        'PINV_Fout': 60.0, 'PINV_GridState': 'Grid_Compliant',
+                        'PINV_HardwareEnableLine': True,
+                        'PINV_PowerLimiter': 'PWRLIM_POD_Power_Limit',
+                        'PINV_Pout': round(battery / blocks / 1000, 3),
+                        'PINV_State': 'PINV_GridFollowing',
+                        'PINV_Vout': 241.8, 'isMIA': False
+                    },
+                    'alerts': {'active': [], 'isComplete': True, 'isMIA': False}
+                } for _ in range(blocks)],
+                'POD': [{
+                    'POD_EnergyStatus': {
+                        'POD_nom_energy_remaining': remaining / blocks / 1000,
+                        'POD_nom_full_pack_energy': full_pack / blocks / 1000,
+                        'isMIA': False
+                    },
+                    'POD_InfoMsg': {'POD_appGitHash': None}
+                } for _ in range(blocks)],
+                'PVAC': [{
+                    'PVAC_InfoMsg': {'PVAC_appGitHash': None},
+                    'PVAC_Logging': {
+                        f'PVAC_PVCurrent_{s}': 0.0 for s in 'ABCD'
+                    } | {
+                        f'PVAC_PVMeasuredVoltage_{s}': 0.0 for s in 'ABCD'
+                    } | {'isMIA': True},
+                    'PVAC_Status': {'PVAC_Fout': 0.0, 'PVAC_Pout': 0.0, 'PVAC_State': None,
+                                    'PVAC_Vout': 0.0, 'isMIA': True},
+                    'alerts': {'active': [], 'isComplete': False, 'isMIA': True}
+                } for _ in range(blocks)],
+                'PVS': [{
+                    'PVS_Status': {
+                        f'PVS_String{s}_Connected': False for s in 'ABCD'
+                    } | {'PVS_State': None, 'PVS_vLL': 0.0, 'isMIA': True},
+                    'alerts': {'active': [], 'isComplete': False, 'isMIA': True}
+                } for _ in range(blocks)],
+                'SYNC': {
+                    'METER_X_AcMeasurements': {
+                        'METER_X_CTA_I': 0.0, 'METER_X_CTA_InstRealPower': 0.0,
+                        'METER_X_VL1N': 121.3, 'isMIA': True
+                    },
+                    'SYNC_InfoMsg': {'SYNC_appGitHash': None},
+                    'alerts': {'active': []}
+                },
+                'THC': [{
+                    'THC_InfoMsg': {'THC_appGitHash': None},
+                    'THC_Logging': {},
+                    'alerts': {'active': [], 'isComplete': False, 'isMIA': True}
+                } for _ in range(blocks)]
+            },
+            'enumeration': None,
+            'firmwareUpdate': {
+                'isUpdating': False, 'msa': None, 'powerwalls': None,
+                'pvInverters': None, 'sync': None
+            },
+            'inverterSelfTests': None,
+            'phaseDetection': None
+        },
+        'neurio': {
+            'isDetectingWiredMeters': False,
+            'pairings': [],
+            'readings': [{
+                'firmwareVersion': 'tesla-0.0.7',
+                'serial': f'VAH{i:010d}',
+                'dataRead': [{
+                    'voltageV': 121.0, 'realPowerW': rng.uniform(-1000, 1000),
+                    'reactivePowerVAR': 0.0, 'currentA': rng.uniform(0, 20)
+                } for _ in range(4)],
+                'timestamp': SIGNAL_TIMESTAMP
+            } for i in range(2)]
+        },
+        'pw3Can': {'firmwareUpdate': {'isUpdating': False, 'progress': None}},
+        'system': {
+            'sitemanagerStatus': {'isRunning': True},
+            'time': SIGNAL_TIMESTAMP,
+            'updateUrgencyCheck': None
+        }
+    }
+
+
+def vitals(din: str, seed: int = 0, extra_signals: int = 0) -> dict:
+    """The result of the ComponentsQuery returned by get_pw_vitals(din)"""
+    rng = random.Random(f"{din}{seed}")
+    pch = []
+    for s in 'ABCDEF':
+        active = s in 'ABCD'
+        voltage = rng.uniform(300, 450) if active else rng.uniform(-1, 1)
+        current = rng.uniform(0, 10) if active else 0.0
+        pch.append(_signal(f'PCH_PvState_{s}', text='PV_Active' if active else 'PV_Disabled'))
+        pch.append(_signal(f'PCH_PvVoltage{s}', value=voltage))
+        pch.append(_signal(f'PCH_PvCurrent{s}', value=current))
+    for name in ('PCH_AcFrequency', 'PCH_AcMode', 'PCH_AcRealPowerAB', 'PCH_AcVoltageAB',
+                 'PCH_AcVoltageAN', 'PCH_AcVoltageBN', 'PCH_BatteryPower',
+                 'PCH_DcdcState_A', 'PCH_DcdcState_B', 'PCH_SlowPvPowerSum',
+                 'PCH_State', 'PCH_packagePartNumber_1_7', 'PCH_packageSerialNumber_1_7'):
+        pch.append(_signal(name, value=rng.uniform(0, 500)))
+    for i in range(extra_signals):
+        pch.append(_signal(f'PCH_Extra{i}', value=rng.uniform(0, 100)))
+    rng.shuffle(pch)
+
+    return {
+        'components': {
+            'bms': [{
+                'signals': [
+                    _signal('BMS_nominalEnergyRemaining', value=rng.uniform(2, 13.5)),
+                    _signal('BMS_nominalFullPackEnergy', value=14.25),
+                    _signal('BMS_isCharging', boolean=False),
+                    _signal('BMS_state', text='BMS_DRIVE')
+                ],
+                'activeAlerts': []
+            }],
+            'hvp': [{
+                'partNumber': '1600288-02-D',
+                'serialNumber': din.split('--')[1],
+                'signals': [_signal('HVP_State', text='HVP_STATE_ON')],
+                'activeAlerts': []
+            }],
+            'pch': [{
+                'signals': pch,
+                'activeAlerts': []
+            }],
+            'pws': [{
+                'signals': [_signal(name, text='PassedTest') for name in (
+                    'PWS_SelfTest', 'PWS_PeImpTestState', 'PWS_PvIsoTestState',
+                    'PWS_RelaySelfTest_State', 'PWS_MciTestState')],
+                'activeAlerts': []
+            }],
+            'baggr': [{
+                'signals': [
+                    _signal('BAGGR_State', text='BAGGR_STATE_ACTIVE'),
+                    _signal('BAGGR_OperationRequest', text='BAGGR_OPERATION_REQUEST_NONE'),
+                    _signal('BAGGR_NumBatteriesConnected', value=1),
+                    _signal('BAGGR_NumBatteriesPresent', value=1),
+                    _signal('BAGGR_NumBatteriesExpected', value=1)
+                ],
+                'activeAlerts': []
+            }]
+        }
+    }
+
+
+def firmware(din: str, version: str = "25.2.1 a6d2dc1e") -> dict:
+    """The dictionary returned by get_firmware_version(details=True)"""
+    return {
+        'gateway': {'partNumber': din.split('--')[0], 'serialNumber': din.split('--')[1]},
+        'din': din,
+        'version': {'text': version, 'githash': b'\xa6\xd2\xdc\x1e'},
+        'five': None,
+        'six': 4,
+        'wireless': {'device': [
+            {'company': 'Quectel', 'model': 'BG95-M2',
+             'fcc_id': 'XMR2020BG95M2', 'ic': '10224A-2020BG95M2'},
+            {'company': 'Texas Instruments', 'model': 'WL18MODGI',
+             'fcc_id': 'Z64-WL18DBMOD', 'ic': '451I-WL18DBMOD'}
+        ]}
+    }
+
+
+class StaticAPI():
+    """
+    Stands in for Powerwall3API, returning the payloads above for a site,
+    so hamqtt.devices can be driven without a gateway
+    """
+    def __init__(self, blocks: int = 1, site: int = 0, seed: int = 0,
+                 extra_signals: int = 0) -> None:
+        self._firmware = firmware(gateway_din(site))
+        self._config = config(blocks, site)
+        self._status = status(blocks, seed)
+        self._vitals = {vin: vitals(vin, seed, extra_signals)
+                        for vin in battery_vins(blocks, site)}
+
+    def get_firmware_version(self, details=False):
+        """See Powerwall3API.get_firmware_version()"""
+        return self._firmware if details else self._firmware['version']['text']
+
+    def get_config(self, force=False): # pylint: disable=W0613
+        """See Powerwall3API.get_config()"""
+        return self._config
+
+    def get_status(self, force=False): # pylint: disable=W0613
+        """See Powerwall3API.get_status()"""
+        return self._status
+
+    def get_pw_vitals(self, din, force=False): # pylint: disable=W0613
+        """See Powerwall3API.get_pw_vitals()"""
+        return self._vitals[din]
+
+    def get_fetch_stats(self) -> dict:
+        """See Powerwall3API.get_fetch_stats()"""
+        return {}
+
+    def get_stale_age(self, key: str) -> float: # pylint: disable=W0613
+        """See Powerwall3API.get_stale_age()"""
+        return None
+
+    def get_metadata(self) -> dict:
+        """See Powerwall3API.get_metadata(), nothing is fetched to be saved"""
+        return {}
@@ -0,0 +1,11 @@
+"""Puts the add-on and the benchmark helpers on the path, as the add-on runs from app/"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in ('app', 'benchmarks'):
+    path = os.path.join(ROOT_DIR, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,50 @@
+"""Tests that utils.codec gives the same bytes with and without orjson"""
+
+import json
+
+import pytest
+
+from utils import codec
+
+DOCUMENTS = [
+    {'nan': float('nan'), 'inf': float('inf'), '-inf': float('-inf')},
+    [float('nan'), [float('inf')], ({'x': float('-inf')},)],
+    {'small': 0.00001, 'tiny': 1.5e-7, 'big': 1e16, 'huge': 1.2345678901234568e+17},
+    {'float': 0.1, 'neg': -2.5, 'int': 10 ** 18, 'bigint': 10 ** 30, 'zero': -0.0},
+    {'name': 'Café Powerwall ⚡', 'cjk': '電池', 'emoji': '🔋', 'ctrl': '\x00\x1f"\\/\x7f'},
+    {'ok': True, 'none': None, 'nested': {'list': [1, 'two', 3.0]}},
+    {1: 'int key'},
+]
+
+
+@pytest.fixture
+def json_only(monkeypatch):
+    """Encode with json as if orjson were not installed"""
+    monkeypatch.setattr(codec, 'orjson', None)
+
+
+@pytest.mark.parametrize('obj', DOCUMENTS)
+def test_backends_match(obj, monkeypatch):
+    if codec.orjson is None:
+        pytest.skip("orjson is not installed")
+    data = codec.dumps(obj)
+    monkeypatch.setattr(codec, 'orjson', None)
+    assert codec.dumps(obj) == data
+
+
+@pytest.mark.usefixtures('json_only')
+@pytest.mark.parametrize('obj', DOCUMENTS)
+def test_json_matches_stdlib(obj):
+    expected = json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    expected = expected.replace('-Infinity', 'null').replace('Infinity', 'null')
+    assert codec.dumps(obj) == expected.replace('NaN', 'null').encode('utf-8')
+
+
+@pytest.mark.usefixtures('json_only')
+def test_non_finite_is_null():
+    assert codec.dumps([float('nan'), float('inf'), -float('inf'), 1.0]) == b'[null,null,null,1.0]'
+
+
+def test_round_trip():
+    obj = {'name': 'Café', 'value': 1e-05, 'list': [1, 2.5, None]}
+    assert codec.loads(codec.dumps(obj)) == obj
@@ -0,0 +1,51 @@
+"""Tests of the add-on configuration checks"""
+
+import importlib
+import logging
+import os
+
+import pytest
+
+from common import APP_DIR
+
+
+@pytest.fixture
+def powerwall3mqtt(monkeypatch):
+    """The add-on module, which loads logger.yaml from the working directory"""
+    monkeypatch.chdir(APP_DIR)
+    module = importlib.import_module('powerwall3mqtt')
+    # The add-on's loggers don't propagate to caplog's root handler
+    monkeypatch.setattr(module.logger, 'propagate', True)
+    for key in list(os.environ):
+        if key.startswith('POWERWALL3MQTT_CONFIG_'):
+            monkeypatch.delenv(key)
+    monkeypatch.setenv('POWERWALL3MQTT_CONFIG_TEDAPI_PASSWORD', 'fake')
+    monkeypatch.setenv('POWERWALL3MQTT_CONFIG_MQTT_HOST', '127.0.0.1')
+    monkeypatch.setenv('POWERWALL3MQTT_CONFIG_MQTT_PORT', '1883')
+    return module
+
+
+def loadconfig(module) -> dict:
+    """Loads the config without the logging setup of Powerwall3MQTT()"""
+    return module.Powerwall3MQTT.__new__(module.Powerwall3MQTT).loadconfig()
+
+
+def test_interval_defaults(powerwall3mqtt):
+    config = loadconfig(powerwall3mqtt)
+    assert config['tedapi_vitals_interval'] == 60
+    assert config['tedapi_config_interval'] == 300
+
+
+def test_intervals_raised_to_poll_interval(powerwall3mqtt, monkeypatch, caplog):
+    monkeypatch.setenv('POWERWALL3MQTT_CONFIG_TEDAPI_POLL_INTERVAL', '90')
+    with caplog.at_level(logging.WARNING):
+        config = loadconfig(powerwall3mqtt)
+    assert config['tedapi_vitals_interval'] == 90
+    assert config['tedapi_config_interval'] == 300
+    assert 'tedapi_vitals_interval' in caplog.text
+
+
+def test_poll_interval_minimum(powerwall3mqtt, monkeypatch):
+    monkeypatch.setenv('POWERWALL3MQTT_CONFIG_TEDAPI_POLL_INTERVAL', '1')
+    with pytest.raises(powerwall3mqtt.FatalError):
+        loadconfig(powerwall3mqtt)
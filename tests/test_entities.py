@@ -0,0 +1,60 @@
+"""Tests of the change detection used to skip publishing unchanged states"""
+
+import pytest
+
+from hamqtt import entities
+
+
+@pytest.fixture
+def power(monkeypatch):
+    """A power entity with a 10W deadband, published at 100W"""
+    monkeypatch.setattr(entities.PowerValue, 'deadband', 10.0)
+    entity = entities.PowerValue('test', 'Power')
+    entity.set(100.0)
+    entity.set_published()
+    return entity
+
+
+def test_unpublished_is_changed():
+    entity = entities.PowerValue('test', 'Power')
+    entity.set(0)
+    assert entity.changed()
+
+
+@pytest.mark.parametrize('value', [100.0, 95.0, 110.0, 90.0])
+def test_within_deadband_is_unchanged(power, value):
+    power.set(value)
+    assert not power.changed()
+
+
+@pytest.mark.parametrize('value', [110.5, 89.5, None, 'unknown'])
+def test_beyond_deadband_is_changed(power, value):
+    power.set(value)
+    assert power.changed()
+
+
+def test_drift_is_measured_from_published(power):
+    for value in (105.0, 109.0, 111.0):
+        power.set(value)
+    assert power.changed()
+    power.set_published()
+    power.set(105.0)
+    assert not power.changed()
+
+
+def test_no_deadband_on_other_entities():
+    entity = entities.Battery('test', 'Level')
+    entity.set(50.0)
+    entity.set_published()
+    entity.set(50.01)
+    assert entity.changed()
+
+
+def test_binary_sensor_values():
+    entity = entities.Connectivity('test', 'Connected')
+    entity.set(True)
+    entity.set_published()
+    entity.set(True)
+    assert not entity.changed()
+    entity.set(False)
+    assert entity.changed()
@@ -0,0 +1,66 @@
+"""Tests of the adaptive rate governor, on a simulated clock"""
+
+import types
+
+import pytest
+
+from pytedapi import exceptions, governor
+
+PATH = 'tedapi/v1'
+
+
+class Clock():
+    """A monotonic clock that only moves when told to"""
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """See time.monotonic()"""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """See time.sleep()"""
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Runs the governor on a simulated clock"""
+    fake = Clock()
+    monkeypatch.setattr(governor, 'time',
+                        types.SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    return fake
+
+
+def test_limited_halves_the_rate(clock): # pylint: disable=W0613,W0621
+    gov = governor.RateGovernor()
+    gov.limited(PATH)
+    gov.limited(PATH)
+    assert gov.get_rates()['v1'] == pytest.approx(0.5)
+    assert gov.get_stats()['v1']['decreases'] == 1
+
+
+def test_waits_raise_the_rate(clock): # pylint: disable=W0621
+    gov = governor.RateGovernor(rates={'v1': 0.1})
+    for _ in range(20):
+        gov.success(PATH, gov.acquire(PATH, timeout=60))
+    assert clock.now > 1000.0
+    assert gov.get_rates()['v1'] > 0.1
+
+
+def test_recovers_from_min_rate_while_rejecting(clock): # pylint: disable=W0621
+    gov = governor.RateGovernor(rates={'v1': 0})
+    assert gov.get_rates()['v1'] == pytest.approx(1 / 60)
+    sent = []
+    # Poll every 5s for an hour, with requests refused rather than waiting
+    for _ in range(720):
+        try:
+            gov.success(PATH, gov.acquire(PATH, timeout=1))
+            sent.append(True)
+        except exceptions.TEDAPIRateLimitedException:
+            sent.append(False)
+        clock.sleep(5)
+    assert not all(sent[:60])
+    # The rate has caught up with the polls
+    assert all(sent[-120:])
+    assert gov.get_rates()['v1'] >= 0.2
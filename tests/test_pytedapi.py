@@ -0,0 +1,57 @@
+"""Tests of Powerwall3API caching against the fake gateway"""
+
+import time
+
+import pytest
+
+from fake_gateway import FakeGateway
+
+import pytedapi
+from pytedapi import exceptions
+
+
+@pytest.fixture(scope='module')
+def gateway():
+    """A fake gateway with one battery block"""
+    with FakeGateway(blocks=1) as gw:
+        yield gw
+
+
+@pytest.fixture
+def tesla(gateway):
+    """A client of the fake gateway, with no injected errors left over"""
+    gateway.faults = ()
+    yield pytedapi.TeslaEnergyDeviceAPI('fake', host=gateway.address)
+    gateway.faults = ()
+
+
+def test_cached_until_expired(tesla):
+    api = pytedapi.Powerwall3API(tesla, cacheexpire=0.2)
+    status = api.get_status()
+    assert api.get_status() is status
+    time.sleep(0.3)
+    assert api.get_status() is not status
+
+
+def test_stale_if_error(gateway, tesla):
+    api = pytedapi.Powerwall3API(tesla, cacheexpire=0.1, stale_if_error=True)
+    status = api.get_status()
+    assert api.get_stale_age('get_status') is None
+    time.sleep(0.2)
+    gateway.faults = ((500, 1.0),)
+    gateway._stats.setdefault(500, 0) # pylint: disable=W0212
+    assert api.get_status() is status
+    assert api.get_stale_age('get_status') >= 0.2
+    gateway.faults = ()
+    assert api.get_status() is not status
+    assert api.get_stale_age('get_status') is None
+
+
+def test_errors_raise_without_stale_if_error(gateway, tesla):
+    api = pytedapi.Powerwall3API(tesla, cacheexpire=0.1)
+    api.get_status()
+    time.sleep(0.2)
+    gateway.faults = ((500, 1.0),)
+    gateway._stats.setdefault(500, 0) # pylint: disable=W0212
+    with pytest.raises(exceptions.TEDAPIException):
+        api.get_status()